@@ -28,11 +28,12 @@
 # Import(s)                                                                    #
 ################################################################################
 
-from .idbankcommon import IdbCommon, IdbConfig
-from .idbankstorage import IdbankStorageFormat, IdbankStorageType, IdbankStorageTags, IdbankStorageEngine, \
-    IdbankStorageBase, AwsDynamoDb
-from .idbankquery import IdbQueryResponse, IdbQueryBusiness, IdbQueryPeople, IdbQueryRelation, IdbQuery, \
-    IdbSqlQueryBuilder, IdbQueryError
+from .idbankcommon import IdbCache, IdbCommon, IdbConfig
+from .idbankstorage import IdbankStorageFormat, IdbankStorageType, IdbankStorageTags, \
+    IdbankStorageCompression, IdbankStorageEngine, IdbankStorageBase, IdbankStorageItems, IdbankStorageResult, \
+    IdbankStorageMetrics, IdbankStorageRetry, IdbankStorageRateLimiter, AwsDynamoDb, MemoryDb, IdbankStorage
+from .idbankquery import IdbQueryResponse, IdbQueryResponseStream, IdbQueryBusiness, IdbQueryPeople, \
+    IdbQueryRelation, IdbQuery, IdbSqlQueryBuilder, IdbQueryError, IdbQuerySqlPool
 from .idbankhelper import ProcessQuery, IdbServer
 
 
@@ -44,12 +45,16 @@ def idbQuery(jscConfigFilePath, connectionName, query=None):
     return ProcessQuery.execute(jscConfigFilePath, connectionName, query)
 
 
-__all__ = ('IdbCommon', 'IdbConfig',
-           'IdbQueryResponse', 'IdbQueryBusiness', 'IdbQueryPeople', 'IdbQueryRelation', 'IdbQuery',
+__all__ = ('IdbCache', 'IdbCommon', 'IdbConfig',
+           'IdbQueryResponse', 'IdbQueryResponseStream', 'IdbQueryBusiness', 'IdbQueryPeople', 'IdbQueryRelation',
+           'IdbQuery',
            'IdbSqlQueryBuilder',
-           'IdbQueryError',
-           'IdbankStorageFormat', 'IdbankStorageType', 'IdbankStorageTags', 'IdbankStorageEngine', 'IdbankStorageBase',
-           'AwsDynamoDb',
+           'IdbQueryError', 'IdbQuerySqlPool',
+           'IdbankStorageFormat', 'IdbankStorageType', 'IdbankStorageTags', 'IdbankStorageCompression',
+           'IdbankStorageEngine', 'IdbankStorageBase', 'IdbankStorageItems',
+           'IdbankStorageResult', 'IdbankStorageMetrics',
+           'IdbankStorageRetry', 'IdbankStorageRateLimiter',
+           'AwsDynamoDb', 'MemoryDb', 'IdbankStorage',
            'ProcessQuery', 'IdbServer')
 
 ################################################################################
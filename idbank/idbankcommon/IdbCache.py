@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# * ********************************************************************* *
+# *                                                                       *
+# *   Identity Bank data driver                                           *
+# *   This file is part of idbank. This project may be found at:          *
+# *   https://github.com/IdentityBank/Python_idbank.                      *
+# *                                                                       *
+# *   Copyright (C) 2020 by Identity Bank. All Rights Reserved.           *
+# *   https://www.identitybank.eu - You belong to you                     *
+# *                                                                       *
+# *   This program is free software: you can redistribute it and/or       *
+# *   modify it under the terms of the GNU Affero General Public          *
+# *   License as published by the Free Software Foundation, either        *
+# *   version 3 of the License, or (at your option) any later version.    *
+# *                                                                       *
+# *   This program is distributed in the hope that it will be useful,     *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of      *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the        *
+# *   GNU Affero General Public License for more details.                 *
+# *                                                                       *
+# *   You should have received a copy of the GNU Affero General Public    *
+# *   License along with this program. If not, see                        *
+# *   https://www.gnu.org/licenses/.                                      *
+# *                                                                       *
+# * ********************************************************************* *
+
+################################################################################
+# Import(s)                                                                    #
+################################################################################
+
+import collections
+import threading
+import time
+
+
+################################################################################
+# Module                                                                       #
+################################################################################
+
+class IdbCache:
+    # Thread safe LRU cache with optional entry TTL (seconds) and hit and miss counters
+
+    def __init__(self, maxSize: int = 1024, ttl: float = None):
+        self.maxSize = maxSize
+        self.ttl = ttl if ttl and ttl > 0 else None
+        self.__items = collections.OrderedDict()
+        self.__lock = threading.Lock()
+        self.__hits = 0
+        self.__misses = 0
+        self.__expired = 0
+
+    def get(self, key, default=None):
+        with self.__lock:
+            if key in self.__items:
+                value, expiresAt = self.__items[key]
+                if expiresAt is None or time.monotonic() < expiresAt:
+                    self.__items.move_to_end(key)
+                    self.__hits += 1
+                    return value
+                del self.__items[key]
+                self.__expired += 1
+            self.__misses += 1
+            return default
+
+    def put(self, key, value):
+        if self.maxSize <= 0:
+            return
+        expiresAt = time.monotonic() + self.ttl if self.ttl else None
+        with self.__lock:
+            self.__items[key] = (value, expiresAt)
+            self.__items.move_to_end(key)
+            while len(self.__items) > self.maxSize:
+                self.__items.popitem(last=False)
+
+    def remove(self, key):
+        with self.__lock:
+            self.__items.pop(key, None)
+
+    def clear(self):
+        with self.__lock:
+            self.__items.clear()
+            self.__hits = 0
+            self.__misses = 0
+            self.__expired = 0
+
+    def stats(self) -> dict:
+        with self.__lock:
+            return {
+                'size': len(self.__items),
+                'maxSize': self.maxSize,
+                'ttl': self.ttl,
+                'hits': self.__hits,
+                'misses': self.__misses,
+                'expired': self.__expired,
+            }
+
+    def __len__(self):
+        with self.__lock:
+            return len(self.__items)
+
+
+################################################################################
+#                                End of file                                   #
+################################################################################
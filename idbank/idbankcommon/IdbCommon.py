@@ -35,7 +35,7 @@ import hashlib
 import string
 import codecs
 import unicodedata
-import collections
+import collections.abc
 
 
 ################################################################################
@@ -134,7 +134,7 @@ class IdbCommon:
     def dictionaryMerge(dictionary, mergeDictionary):
         for k, v in mergeDictionary.items():
             if (k in dictionary and isinstance(dictionary[k], dict)
-                    and isinstance(mergeDictionary[k], collections.Mapping)):
+                    and isinstance(mergeDictionary[k], collections.abc.Mapping)):
                 IdbCommon.dictionaryMerge(dictionary[k], mergeDictionary[k])
             else:
                 dictionary[k] = mergeDictionary[k]
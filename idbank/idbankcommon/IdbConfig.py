@@ -28,6 +28,11 @@
 # Import(s)                                                                    #
 ################################################################################
 
+import logging
+import os
+import threading
+import time
+
 import jsonsimpleconfig
 
 
@@ -36,6 +41,73 @@ import jsonsimpleconfig
 ################################################################################
 
 class IdbConfig:
+    __configCache = {}
+    __configCacheLock = threading.Lock()
+    __configCacheGeneration = 0
+
+    # Seconds between file checks of cached configurations, 0 - reload on SIGHUP only
+    configCacheCheckInterval = 5
+
+    @staticmethod
+    def getCachedConfig(jscConfigFilePath: str, connectionName: str) -> dict:
+        cacheKey = (jscConfigFilePath, connectionName)
+        cacheEntry = IdbConfig.__configCache.get(cacheKey)
+        if cacheEntry is not None and cacheEntry['generation'] == IdbConfig.__configCacheGeneration and \
+                (IdbConfig.configCacheCheckInterval <= 0 or
+                 time.monotonic() - cacheEntry['checkedAt'] < IdbConfig.configCacheCheckInterval):
+            return cacheEntry['configuration']
+        return IdbConfig.__reloadCachedConfig(cacheKey, cacheEntry)
+
+    @staticmethod
+    def reloadConfig():
+        IdbConfig.__configCacheGeneration += 1
+
+    @staticmethod
+    def clearConfigCache():
+        with IdbConfig.__configCacheLock:
+            IdbConfig.__configCache = {}
+
+    @staticmethod
+    def __configFileSignature(jscConfigFilePath: str):
+        try:
+            fileStat = os.stat(jscConfigFilePath)
+            return fileStat.st_ino, fileStat.st_dev, fileStat.st_mtime_ns, fileStat.st_size
+        except OSError:
+            return None
+
+    @staticmethod
+    def __reloadCachedConfig(cacheKey: tuple, cacheEntry: dict) -> dict:
+        generation = IdbConfig.__configCacheGeneration
+        signature = IdbConfig.__configFileSignature(cacheKey[0])
+        if cacheEntry is not None and cacheEntry['generation'] == generation and \
+                signature is not None and cacheEntry['signature'] == signature:
+            configuration = cacheEntry['configuration']
+        else:
+            try:
+                configuration = IdbConfig.getConfig(*cacheKey)
+            except Exception as error:
+                if cacheEntry is None:
+                    raise
+                logging.error('Configuration reload error, using previous configuration')
+                logging.error(str(error))
+                configuration = None
+            if not configuration:
+                if cacheEntry is None:
+                    return configuration
+                configuration = cacheEntry['configuration']
+            else:
+                logging.info('Configuration loaded: {} [{}]'.format(*cacheKey))
+
+        with IdbConfig.__configCacheLock:
+            configCache = dict(IdbConfig.__configCache)
+            configCache[cacheKey] = {
+                'configuration': configuration,
+                'signature': signature,
+                'generation': generation,
+                'checkedAt': time.monotonic(),
+            }
+            IdbConfig.__configCache = configCache
+        return configuration
 
     @staticmethod
     def getConfig(jscConfigFilePath: str, connectionName: str) -> dict:
@@ -51,6 +123,7 @@ class IdbConfig:
                     idbConfiguration = IdbConfig.getIdentityBankV1Config(section, configuration)
                     if idbConfiguration:
                         idbConfiguration['connectionType'] = connectionType
+                        idbConfiguration['connectionName'] = connectionName
                         server = IdbConfig.getServerConfig(section, configuration)
                         if server:
                             idbConfiguration['server'] = server
@@ -99,11 +172,13 @@ class IdbConfig:
         sectionConnectionBusiness = '{}."configuration"."connection"."business"'.format(section)
         sectionConnectionPeople = '{}."configuration"."connection"."people"'.format(section)
         sectionConnectionRelation = '{}."configuration"."connection"."relation"'.format(section)
+        sectionConnectionPool = '{}."configuration"."connection"."pool"'.format(section)
         configuration = {
             'connectionBusinessData': configuration.getSection(sectionConnectionBusinessData),
             'connectionBusiness': configuration.getSection(sectionConnectionBusiness),
             'connectionPeople': configuration.getSection(sectionConnectionPeople),
             'connectionRelation': configuration.getSection(sectionConnectionRelation),
+            'connectionPool': configuration.getSection(sectionConnectionPool),
         }
         return configuration
 
@@ -28,6 +28,7 @@
 # Import(s)                                                                    #
 ################################################################################
 
+from .IdbCache import IdbCache
 from .IdbCommon import IdbCommon
 from .IdbConfig import IdbConfig
 
@@ -35,7 +36,7 @@ from .IdbConfig import IdbConfig
 # Module                                                                       #
 ################################################################################
 
-all__ = ('IdbCommon', 'IdbConfig')
+all__ = ('IdbCache', 'IdbCommon', 'IdbConfig')
 
 ################################################################################
 #                                End of file                                   #
@@ -32,7 +32,7 @@ import logging
 
 from .ProcessQuery import ProcessQuery
 from secureclientserverservice import ScssServerInet, ScssSecurityHelper, ScssSecurityFirewall, ScssProtocol
-from idbank import IdbConfig
+from idbank import IdbConfig, IdbQueryResponseStream
 
 
 ################################################################################
@@ -46,7 +46,7 @@ class IdbServer(ScssServerInet):
     def __init__(self, jscConfigFilePath: str, connectionName: str):
         self.jscConfigFilePath = jscConfigFilePath
         self.connectionName = connectionName
-        configuration = IdbConfig.getConfig(jscConfigFilePath, connectionName)
+        configuration = IdbConfig.getCachedConfig(jscConfigFilePath, connectionName)
         host = configuration["server"]["host"] if "server" in configuration and "host" in configuration["server"] else ""
         port = configuration["server"]["port"] if "server" in configuration and "port" in configuration["server"] else 57
         self.setConfiguration(configuration["server"])
@@ -58,11 +58,15 @@ class IdbServer(ScssServerInet):
         try:
             idbankCommand = ScssProtocol.receiveNoneData(connection, self.max_buffer_size)
             idbankRespond = ProcessQuery.execute(self.jscConfigFilePath, self.connectionName, idbankCommand)
-            if not idbankRespond:
-                idbankRespond = ''
+            if isinstance(idbankRespond, IdbQueryResponseStream) and idbankRespond.framed:
+                for idbankRespondChunk in idbankRespond:
+                    ScssProtocol.sendNoneData(connection, idbankRespondChunk)
             else:
-                idbankRespond = str(idbankRespond)
-            ScssProtocol.sendNoneData(connection, idbankRespond)
+                if not idbankRespond:
+                    idbankRespond = ''
+                else:
+                    idbankRespond = str(idbankRespond)
+                ScssProtocol.sendNoneData(connection, idbankRespond)
         except:
             pass
         finally:
@@ -73,11 +77,15 @@ class IdbServer(ScssServerInet):
         try:
             idbankCommand = ScssProtocol.receiveTokenData(connection, self.connectionSecurity, self.max_buffer_size)
             idbankRespond = ProcessQuery.execute(self.jscConfigFilePath, self.connectionName, idbankCommand)
-            if not idbankRespond:
-                idbankRespond = ''
+            if isinstance(idbankRespond, IdbQueryResponseStream) and idbankRespond.framed:
+                for idbankRespondChunk in idbankRespond:
+                    ScssProtocol.sendTokenData(connection, self.connectionSecurity, idbankRespondChunk)
             else:
-                idbankRespond = str(idbankRespond)
-            ScssProtocol.sendTokenData(connection, self.connectionSecurity, idbankRespond)
+                if not idbankRespond:
+                    idbankRespond = ''
+                else:
+                    idbankRespond = str(idbankRespond)
+                ScssProtocol.sendTokenData(connection, self.connectionSecurity, idbankRespond)
         except:
             pass
         finally:
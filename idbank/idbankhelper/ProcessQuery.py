@@ -28,6 +28,7 @@
 # Import(s)                                                                    #
 ################################################################################
 
+import decimal
 import logging
 import json
 
@@ -58,20 +59,19 @@ class ProcessQuery:
                 logging.error("There is problem with your query. Check it and try again.")
 
         if query:
-            queryJsonData = json.loads(query)
+            queryJsonData = json.loads(query, parse_float=decimal.Decimal)
             returnValue = IdbQueryError.requestError()
 
             if connectionName:
                 connectionName = connectionName.strip('"').strip("'")
-                configuration = IdbConfig.getConfig(jscConfigFilePath, connectionName)
+                configuration = IdbConfig.getCachedConfig(jscConfigFilePath, connectionName)
 
                 if configuration:
-                    if isinstance(queryJsonData, dict):
-                        returnValue = IdbQuery.execute(configuration, query)
+                    if isinstance(queryJsonData, list) and configuration['connectionType'] == 'IdentityBank.V1':
+                        # One connection per backend for the whole file, each query keeps its own response
+                        returnValue, committed = IdbQuery.executeBatch(configuration, queryJsonData)
                     else:
-                        returnValue = []
-                        for query in queryJsonData:
-                            returnValue.append(IdbQuery.execute(configuration, json.dumps(query)))
+                        returnValue = IdbQuery.execute(configuration, query)
 
             return returnValue
 
@@ -84,7 +84,7 @@ class ProcessQuery:
 
         if connectionName:
             connectionName = connectionName.strip('"').strip("'")
-            configuration = IdbConfig.getConfig(jscConfigFilePath, connectionName)
+            configuration = IdbConfig.getCachedConfig(jscConfigFilePath, connectionName)
             if configuration and query:
                 returnValue = IdbQuery.execute(configuration, query)
 
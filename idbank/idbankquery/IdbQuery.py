@@ -29,13 +29,18 @@
 ################################################################################
 
 import decimal
+import functools
 import logging
 import json
+from concurrent.futures import ThreadPoolExecutor
 
 from .IdbQueryError import IdbQueryError
+from .IdbQueryResponse import IdbQueryResponse
+from .IdbQueryResponseStream import IdbQueryResponseStream
 from .IdbQueryBusiness import IdbQueryBusiness
 from .IdbQueryPeople import IdbQueryPeople
 from .IdbQueryRelation import IdbQueryRelation
+from .IdbQuerySql import IdbQuerySql
 
 
 ################################################################################
@@ -43,6 +48,9 @@ from .IdbQueryRelation import IdbQueryRelation
 ################################################################################
 
 class IdbQuery:
+    # Queries without side effects, a batch may run neighbouring ones concurrently
+    readQueryPrefixes = ('get', 'find', 'count', 'check')
+    batchWorkers = 8
 
     @staticmethod
     def execute(configuration: dict,
@@ -57,7 +65,10 @@ class IdbQuery:
             queryData = None
 
         if configuration['connectionType'] == 'IdentityBank.V1':
-            returnValue = IdbQuery.executeQuery(configuration, queryData)
+            if isinstance(queryData, list) or (isinstance(queryData, dict) and 'batch' in queryData):
+                returnValue = IdbQuery.executeBatchQuery(configuration, queryData)
+            else:
+                returnValue = IdbQuery.executeQuery(configuration, queryData)
         else:
             print("The IDB connection type '{}' is not supported.".format(configuration['connectionType']))
 
@@ -81,6 +92,9 @@ class IdbQuery:
                         returnValue = IdbQueryPeople.executeQuery(configuration, queryData)
                     if queryData['service'] == 'relation':
                         returnValue = IdbQueryRelation.executeQuery(configuration, queryData)
+                    # Frame per NDJSON line only for the clients which negotiated it in the request
+                    if isinstance(returnValue, IdbQueryResponseStream):
+                        returnValue.framed = 'streamFrames' in queryData and bool(queryData['streamFrames'])
 
         except Exception as e:
             returnValue = IdbQueryError.requestUnsupportedService()
@@ -89,6 +103,63 @@ class IdbQuery:
 
         return returnValue
 
+    @staticmethod
+    def isReadQuery(queryData: dict) -> bool:
+        return isinstance(queryData, dict) and 'query' in queryData and \
+               isinstance(queryData['query'], str) and queryData['query'].startswith(IdbQuery.readQueryPrefixes)
+
+    @staticmethod
+    def executeBatch(configuration: dict,
+                     batch: list,
+                     transaction: bool = False,
+                     concurrent: bool = False):
+        returnValue = [None] * len(batch)
+        # Streamed responses cannot be embedded in the batch response, the entries of the caller are not changed
+        batch = [dict(queryData) if isinstance(queryData, dict) else queryData for queryData in batch]
+        for queryData in batch:
+            if isinstance(queryData, dict):
+                queryData.pop('stream', None)
+
+        IdbQuerySql.beginSession(transaction)
+        try:
+            index = 0
+            while index < len(batch):
+                group = [index]
+                if concurrent and not transaction and IdbQuery.isReadQuery(batch[index]):
+                    while group[-1] + 1 < len(batch) and IdbQuery.isReadQuery(batch[group[-1] + 1]):
+                        group.append(group[-1] + 1)
+                if 1 < len(group):
+                    # Reads run on their own pooled connections, the batch connection stays with the writes
+                    with ThreadPoolExecutor(max_workers=min(IdbQuery.batchWorkers, len(group))) as executor:
+                        responses = list(executor.map(functools.partial(IdbQuery.executeQuery, configuration),
+                                                      [batch[itemIndex] for itemIndex in group]))
+                else:
+                    responses = [IdbQuery.executeQuery(configuration, batch[index])]
+                for itemIndex, response in zip(group, responses):
+                    returnValue[itemIndex] = response
+                index = group[-1] + 1
+        finally:
+            committed = IdbQuerySql.endSession()
+
+        return returnValue, committed
+
+    @staticmethod
+    def executeBatchQuery(configuration: dict,
+                          queryData) -> str:
+        if isinstance(queryData, list):
+            responses, committed = IdbQuery.executeBatch(configuration, queryData)
+            return '[' + ', '.join(str(response) for response in responses) + ']'
+
+        if not isinstance(queryData['batch'], list):
+            return IdbQueryError.requestError()
+        transaction = 'transaction' in queryData and bool(queryData['transaction'])
+        concurrent = 'concurrent' in queryData and bool(queryData['concurrent'])
+        responses, committed = IdbQuery.executeBatch(configuration, queryData['batch'], transaction, concurrent)
+        responseData = '{"Batch": [' + ', '.join(str(response) for response in responses) + ']'
+        if transaction:
+            responseData += ', "Transaction": "{}"'.format('commit' if committed else 'rollback')
+        return IdbQueryResponse.responseOk(responseData + '}')
+
 ################################################################################
 #                                End of file                                   #
 ################################################################################
@@ -33,7 +33,7 @@ import logging
 
 from psycopg2 import sql
 
-from idbank import AwsDynamoDb
+from idbank import IdbankStorage, IdbankStorageRetry
 from .IdbQueryError import IdbQueryError
 from .IdbQueryResponse import IdbQueryResponse
 from .IdbQuerySql import IdbQuerySql
@@ -45,6 +45,17 @@ from .IdbSqlQueryBuilder import IdbSqlQueryBuilder
 ################################################################################
 
 class IdbQueryBusiness:
+    streamChunkSize = 1000
+
+    @staticmethod
+    def fetchSqlFindItems(dbConnection: dict, queryData: dict):
+        query = IdbSqlQueryBuilder.generateSqlBusinessFindItems(queryData)
+        if 'stream' in queryData and queryData['stream']:
+            chunkSize = IdbQueryBusiness.streamChunkSize
+            if 'streamChunkSize' in queryData and queryData['streamChunkSize']:
+                chunkSize = int(queryData['streamChunkSize'])
+            return IdbQuerySql.streamSqlQuery(dbConnection, query, chunkSize)
+        return IdbQuerySql.fetchSqlQuery(dbConnection, query)
 
     @staticmethod
     def executeQuery(configuration: dict,
@@ -52,6 +63,7 @@ class IdbQueryBusiness:
 
         logging.debug("IDB - execute query ")
         returnValue = IdbQueryError.requestError()
+        idb = None
 
         try:
             if isinstance(queryData, dict) and 'query' in queryData and configuration['connectionBusiness']:
@@ -76,6 +88,8 @@ class IdbQueryBusiness:
                         "database": configuration['connectionBusiness']['dbName'],
                         "user": configuration['connectionBusiness']['dbUser'],
                         "password": configuration['connectionBusiness']['dbPassword'],
+                        "pool": configuration['connectionPool'] if 'connectionPool' in configuration else None,
+                        "poolName": configuration['connectionName'] if 'connectionName' in configuration else None,
                     }
                     if logging.getLevelName(logging.getLogger().getEffectiveLevel()) == 'DEBUG':
                         dbConnectionPrint = dbConnection.copy()
@@ -134,9 +148,9 @@ class IdbQueryBusiness:
                                                             IdbSqlQueryBuilder.generateSqlBusinessPutItem(
                                                                 queryData), True)
                 elif queryData['query'] == 'putItems':
-                    returnValue = IdbQuerySql.fetchSqlQuery(dbConnection,
-                                                            IdbSqlQueryBuilder.generateSqlBusinessPutItems(
-                                                                queryData), True)
+                    returnValue = IdbQuerySql.bulkInsertSqlQuery(dbConnection,
+                                                                 IdbSqlQueryBuilder.generateSqlBusinessPutItems(
+                                                                     queryData))
                 elif queryData['query'] == 'getItem':
                     returnValue = IdbQuerySql.fetchSqlQuery(dbConnection,
                                                             IdbSqlQueryBuilder.generateSqlBusinessGetItem(
@@ -150,32 +164,12 @@ class IdbQueryBusiness:
                                                               IdbSqlQueryBuilder.generateSqlBusinessDeleteItem(
                                                                   queryData))
                 elif queryData['query'] == 'findItems':
+                    returnValue = IdbQueryBusiness.fetchSqlFindItems(dbConnection, queryData)
+                elif queryData['query'] == 'findCountAllItems':
+                    queryData['dbTableCountAll'] = True
                     returnValue = IdbQuerySql.fetchSqlQuery(dbConnection,
                                                             IdbSqlQueryBuilder.generateSqlBusinessFindItems(
                                                                 queryData))
-                elif queryData['query'] == 'findCountAllItems':
-                    returnValue = IdbQuerySql.fetchSqlQuery(dbConnection,
-                                                            IdbSqlQueryBuilder.generateSqlBusinessCountAllItems(
-                                                                dict(queryData)), False, True)
-                    if returnValue \
-                            and isinstance(returnValue, dict) \
-                            and 'Query' in returnValue \
-                            and returnValue['Query'] == 1 \
-                            and 'QueryData' in returnValue:
-                        countAll = returnValue['QueryData']
-                        returnValue = IdbQuerySql.fetchSqlQuery(dbConnection,
-                                                                IdbSqlQueryBuilder.generateSqlBusinessFindItems(
-                                                                    queryData), False, True)
-                        if returnValue \
-                                and isinstance(returnValue, dict) \
-                                and 'Query' in returnValue \
-                                and 'QueryData' in returnValue:
-                            returnValue['CountAll'] = countAll
-                            returnValue = IdbQueryResponse.responseOkDict(returnValue)
-                        else:
-                            returnValue = IdbQueryError.requestQueryError()
-                    else:
-                        returnValue = IdbQueryError.requestQueryError()
                 ################################################################################
                 # Pseudonymisation                                                             #
                 ################################################################################
@@ -196,77 +190,62 @@ class IdbQueryBusiness:
                                                                   queryData))
                 elif queryData['query'] == 'findCountAllPseudonymisationItems':
                     queryData['dbTableName'] = queryData['dbTableName'] + ".pn"
+                    queryData['dbTableCountAll'] = True
                     returnValue = IdbQuerySql.fetchSqlQuery(dbConnection,
-                                                            IdbSqlQueryBuilder.generateSqlBusinessCountAllItems(
-                                                                dict(queryData)), False, True)
-                    if returnValue \
-                            and isinstance(returnValue, dict) \
-                            and 'Query' in returnValue \
-                            and returnValue['Query'] == 1 \
-                            and 'QueryData' in returnValue:
-                        countAll = returnValue['QueryData']
-                        returnValue = IdbQuerySql.fetchSqlQuery(dbConnection,
-                                                                IdbSqlQueryBuilder.generateSqlBusinessFindItems(
-                                                                    queryData), False, True)
-                        if returnValue \
-                                and isinstance(returnValue, dict) \
-                                and 'Query' in returnValue \
-                                and 'QueryData' in returnValue:
-                            returnValue['CountAll'] = countAll
-                            returnValue = IdbQueryResponse.responseOkDict(returnValue)
-                        else:
-                            returnValue = IdbQueryError.requestQueryError()
-                    else:
-                        returnValue = IdbQueryError.requestQueryError()
+                                                            IdbSqlQueryBuilder.generateSqlBusinessFindItems(
+                                                                queryData))
                 ################################################################################
                 # Metadata                                                                     #
                 ################################################################################
                 elif queryData['query'] == 'createAccountMetadata':
-                    idb = AwsDynamoDb.idb(configuration['connectionBusiness'])
+                    idb = IdbankStorage.idb(configuration['connectionBusiness'])
                     if 'account' in queryData:
                         idb.useAccount(queryData['account'])
-                        returnValue = str(idb.createAccountMetadata())
-                        if returnValue and (returnValue.find("'HTTPStatusCode': 200") > 0):
+                        result = idb.createAccountMetadata()
+                        if result.ok:
                             returnValue = IdbQueryResponse.responseCreatedDict({"Metadata Created": 1})
-                        elif returnValue and returnValue == 'The conditional request failed':
+                        elif result.conditionFailed:
                             returnValue = IdbQueryError.itemAlreadyExisting()
+                        elif result.throttled:
+                            returnValue = IdbQueryError.requestServiceUnavailable()
                         else:
                             returnValue = IdbQueryError.requestInternalServerError()
                 elif queryData['query'] == 'setAccountMetadata':
-                    idb = AwsDynamoDb.idb(configuration['connectionBusiness'])
+                    idb = IdbankStorage.idb(configuration['connectionBusiness'])
                     if 'account' in queryData:
                         idb.useAccount(queryData['account'])
                         idbId = None
                         if 'metadata' in queryData:
                             metadata = queryData['metadata']
-                            returnValue = str(idb.setAccountMetadata(metadata))
-                            if returnValue and (returnValue.find("'HTTPStatusCode': 200") > 0):
+                            result = idb.setAccountMetadata(metadata)
+                            if result.ok:
                                 returnValue = IdbQueryResponse.responseOkDict({"Metadata updated": 1})
-                            elif returnValue and returnValue == 'The conditional request failed':
+                            elif result.conditionFailed:
                                 returnValue = IdbQueryError.itemNotFound()
+                            elif result.throttled:
+                                returnValue = IdbQueryError.requestServiceUnavailable()
                             else:
                                 returnValue = IdbQueryError.requestInternalServerError()
                 elif queryData['query'] == 'getAccountMetadata':
-                    idb = AwsDynamoDb.idb(configuration['connectionBusiness'])
+                    idb = IdbankStorage.idb(configuration['connectionBusiness'])
                     if 'account' in queryData:
                         idb.useAccount(queryData['account'])
-                        returnValue = str(idb.getAccountMetadata())
-                        if returnValue:
-                            if returnValue == 'None':
-                                returnValue = IdbQueryError.itemNotFound()
-                            else:
-                                returnValue = IdbQueryResponse.responseOkDict({"Metadata": returnValue})
+                        metadata = idb.getAccountMetadata()
+                        if metadata is None:
+                            returnValue = IdbQueryError.itemNotFound()
                         else:
-                            returnValue = IdbQueryError.requestInternalServerError()
+                            returnValue = IdbQueryResponse.responseOkDict({"Metadata": metadata})
                 elif queryData['query'] == 'deleteAccountMetadata':
-                    idb = AwsDynamoDb.idb(configuration['connectionBusiness'])
+                    idb = IdbankStorage.idb(configuration['connectionBusiness'])
                     if 'account' in queryData:
                         idb.useAccount(queryData['account'])
-                        returnValue = str(idb.deleteAccountMetadata())
-                        if returnValue and (returnValue.find("'HTTPStatusCode': 200") > 0):
+                        result = idb.deleteAccountMetadata()
+                        if result.ok:
                             returnValue = IdbQueryResponse.responseCreatedDict({"Metadata Created": 1})
-                        elif returnValue and returnValue == 'The conditional request failed':
+                        elif result.notFound:
                             returnValue = IdbQueryError.itemAlreadyExisting()
+                        elif result.throttled:
+                            returnValue = IdbQueryError.requestServiceUnavailable()
                         else:
                             returnValue = IdbQueryError.requestInternalServerError()
                 ################################################################################
@@ -293,9 +272,7 @@ class IdbQueryBusiness:
                 elif queryData['query'] == 'getAllAccountCRs':
                     if 'dbTableLimit' not in queryData:
                         queryData['dbTableLimit'] = 0
-                    returnValue = IdbQuerySql.fetchSqlQuery(dbConnection,
-                                                            IdbSqlQueryBuilder.generateSqlBusinessFindItems(
-                                                                queryData))
+                    returnValue = IdbQueryBusiness.fetchSqlFindItems(dbConnection, queryData)
                 elif queryData['query'] == 'getAccountCR':
                     queryData['idbId'] = queryData['id']
                     returnValue = IdbQuerySql.fetchSqlQuery(dbConnection,
@@ -352,32 +329,12 @@ class IdbQueryBusiness:
                                                             IdbSqlQueryBuilder.generateSqlBusinessCountAllItems(
                                                                 queryData))
                 elif queryData['query'] == 'findAccountCRItems':
+                    returnValue = IdbQueryBusiness.fetchSqlFindItems(dbConnection, queryData)
+                elif queryData['query'] == 'findCountAllAccountCRItems':
+                    queryData['dbTableCountAll'] = True
                     returnValue = IdbQuerySql.fetchSqlQuery(dbConnection,
                                                             IdbSqlQueryBuilder.generateSqlBusinessFindItems(
                                                                 queryData))
-                elif queryData['query'] == 'findCountAllAccountCRItems':
-                    returnValue = IdbQuerySql.fetchSqlQuery(dbConnection,
-                                                            IdbSqlQueryBuilder.generateSqlBusinessCountAllItems(
-                                                                dict(queryData)), False, True)
-                    if returnValue \
-                            and isinstance(returnValue, dict) \
-                            and 'Query' in returnValue \
-                            and returnValue['Query'] == 1 \
-                            and 'QueryData' in returnValue:
-                        countAll = returnValue['QueryData']
-                        returnValue = IdbQuerySql.fetchSqlQuery(dbConnection,
-                                                                IdbSqlQueryBuilder.generateSqlBusinessFindItems(
-                                                                    queryData), False, True)
-                        if returnValue \
-                                and isinstance(returnValue, dict) \
-                                and 'Query' in returnValue \
-                                and 'QueryData' in returnValue:
-                            returnValue['CountAll'] = countAll
-                            returnValue = IdbQueryResponse.responseOkDict(returnValue)
-                        else:
-                            returnValue = IdbQueryError.requestQueryError()
-                    else:
-                        returnValue = IdbQueryError.requestQueryError()
                 ################################################################################
                 # Status                                                                       #
                 ################################################################################
@@ -402,9 +359,7 @@ class IdbQueryBusiness:
                 elif queryData['query'] == 'getAllAccountSTs':
                     if 'dbTableLimit' not in queryData:
                         queryData['dbTableLimit'] = 0
-                    returnValue = IdbQuerySql.fetchSqlQuery(dbConnection,
-                                                            IdbSqlQueryBuilder.generateSqlBusinessFindItems(
-                                                                queryData))
+                    returnValue = IdbQueryBusiness.fetchSqlFindItems(dbConnection, queryData)
                 elif queryData['query'] == 'getAccountSTbyUserId':
                     queryData['dbTableColumnPk'] = "people_id"
                     queryData['idbId'] = queryData['userId']
@@ -537,36 +492,25 @@ class IdbQueryBusiness:
                                                                   IdbSqlQueryBuilder.generateSqlBusinessDeleteItem(
                                                                       queryData))
                 elif queryData['query'] == 'findCountAllAccountEvents':
+                    queryData['dbTableCountAll'] = True
                     returnValue = IdbQuerySql.fetchSqlQuery(dbConnection,
-                                                            IdbSqlQueryBuilder.generateSqlBusinessCountAllItems(
-                                                                dict(queryData)), False, True)
-                    if returnValue \
-                            and isinstance(returnValue, dict) \
-                            and 'Query' in returnValue \
-                            and returnValue['Query'] == 1 \
-                            and 'QueryData' in returnValue:
-                        countAll = returnValue['QueryData']
-                        returnValue = IdbQuerySql.fetchSqlQuery(dbConnection,
-                                                                IdbSqlQueryBuilder.generateSqlBusinessFindItems(
-                                                                    queryData), False, True)
-                        if returnValue \
-                                and isinstance(returnValue, dict) \
-                                and 'Query' in returnValue \
-                                and 'QueryData' in returnValue:
-                            returnValue['CountAll'] = countAll
-                            returnValue = IdbQueryResponse.responseOkDict(returnValue)
-                        else:
-                            returnValue = IdbQueryError.requestQueryError()
-                    else:
-                        returnValue = IdbQueryError.requestQueryError()
+                                                            IdbSqlQueryBuilder.generateSqlBusinessFindItems(
+                                                                queryData))
                 else:
                     returnValue = IdbQueryError.requestNotImplemented()
 
         except Exception as e:
-            returnValue = IdbQueryError.requestUnsupportedService(str(e))
+            if IdbankStorageRetry.isThrottlingError(e):
+                returnValue = IdbQueryError.requestServiceUnavailable()
+            else:
+                returnValue = IdbQueryError.requestUnsupportedService(str(e))
             logging.error('Query error')
             logging.error(str(e))
 
+        if idb is not None and isinstance(returnValue, str) and \
+                isinstance(queryData, dict) and queryData.get('returnConsumedCapacity'):
+            returnValue = IdbQueryResponse.responseConsumedCapacity(returnValue, idb.consumedCapacity())
+
         logging.debug("IDB execution done: " + json.dumps(queryData['query']))
 
         return returnValue
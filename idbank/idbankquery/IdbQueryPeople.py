@@ -33,7 +33,8 @@ import logging
 
 from .IdbQueryError import IdbQueryError
 from .IdbQueryResponse import IdbQueryResponse
-from idbank import AwsDynamoDb
+from .IdbQueryResponseStream import IdbQueryResponseStream
+from idbank import IdbankStorage, IdbankStorageRetry
 
 
 ################################################################################
@@ -48,6 +49,7 @@ class IdbQueryPeople:
 
         logging.debug("IDB - execute query ")
         returnValue = IdbQueryError.requestError()
+        idb = None
 
         try:
             if isinstance(queryData, dict) and 'query' in queryData:
@@ -55,118 +57,207 @@ class IdbQueryPeople:
                 logging.debug("IDB query execute: " + json.dumps(queryData['query']))
 
                 if queryData['query'] == 'countAllItems' and configuration['connectionPeople']:
-                    idb = AwsDynamoDb.idb(configuration['connectionPeople'])
+                    idb = IdbankStorage.idb(configuration['connectionPeople'])
                     if 'account' in queryData:
                         idb.useAccount(queryData['account'])
-                        returnValue = str(idb.countAllItems())
-                        if returnValue:
-                            returnValue = IdbQueryResponse.responseOkDict({"count": returnValue})
+                        count = idb.countAllItems()
+                        if count is not None:
+                            returnValue = IdbQueryResponse.responseOkDict({"count": str(count)})
                         else:
                             returnValue = IdbQueryError.requestInternalServerError()
                 elif queryData['query'] == 'putItem' and configuration['connectionPeople']:
-                    idb = AwsDynamoDb.idb(configuration['connectionPeople'])
+                    idb = IdbankStorage.idb(configuration['connectionPeople'])
                     if 'account' in queryData:
                         idb.useAccount(queryData['account'])
                         idbId = None
                         if 'idbId' in queryData:
                             idbId = queryData['idbId']
                             data = queryData['data']
-                            returnValue = str(idb.putItem(idbId, data))
-                            if returnValue and (returnValue.find("'HTTPStatusCode': 200") > 0):
+                            result = idb.putItem(idbId, data)
+                            if result.ok:
                                 returnValue = IdbQueryResponse.responseCreatedDict({"Created": 1})
-                            elif returnValue and returnValue == 'The conditional request failed':
+                            elif result.conditionFailed:
                                 returnValue = IdbQueryError.itemAlreadyExisting()
+                            elif result.throttled:
+                                returnValue = IdbQueryError.requestServiceUnavailable()
                             else:
                                 returnValue = IdbQueryError.requestInternalServerError()
                 elif queryData['query'] == 'getItem' and configuration['connectionPeople']:
-                    idb = AwsDynamoDb.idb(configuration['connectionPeople'])
+                    idb = IdbankStorage.idb(configuration['connectionPeople'])
                     if 'account' in queryData:
                         idb.useAccount(queryData['account'])
                         idbId = None
                         if 'idbId' in queryData:
                             idbId = queryData['idbId']
-                            returnValue = str(idb.getItem(idbId))
-                            if returnValue:
-                                if returnValue == 'None':
-                                    returnValue = IdbQueryError.itemNotFound()
-                                else:
-                                    returnValue = IdbQueryResponse.responseOkDict({"Data": returnValue})
+                            result = idb.getItemResult(idbId)
+                            if result.ok:
+                                returnValue = IdbQueryResponse.responseOkDict({"Data": result.item})
+                            elif result.notFound:
+                                returnValue = IdbQueryError.itemNotFound()
+                            elif result.throttled:
+                                returnValue = IdbQueryError.requestServiceUnavailable()
                             else:
                                 returnValue = IdbQueryError.requestInternalServerError()
                 elif queryData['query'] == 'updateItem' and configuration['connectionPeople']:
-                    idb = AwsDynamoDb.idb(configuration['connectionPeople'])
+                    idb = IdbankStorage.idb(configuration['connectionPeople'])
                     if 'account' in queryData:
                         idb.useAccount(queryData['account'])
                         idbId = None
                         if 'idbId' in queryData:
                             idbId = queryData['idbId']
                             data = queryData['data']
-                            returnValue = str(idb.updateItem(idbId, data))
-                            if returnValue and (returnValue.find("'HTTPStatusCode': 200") > 0):
+                            result = idb.updateItem(idbId, data)
+                            if result.ok:
                                 returnValue = IdbQueryResponse.responseOkDict({"Updated": 1})
-                            elif returnValue and returnValue == 'The conditional request failed':
+                            elif result.conditionFailed:
                                 returnValue = IdbQueryError.itemNotFound()
+                            elif result.throttled:
+                                returnValue = IdbQueryError.requestServiceUnavailable()
                             else:
                                 returnValue = IdbQueryError.requestInternalServerError()
                 elif queryData['query'] == 'deleteItem' and configuration['connectionPeople']:
-                    idb = AwsDynamoDb.idb(configuration['connectionPeople'])
+                    idb = IdbankStorage.idb(configuration['connectionPeople'])
                     if 'account' in queryData:
                         idb.useAccount(queryData['account'])
                         idbId = None
                         if 'idbId' in queryData:
                             idbId = queryData['idbId']
-                            returnValue = str(idb.deleteItem(idbId))
-                            if returnValue and (returnValue.find("'HTTPStatusCode': 200") > 0):
+                            result = idb.deleteItem(idbId)
+                            if result.ok:
                                 returnValue = IdbQueryResponse.responseOkDict({"Deleted": 1})
-                            elif returnValue and returnValue == 'The conditional request failed':
+                            elif result.notFound:
                                 returnValue = IdbQueryError.itemNotFound()
+                            elif result.throttled:
+                                returnValue = IdbQueryError.requestServiceUnavailable()
+                            else:
+                                returnValue = IdbQueryError.requestInternalServerError()
+                elif queryData['query'] == 'putItems' and configuration['connectionPeople']:
+                    idb = IdbankStorage.idb(configuration['connectionPeople'])
+                    if 'account' in queryData and 'items' in queryData:
+                        idb.useAccount(queryData['account'])
+                        items = queryData['items']
+                        if isinstance(items, list):
+                            items = {item['idbId']: item['data'] for item in items}
+                        conditional = 'conditional' in queryData and bool(queryData['conditional'])
+                        result = idb.putItems(items, conditional)
+                        returnValue = {"Created": result['Processed']}
+                        if result['Unprocessed']:
+                            returnValue["Unprocessed"] = result['Unprocessed']
+                        if result['Existing']:
+                            returnValue["Existing"] = result['Existing']
+                        returnValue = IdbQueryResponse.responseCreatedDict(returnValue)
+                elif queryData['query'] == 'getItems' and configuration['connectionPeople']:
+                    idb = IdbankStorage.idb(configuration['connectionPeople'])
+                    if 'account' in queryData and 'idbIds' in queryData:
+                        idb.useAccount(queryData['account'])
+                        result = idb.getItems(queryData['idbIds'])
+                        returnValue = {"Data": result['Items'],
+                                       "NotFound": [idbId for idbId in queryData['idbIds'] if
+                                                    idbId not in result['Items'] and
+                                                    idbId not in result['Unprocessed']]}
+                        if result['Unprocessed']:
+                            returnValue["Unprocessed"] = result['Unprocessed']
+                        returnValue = IdbQueryResponse.responseOkDict(returnValue)
+                elif queryData['query'] == 'deleteItems' and configuration['connectionPeople']:
+                    idb = IdbankStorage.idb(configuration['connectionPeople'])
+                    if 'account' in queryData and 'idbIds' in queryData:
+                        idb.useAccount(queryData['account'])
+                        conditional = 'conditional' in queryData and bool(queryData['conditional'])
+                        result = idb.deleteItems(queryData['idbIds'], conditional)
+                        returnValue = {"Deleted": result['Processed']}
+                        if result['Unprocessed']:
+                            returnValue["Unprocessed"] = result['Unprocessed']
+                        if result['NotFound']:
+                            returnValue["NotFound"] = result['NotFound']
+                        returnValue = IdbQueryResponse.responseOkDict(returnValue)
+                elif queryData['query'] in ('findItems', 'findCountAllItems') and configuration['connectionPeople']:
+                    idb = IdbankStorage.idb(configuration['connectionPeople'])
+                    if 'account' in queryData:
+                        idb.useAccount(queryData['account'])
+                        query = {key: queryData[key] for key in
+                                 ('FilterExpression', 'ExpressionAttributeNames', 'ExpressionAttributeValues',
+                                  'ProjectionExpression') if key in queryData}
+                        pageSize = int(queryData['Limit']) if 'Limit' in queryData and queryData['Limit'] else None
+                        startingToken = None
+                        if 'PaginationConfig' in queryData and queryData['PaginationConfig']:
+                            if 'PageSize' in queryData['PaginationConfig'] and \
+                                    queryData['PaginationConfig']['PageSize']:
+                                pageSize = int(queryData['PaginationConfig']['PageSize'])
+                            if 'StartingToken' in queryData['PaginationConfig']:
+                                startingToken = queryData['PaginationConfig']['StartingToken']
+                        summary = {}
+                        # The count reads the whole partition, it is returned with the first page only
+                        if queryData['query'] == 'findCountAllItems' and not startingToken:
+                            summary["CountAll"] = [[idb.countFindItems(query)]]
+                        if 'stream' in queryData and queryData['stream']:
+                            returnValue = IdbQueryResponseStream(
+                                idb.iterateFindItems(query, pageSize, startingToken, summary), summary=summary)
                         else:
-                            returnValue = IdbQueryError.requestInternalServerError()
+                            result = idb.findItemsPage(query, pageSize, startingToken)
+                            returnData = {"Query": len(result['Items']), "QueryData": result['Items']}
+                            if 'NextToken' in result:
+                                returnData["NextToken"] = result['NextToken']
+                            returnData.update(summary)
+                            returnValue = IdbQueryResponse.responseOkDict(returnData)
+                elif queryData['query'] == 'exportItems' and configuration['connectionPeople']:
+                    # Export of the account items streamed as NDJSON, the whole table export is not on the wire
+                    idb = IdbankStorage.idb(configuration['connectionPeople'])
+                    if 'account' in queryData:
+                        idb.useAccount(queryData['account'])
+                        returnValue = IdbQueryResponseStream(idb.exportAccountItems())
                 elif queryData['query'] == 'createAccountMetadata' and configuration['connectionPeople']:
-                    idb = AwsDynamoDb.idb(configuration['connectionPeople'])
+                    idb = IdbankStorage.idb(configuration['connectionPeople'])
                     if 'account' in queryData:
                         idb.useAccount(queryData['account'])
-                        returnValue = str(idb.createAccountMetadata())
-                        if returnValue and (returnValue.find("'HTTPStatusCode': 200") > 0):
+                        result = idb.createAccountMetadata()
+                        if result.ok:
                             returnValue = IdbQueryResponse.responseCreatedDict({"Metadata Created": 1})
-                        elif returnValue and returnValue == 'The conditional request failed':
+                        elif result.conditionFailed:
                             returnValue = IdbQueryError.itemAlreadyExisting()
+                        elif result.throttled:
+                            returnValue = IdbQueryError.requestServiceUnavailable()
                         else:
                             returnValue = IdbQueryError.requestInternalServerError()
                 elif queryData['query'] == 'setAccountMetadata' and configuration['connectionPeople']:
-                    idb = AwsDynamoDb.idb(configuration['connectionPeople'])
+                    idb = IdbankStorage.idb(configuration['connectionPeople'])
                     if 'account' in queryData:
                         idb.useAccount(queryData['account'])
                         idbId = None
                         if 'metadata' in queryData:
                             metadata = queryData['metadata']
-                            returnValue = str(idb.setAccountMetadata(metadata))
-                            if returnValue and (returnValue.find("'HTTPStatusCode': 200") > 0):
+                            result = idb.setAccountMetadata(metadata)
+                            if result.ok:
                                 returnValue = IdbQueryResponse.responseOkDict({"Metadata updated": 1})
-                            elif returnValue and returnValue == 'The conditional request failed':
+                            elif result.conditionFailed:
                                 returnValue = IdbQueryError.itemNotFound()
+                            elif result.throttled:
+                                returnValue = IdbQueryError.requestServiceUnavailable()
                             else:
                                 returnValue = IdbQueryError.requestInternalServerError()
                 elif queryData['query'] == 'getAccountMetadata' and configuration['connectionPeople']:
-                    idb = AwsDynamoDb.idb(configuration['connectionPeople'])
+                    idb = IdbankStorage.idb(configuration['connectionPeople'])
                     if 'account' in queryData:
                         idb.useAccount(queryData['account'])
-                        returnValue = str(idb.getAccountMetadata())
-                        if returnValue:
-                            if returnValue == 'None':
-                                returnValue = IdbQueryError.itemNotFound()
-                            else:
-                                returnValue = IdbQueryResponse.responseOkDict({"Metadata": returnValue})
+                        metadata = idb.getAccountMetadata()
+                        if metadata is None:
+                            returnValue = IdbQueryError.itemNotFound()
                         else:
-                            returnValue = IdbQueryError.requestInternalServerError()
+                            returnValue = IdbQueryResponse.responseOkDict({"Metadata": metadata})
                 else:
                     returnValue = IdbQueryError.requestNotImplemented()
 
         except Exception as e:
-            returnValue = IdbQueryError.requestUnsupportedService(str(e))
+            if IdbankStorageRetry.isThrottlingError(e):
+                returnValue = IdbQueryError.requestServiceUnavailable()
+            else:
+                returnValue = IdbQueryError.requestUnsupportedService(str(e))
             logging.error('Query error')
             logging.error(str(e))
 
+        if idb is not None and isinstance(returnValue, str) and \
+                isinstance(queryData, dict) and queryData.get('returnConsumedCapacity'):
+            returnValue = IdbQueryResponse.responseConsumedCapacity(returnValue, idb.consumedCapacity())
+
         logging.debug("IDB execution done: " + json.dumps(queryData['query']))
 
         return returnValue
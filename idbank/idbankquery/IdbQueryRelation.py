@@ -91,6 +91,8 @@ class IdbQueryRelation:
                     "database": configuration['connectionRelation']['dbName'],
                     "user": configuration['connectionRelation']['dbUser'],
                     "password": configuration['connectionRelation']['dbPassword'],
+                    "pool": configuration['connectionPool'] if 'connectionPool' in configuration else None,
+                    "poolName": configuration['connectionName'] if 'connectionName' in configuration else None,
                 }
                 if logging.getLevelName(logging.getLogger().getEffectiveLevel()) == 'DEBUG':
                     dbConnectionPrint = dbConnection.copy()
@@ -130,53 +132,17 @@ class IdbQueryRelation:
                 elif queryData['query'] == 'getRelatedPeoplesCountAll':
                     queryData['dbTableCondition'] = sql.SQL(
                         'WHERE {bidIdentifier} LIKE {businessIdPlaceholder}').format(**queryData)
+                    queryData['dbTableCountAll'] = True
                     returnValue = IdbQuerySql.fetchSqlQuery(dbConnection,
-                                                            IdbSqlQueryBuilder.generateSqlCountAllItems(
-                                                                dict(queryData)), False, True)
-                    if returnValue \
-                            and isinstance(returnValue, dict) \
-                            and 'Query' in returnValue \
-                            and returnValue['Query'] == 1 \
-                            and 'QueryData' in returnValue:
-                        countAll = returnValue['QueryData']
-                        returnValue = IdbQuerySql.fetchSqlQuery(dbConnection,
-                                                                IdbSqlQueryBuilder.generateSqlGetRelatedPeoples(
-                                                                    queryData), False, True)
-                        if returnValue \
-                                and isinstance(returnValue, dict) \
-                                and 'Query' in returnValue \
-                                and 'QueryData' in returnValue:
-                            returnValue['CountAll'] = countAll
-                            returnValue = IdbQueryResponse.responseOkDict(returnValue)
-                        else:
-                            returnValue = IdbQueryError.requestQueryError()
-                    else:
-                        returnValue = IdbQueryError.requestQueryError()
+                                                            IdbSqlQueryBuilder.generateSqlGetRelatedPeoples(
+                                                                queryData))
                 elif queryData['query'] == 'getRelatedBusinessesCountAll':
                     queryData['dbTableCondition'] = sql.SQL('WHERE {pidIdentifier} LIKE {peopleIdPlaceholder}').format(
                         **queryData)
+                    queryData['dbTableCountAll'] = True
                     returnValue = IdbQuerySql.fetchSqlQuery(dbConnection,
-                                                            IdbSqlQueryBuilder.generateSqlCountAllItems(
-                                                                dict(queryData)), False, True)
-                    if returnValue \
-                            and isinstance(returnValue, dict) \
-                            and 'Query' in returnValue \
-                            and returnValue['Query'] == 1 \
-                            and 'QueryData' in returnValue:
-                        countAll = returnValue['QueryData']
-                        returnValue = IdbQuerySql.fetchSqlQuery(dbConnection,
-                                                                IdbSqlQueryBuilder.generateSqlGetRelatedBusinesses(
-                                                                    queryData), False, True)
-                        if returnValue \
-                                and isinstance(returnValue, dict) \
-                                and 'Query' in returnValue \
-                                and 'QueryData' in returnValue:
-                            returnValue['CountAll'] = countAll
-                            returnValue = IdbQueryResponse.responseOkDict(returnValue)
-                        else:
-                            returnValue = IdbQueryError.requestQueryError()
-                    else:
-                        returnValue = IdbQueryError.requestQueryError()
+                                                            IdbSqlQueryBuilder.generateSqlGetRelatedBusinesses(
+                                                                queryData))
                 else:
                     returnValue = IdbQueryError.requestNotImplemented()
 
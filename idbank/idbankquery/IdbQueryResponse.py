@@ -102,6 +102,13 @@ class IdbQueryResponse:
             json.dumps(responseData, default=IdbQueryResponse.customJsonDumpDefault),
             requestId)
 
+    @staticmethod
+    def responseConsumedCapacity(response: str,
+                                 consumedCapacity: dict) -> str:
+        returnData = json.loads(response)
+        returnData['consumedCapacity'] = consumedCapacity
+        return json.dumps(returnData, ensure_ascii=False)
+
 ################################################################################
 #                                End of file                                   #
 ################################################################################
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+# * ********************************************************************* *
+# *                                                                       *
+# *   Identity Bank data driver                                           *
+# *   This file is part of idbank. This project may be found at:          *
+# *   https://github.com/IdentityBank/Python_idbank.                      *
+# *                                                                       *
+# *   Copyright (C) 2020 by Identity Bank. All Rights Reserved.           *
+# *   https://www.identitybank.eu - You belong to you                     *
+# *                                                                       *
+# *   This program is free software: you can redistribute it and/or       *
+# *   modify it under the terms of the GNU Affero General Public          *
+# *   License as published by the Free Software Foundation, either        *
+# *   version 3 of the License, or (at your option) any later version.    *
+# *                                                                       *
+# *   This program is distributed in the hope that it will be useful,     *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of      *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the        *
+# *   GNU Affero General Public License for more details.                 *
+# *                                                                       *
+# *   You should have received a copy of the GNU Affero General Public    *
+# *   License along with this program. If not, see                        *
+# *   https://www.gnu.org/licenses/.                                      *
+# *                                                                       *
+# * ********************************************************************* *
+
+################################################################################
+# Import(s)                                                                    #
+################################################################################
+
+import hashlib
+import json
+import logging
+
+from idbank import IdbCommon
+from .IdbQueryError import IdbQueryError
+from .IdbQueryResponse import IdbQueryResponse
+
+
+################################################################################
+# Module                                                                       #
+################################################################################
+
+class IdbQueryResponseStream:
+    # Response sent as NDJSON: header line, one line per data chunk and a summary line.
+    # By default the whole NDJSON response is one protocol frame, a frame per line is sent only to the clients
+    # which asked for it with "streamFrames" in the request (framed)
+
+    def __init__(self, chunks, requestId: str = None, summary: dict = None, framed: bool = False):
+        self.chunks = chunks
+        self.requestId = requestId
+        self.summary = summary if summary is not None else {}
+        self.framed = framed
+
+    def __iter__(self):
+        # The first chunk runs the query, its errors are sent as the error response instead of the header
+        chunks = iter(self.chunks)
+        try:
+            firstRows = next(chunks, None)
+        except Exception as error:
+            self.__close()
+            logging.error('Query stream error')
+            logging.error(str(error))
+            yield IdbQueryError.requestQueryError(str(error), self.requestId) + '\n'
+            return
+
+        yield json.dumps({
+            'requestId': self.requestId,
+            'statusCode': 200,
+            'statusMessage': 'OK',
+            'timestamp': IdbCommon.getSimpleTimestemp(),
+            'contentType': 'ndjson',
+        }, ensure_ascii=False) + '\n'
+
+        rowCount = 0
+        contentLength = 0
+        checksum = hashlib.md5()
+        try:
+            rows = firstRows
+            while rows is not None:
+                rowCount += len(rows)
+                chunk = json.dumps({"QueryData": rows}, default=IdbQueryResponse.customJsonDumpDefault)
+                contentLength += len(chunk)
+                checksum.update(chunk.encode('UTF-8'))
+                yield chunk + '\n'
+                rows = next(chunks, None)
+        except Exception as error:
+            logging.error('Query stream error')
+            logging.error(str(error))
+            yield IdbQueryError.requestQueryError(str(error), self.requestId) + '\n'
+            return
+        finally:
+            self.__close()
+
+        summary = dict(self.summary)
+        summary.update({
+            'Query': rowCount,
+            'contentLength': contentLength,
+            'checksum': checksum.hexdigest(),
+        })
+        yield json.dumps(summary, default=IdbQueryResponse.customJsonDumpDefault) + '\n'
+
+    def __close(self):
+        if hasattr(self.chunks, 'close'):
+            self.chunks.close()
+
+    def __str__(self):
+        return ''.join(self)
+
+################################################################################
+#                                End of file                                   #
+################################################################################
@@ -28,14 +28,21 @@
 # Import(s)                                                                    #
 ################################################################################
 
+import io
 import json
 import logging
+import re
+import threading
+import uuid
 
 import psycopg2
-from psycopg2 import DatabaseError
+from psycopg2 import DatabaseError, extensions, extras
 
 from .IdbQueryError import IdbQueryError
 from .IdbQueryResponse import IdbQueryResponse
+from .IdbQueryResponseStream import IdbQueryResponseStream
+from .IdbQuerySqlPool import IdbQuerySqlPool
+from .IdbSqlQueryBuilder import IdbSqlQueryBuilder
 
 
 ################################################################################
@@ -43,6 +50,75 @@ from .IdbQueryResponse import IdbQueryResponse
 ################################################################################
 
 class IdbQuerySql:
+    # Number of rows sent in one multi-row INSERT statement
+    bulkPageSize = 1000
+    # SQLSTATE raised by a prepared statement whose table definition changed
+    preparedInvalidCode = '0A000'
+    preparedPlaceholderPattern = re.compile(r'%\(([^)]+)\)s|%%')
+    # Batch session of the current thread: one connection per pool, optionally one transaction
+    __session = threading.local()
+
+    @staticmethod
+    def beginSession(transaction: bool = False):
+        IdbQuerySql.__session.connections = {}
+        IdbQuerySql.__session.transaction = transaction
+        IdbQuerySql.__session.failed = False
+
+    @staticmethod
+    def endSession() -> bool:
+        connections = getattr(IdbQuerySql.__session, 'connections', None)
+        if connections is None:
+            return True
+        committed = not IdbQuerySql.__session.failed
+        transaction = IdbQuerySql.__session.transaction
+        IdbQuerySql.__session.connections = None
+        for idbPool, poolConnection in connections.values():
+            discard = False
+            try:
+                if transaction and committed:
+                    poolConnection.connection.commit()
+                elif transaction:
+                    poolConnection.connection.rollback()
+            except (Exception, DatabaseError) as error:
+                committed = False
+                discard = True
+                logging.error('Batch transaction error')
+                logging.error(str(error))
+            idbPool.putConnection(poolConnection, discard)
+        return committed
+
+    @staticmethod
+    def getConnection(idbPool):
+        connections = getattr(IdbQuerySql.__session, 'connections', None)
+        if connections is None:
+            return idbPool.getConnection()
+        if id(idbPool) not in connections:
+            connections[id(idbPool)] = (idbPool, idbPool.getConnection())
+        return connections[id(idbPool)][1]
+
+    @staticmethod
+    def putConnection(idbPool, poolConnection, discard: bool = False, failed: bool = False):
+        connections = getattr(IdbQuerySql.__session, 'connections', None)
+        if connections is None or id(idbPool) not in connections:
+            idbPool.putConnection(poolConnection, discard)
+            return
+        if failed and IdbQuerySql.__session.transaction:
+            IdbQuerySql.__session.failed = True
+        elif failed and not discard:
+            # Keep the shared connection usable for the next query of the batch
+            try:
+                poolConnection.connection.rollback()
+            except (Exception, DatabaseError):
+                discard = True
+        if discard:
+            connections.pop(id(idbPool))
+            idbPool.putConnection(poolConnection, discard)
+
+    @staticmethod
+    def commit(connection):
+        if not (getattr(IdbQuerySql.__session, 'connections', None) is not None and
+                IdbQuerySql.__session.transaction):
+            connection.commit()
 
     @staticmethod
     def querySqlToString(query: dict, cursor) -> str:
@@ -54,6 +130,8 @@ class IdbQuerySql:
                         sqlString += item.as_string(cursor)
                 else:
                     sqlString = query['sql'].as_string(cursor)
+                    if 'cacheKey' in query and query['cacheKey']:
+                        IdbSqlQueryBuilder.cacheSqlQuery(query, sqlString)
         except (Exception, DatabaseError) as e:
             pass
         return sqlString
@@ -83,57 +161,329 @@ class IdbQuerySql:
                 "DB Connection: " + json.dumps({key: dbConnection[key] for key in dbConnection if key != 'password'}))
             logging.debug("Execute query: " + IdbQuerySql.queryToString(query, cursor))
 
+    @staticmethod
+    def isConnectionError(error) -> bool:
+        return isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError))
+
+    @staticmethod
+    def keysetRows(query: dict, rows: list):
+        keysetColumns = query['keyset']['columns']
+        lastKeyset = list(rows[-1][-keysetColumns:]) if rows else None
+        return [row[:-keysetColumns] for row in rows], lastKeyset
+
+    @staticmethod
+    def keysetNextToken(query: dict, lastKeyset: list, rowCount: int):
+        limit = query['keyset']['limit']
+        if lastKeyset is None or not limit or rowCount < limit:
+            return None
+        return IdbSqlQueryBuilder.encodeKeysetToken(lastKeyset)
+
+    @staticmethod
+    def countAllRows(cursor, query: dict, rows: list):
+        if rows:
+            countAll = rows[0][-1]
+            rows = [row[:-1] for row in rows]
+        else:
+            cursor.execute(query['countAll']['sql'].as_string(cursor), query['data'])
+            countAll = cursor.fetchone()[0]
+        countAllData = {}
+        countAllLimit = query['countAll']['limit']
+        if countAllLimit is not None:
+            countAllData["CountAllLimited"] = countAll > countAllLimit
+            countAll = min(countAll, countAllLimit)
+        countAllData["CountAll"] = [[countAll]]
+        return rows, countAllData
+
+    @staticmethod
+    def estimateCountRows(cursor, query: dict, rows: list) -> dict:
+        countAll = None
+        if rows and rows[0][0] is not None:
+            if query['estimate'] == 'plan':
+                queryPlan = rows[0][0]
+                if isinstance(queryPlan, str):
+                    queryPlan = json.loads(queryPlan)
+                countAll = int(queryPlan[0]['Plan']['Plan Rows'])
+            elif rows[0][0] > 0:
+                countAll = int(rows[0][0])
+        if countAll is None:
+            # Table without statistics, small enough to be counted
+            cursor.execute(query['exactSql'].as_string(cursor), query['data'])
+            return {"Query": cursor.rowcount, "QueryData": cursor.fetchall(), "Estimated": False}
+        return {"Query": 1, "QueryData": [[countAll]], "Estimated": True}
+
+    @staticmethod
+    def fetchQueryData(cursor, query: dict) -> dict:
+        rows = cursor.fetchall()
+        if 'estimate' in query:
+            return IdbQuerySql.estimateCountRows(cursor, query, rows)
+        returnData = {"Query": cursor.rowcount, "QueryData": rows}
+        if 'keyset' in query:
+            returnData["QueryData"], lastKeyset = IdbQuerySql.keysetRows(query, rows)
+            returnData["NextToken"] = IdbQuerySql.keysetNextToken(query, lastKeyset, len(rows))
+        if 'countAll' in query:
+            returnData["QueryData"], countAllData = IdbQuerySql.countAllRows(cursor, query, returnData["QueryData"])
+            returnData.update(countAllData)
+        return returnData
+
+    @staticmethod
+    def prepareSqlQuery(poolConnection, cursor, sqlString: str, limit: int):
+        preparedStatements = poolConnection.preparedStatements
+        if sqlString in preparedStatements:
+            preparedStatements.move_to_end(sqlString)
+            return preparedStatements[sqlString]
+
+        parameters = []
+
+        def placeholder(match):
+            if match.group(1) is None:
+                return '%'
+            if match.group(1) not in parameters:
+                parameters.append(match.group(1))
+            return '${}'.format(parameters.index(match.group(1)) + 1)
+
+        while len(preparedStatements) >= limit:
+            evictedSql, evictedStatement = preparedStatements.popitem(last=False)
+            if evictedStatement:
+                cursor.execute('DEALLOCATE {};'.format(evictedStatement['name']))
+        poolConnection.preparedCounter += 1
+        statementName = 'idb_{}'.format(poolConnection.preparedCounter)
+        prepareSql = IdbQuerySql.preparedPlaceholderPattern.sub(placeholder, sqlString).strip().rstrip(';')
+        try:
+            cursor.execute('PREPARE {} AS {};'.format(statementName, prepareSql))
+        except DatabaseError as error:
+            # Statement which cannot be prepared (e.g. unknown parameter type) runs as a plain query
+            if IdbQuerySql.isConnectionError(error):
+                raise
+            poolConnection.connection.rollback()
+            preparedStatements[sqlString] = None
+            return None
+        executeParameters = ', '.join('%({})s'.format(parameter) for parameter in parameters)
+        preparedStatements[sqlString] = {
+            'name': statementName,
+            'sql': 'EXECUTE {}({});'.format(statementName, executeParameters) if parameters else
+            'EXECUTE {};'.format(statementName),
+        }
+        return preparedStatements[sqlString]
+
+    @staticmethod
+    def deallocateSqlQueries(poolConnection, cursor):
+        cursor.execute('DEALLOCATE ALL;')
+        poolConnection.connection.commit()
+        poolConnection.preparedStatements.clear()
+
+    @staticmethod
+    def executeCursorQuery(idbPool, poolConnection, cursor, query: dict):
+        sqlString = IdbQuerySql.querySqlToString(query, cursor)
+        limit = idbPool.options['preparedStatements']
+        if 0 < limit and 'prepare' in query and query['prepare'] and \
+                poolConnection.connection.get_transaction_status() == extensions.TRANSACTION_STATUS_IDLE:
+            preparedStatement = IdbQuerySql.prepareSqlQuery(poolConnection, cursor, sqlString, limit)
+            if preparedStatement:
+                try:
+                    cursor.execute(preparedStatement['sql'], query['data'])
+                    return
+                except DatabaseError as error:
+                    if getattr(error, 'pgcode', None) != IdbQuerySql.preparedInvalidCode:
+                        raise
+                    # Table definition changed since PREPARE, drop all plans of this connection
+                    logging.debug("IDB prepared statements reset: " + str(error))
+                    poolConnection.connection.rollback()
+                    IdbQuerySql.deallocateSqlQueries(poolConnection, cursor)
+        cursor.execute(sqlString, query['data'])
+
     @staticmethod
     def executeSqlQuery(dbConnection: dict, query: dict,
                         returnStatusOnly: bool = False):
+        idbPool = IdbQuerySqlPool.getPool(dbConnection)
+        poolConnection = None
+        cursor = None
+        discard = False
+        failed = False
         try:
             logging.debug("IDB execute Sql query")
-            connection = psycopg2.connect(**dbConnection)
+            poolConnection = IdbQuerySql.getConnection(idbPool)
+            connection = poolConnection.connection
             cursor = connection.cursor()
             IdbQuerySql.logging(dbConnection, query, cursor)
-            cursor.execute(IdbQuerySql.querySqlToString(query, cursor), query['data'])
-            connection.commit()
+            IdbQuerySql.executeCursorQuery(idbPool, poolConnection, cursor, query)
+            IdbQuerySql.commit(connection)
             if returnStatusOnly:
                 returnValue = {"Query": cursor.rowcount}
             else:
                 returnValue = IdbQueryResponse.responseOkDict({"Query": cursor.rowcount})
         except (Exception, DatabaseError) as error:
+            discard = IdbQuerySql.isConnectionError(error)
+            failed = True
             if returnStatusOnly:
-                returnValue = {"Query": cursor.rowcount, "QueryError": str(error)}
+                returnValue = {"Query": cursor.rowcount if cursor else -1, "QueryError": str(error)}
             else:
                 returnValue = IdbQueryError.requestQueryError(str(error))
             logging.error('Query error')
             logging.error(str(error))
         finally:
-            if (connection):
+            if cursor:
                 cursor.close()
-                connection.close()
+            if poolConnection:
+                IdbQuerySql.putConnection(idbPool, poolConnection, discard, failed)
         return returnValue
 
     @staticmethod
     def fetchSqlQuery(dbConnection: dict, query: dict, commit: bool = False,
                       returnDataOnly: bool = False):
+        idbPool = IdbQuerySqlPool.getPool(dbConnection)
+        poolConnection = None
+        cursor = None
+        discard = False
+        failed = False
         try:
             logging.debug("IDB fetch Sql query")
-            connection = psycopg2.connect(**dbConnection)
+            poolConnection = IdbQuerySql.getConnection(idbPool)
+            connection = poolConnection.connection
             cursor = connection.cursor()
             IdbQuerySql.logging(dbConnection, query, cursor)
-            cursor.execute(IdbQuerySql.querySqlToString(query, cursor), query['data'])
+            IdbQuerySql.executeCursorQuery(idbPool, poolConnection, cursor, query)
             if commit:
-                connection.commit()
+                IdbQuerySql.commit(connection)
             if returnDataOnly:
-                returnValue = {"Query": cursor.rowcount, "QueryData": cursor.fetchall()}
+                returnValue = IdbQuerySql.fetchQueryData(cursor, query)
             else:
-                returnValue = IdbQueryResponse.responseOkDict(
-                    {"Query": cursor.rowcount, "QueryData": cursor.fetchall()})
+                returnValue = IdbQueryResponse.responseOkDict(IdbQuerySql.fetchQueryData(cursor, query))
+        except (Exception, DatabaseError) as error:
+            discard = IdbQuerySql.isConnectionError(error)
+            failed = True
+            returnValue = IdbQueryError.requestQueryError(str(error))
+            logging.error('Query error')
+            logging.error(str(error))
+        finally:
+            if cursor:
+                cursor.close()
+            if poolConnection:
+                IdbQuerySql.putConnection(idbPool, poolConnection, discard, failed)
+        return returnValue
+
+    @staticmethod
+    def streamSqlQuery(dbConnection: dict, query: dict, chunkSize: int = 1000) -> IdbQueryResponseStream:
+        chunkSize = max(1, int(chunkSize))
+        summary = {}
+
+        def fetchChunks():
+            idbPool = IdbQuerySqlPool.getPool(dbConnection)
+            poolConnection = None
+            cursor = None
+            discard = False
+            try:
+                logging.debug("IDB stream Sql query")
+                poolConnection = idbPool.getConnection()
+                connection = poolConnection.connection
+                cursor = connection.cursor(name='idb_stream_{}'.format(uuid.uuid4().hex))
+                cursor.itersize = chunkSize
+                IdbQuerySql.logging(dbConnection, query, cursor)
+                cursor.execute(IdbQuerySql.querySqlToString(query, cursor), query['data'])
+                rowCount = 0
+                lastKeyset = None
+                while True:
+                    rows = cursor.fetchmany(chunkSize)
+                    if not rows:
+                        break
+                    rowCount += len(rows)
+                    if 'keyset' in query:
+                        rows, lastKeyset = IdbQuerySql.keysetRows(query, rows)
+                    yield rows
+                if 'keyset' in query:
+                    summary["NextToken"] = IdbQuerySql.keysetNextToken(query, lastKeyset, rowCount)
+            except (Exception, DatabaseError) as error:
+                discard = IdbQuerySql.isConnectionError(error)
+                raise
+            finally:
+                if cursor:
+                    try:
+                        cursor.close()
+                    except (Exception, DatabaseError):
+                        discard = True
+                if poolConnection:
+                    idbPool.putConnection(poolConnection, discard)
+
+        return IdbQueryResponseStream(fetchChunks(), summary=summary)
+
+    @staticmethod
+    def copyValue(value) -> str:
+        if value is None:
+            return '\\N'
+        if isinstance(value, bool):
+            value = 'true' if value else 'false'
+        elif isinstance(value, (dict, list)):
+            value = json.dumps(value)
+        else:
+            value = str(value)
+        return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+    @staticmethod
+    def copyBulkGroup(cursor, query: dict, group: dict):
+        # Returns None when the group has to be inserted with execute_values
+        if 'pkIndex' in group:
+            groupIds = [(values[group['pkIndex']],) for values in group['values']]
+            if any(groupId[0] is None for groupId in groupIds):
+                return None
+            rows = group['values']
+        else:
+            sequenceData = dict(query['sequenceData'])
+            sequenceData['bulkCount'] = len(group['values'])
+            cursor.execute(query['sequenceSql'].as_string(cursor), sequenceData)
+            groupIds = cursor.fetchall()
+            if not groupIds or groupIds[0][0] is None:
+                return None
+            rows = [(groupId[0],) + values for groupId, values in zip(groupIds, group['values'])]
+        copyData = io.StringIO()
+        for values in rows:
+            copyData.write('\t'.join(IdbQuerySql.copyValue(value) for value in values))
+            copyData.write('\n')
+        copyData.seek(0)
+        cursor.copy_expert(group['copySql'].as_string(cursor), copyData)
+        if 'pkIndex' in group and \
+                all(isinstance(groupId[0], int) and not isinstance(groupId[0], bool) for groupId in groupIds):
+            # COPY does not call nextval, later inserts would get the supplied ids from the sequence
+            sequenceData = dict(query['sequenceData'])
+            sequenceData['bulkMaxId'] = max(groupId[0] for groupId in groupIds)
+            cursor.execute(query['sequenceAdvanceSql'].as_string(cursor), sequenceData)
+        return groupIds
+
+    @staticmethod
+    def bulkInsertSqlQuery(dbConnection: dict, query: dict):
+        idbPool = IdbQuerySqlPool.getPool(dbConnection)
+        poolConnection = None
+        cursor = None
+        discard = False
+        failed = False
+        try:
+            logging.debug("IDB bulk insert Sql query")
+            poolConnection = IdbQuerySql.getConnection(idbPool)
+            connection = poolConnection.connection
+            cursor = connection.cursor()
+            IdbQuerySql.logging(dbConnection, query, cursor)
+            itemCount = sum(len(group['index']) for group in query['bulk'])
+            itemIds = [None] * itemCount
+            for groupSql, group in zip(query['sql'], query['bulk']):
+                groupIds = None
+                if query['bulkMode'] == 'copy':
+                    groupIds = IdbQuerySql.copyBulkGroup(cursor, query, group)
+                if groupIds is None:
+                    groupIds = extras.execute_values(cursor, groupSql.as_string(cursor), group['values'],
+                                                     page_size=IdbQuerySql.bulkPageSize, fetch=True)
+                for itemIndex, groupId in zip(group['index'], groupIds):
+                    itemIds[itemIndex] = groupId
+            IdbQuerySql.commit(connection)
+            returnValue = IdbQueryResponse.responseOkDict({"Query": itemCount, "QueryData": itemIds})
         except (Exception, DatabaseError) as error:
+            discard = IdbQuerySql.isConnectionError(error)
+            failed = True
             returnValue = IdbQueryError.requestQueryError(str(error))
             logging.error('Query error')
             logging.error(str(error))
         finally:
-            if (connection):
+            if cursor:
                 cursor.close()
-                connection.close()
+            if poolConnection:
+                IdbQuerySql.putConnection(idbPool, poolConnection, discard, failed)
         return returnValue
 
 ################################################################################
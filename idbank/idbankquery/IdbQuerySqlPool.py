@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+# * ********************************************************************* *
+# *                                                                       *
+# *   Identity Bank data driver                                           *
+# *   This file is part of idbank. This project may be found at:          *
+# *   https://github.com/IdentityBank/Python_idbank.                      *
+# *                                                                       *
+# *   Copyright (C) 2020 by Identity Bank. All Rights Reserved.           *
+# *   https://www.identitybank.eu - You belong to you                     *
+# *                                                                       *
+# *   This program is free software: you can redistribute it and/or       *
+# *   modify it under the terms of the GNU Affero General Public          *
+# *   License as published by the Free Software Foundation, either        *
+# *   version 3 of the License, or (at your option) any later version.    *
+# *                                                                       *
+# *   This program is distributed in the hope that it will be useful,     *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of      *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the        *
+# *   GNU Affero General Public License for more details.                 *
+# *                                                                       *
+# *   You should have received a copy of the GNU Affero General Public    *
+# *   License along with this program. If not, see                        *
+# *   https://www.gnu.org/licenses/.                                      *
+# *                                                                       *
+# * ********************************************************************* *
+
+################################################################################
+# Import(s)                                                                    #
+################################################################################
+
+import collections
+import logging
+import threading
+import time
+
+import psycopg2
+from psycopg2 import extensions, pool
+
+
+################################################################################
+# Module                                                                       #
+################################################################################
+
+class IdbQuerySqlPoolConnection:
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.createdAt = time.monotonic()
+        self.usedAt = self.createdAt
+        # Server side prepared statements of this connection: SQL text -> statement name (None when not preparable)
+        self.preparedStatements = collections.OrderedDict()
+        self.preparedCounter = 0
+
+
+class IdbQuerySqlPool:
+    __pools = {}
+    __poolsLock = threading.Lock()
+
+    poolOptionKeys = ('pool', 'poolName')
+
+    defaultOptions = {
+        'minSize': 0,
+        'maxSize': 10,
+        'timeout': 30,
+        'idleTimeout': 300,
+        'maxLifetime': 3600,
+        'healthCheck': True,
+        'preparedStatements': 100,
+    }
+
+    def __init__(self, name: str, dbConnection: dict, options: dict = None):
+        self.name = name
+        self.dbConnection = dbConnection
+        self.options = dict(IdbQuerySqlPool.defaultOptions)
+        if options:
+            for key in IdbQuerySqlPool.defaultOptions:
+                if key in options and options[key] is not None:
+                    self.options[key] = options[key]
+        self.options['healthCheck'] = str(self.options['healthCheck']).lower() in ('yes', 'true', 't', 'y', '1')
+        for key in ('minSize', 'maxSize', 'preparedStatements'):
+            self.options[key] = int(self.options[key])
+        for key in ('timeout', 'idleTimeout', 'maxLifetime'):
+            self.options[key] = float(self.options[key])
+        self.options['maxSize'] = max(1, self.options['maxSize'])
+        self.options['minSize'] = min(max(0, self.options['minSize']), self.options['maxSize'])
+
+        self.__condition = threading.Condition()
+        self.__idle = []
+        self.__inUse = 0
+        self.__waiting = 0
+        self.__created = 0
+        self.__recycled = 0
+
+    @staticmethod
+    def getPool(dbConnection: dict) -> 'IdbQuerySqlPool':
+        connectionParameters = {key: dbConnection[key] for key in dbConnection
+                                if key not in IdbQuerySqlPool.poolOptionKeys}
+        poolName = dbConnection['poolName'] if 'poolName' in dbConnection and dbConnection['poolName'] else ''
+        poolKey = (poolName,
+                   connectionParameters.get('host'),
+                   connectionParameters.get('port'),
+                   connectionParameters.get('database'),
+                   connectionParameters.get('user'))
+        idbPool = IdbQuerySqlPool.__pools.get(poolKey)
+        if idbPool is None:
+            with IdbQuerySqlPool.__poolsLock:
+                idbPool = IdbQuerySqlPool.__pools.get(poolKey)
+                if idbPool is None:
+                    name = '{}@{}:{}/{}'.format(poolName, poolKey[1], poolKey[2], poolKey[3])
+                    poolOptions = dbConnection['pool'] if 'pool' in dbConnection else None
+                    idbPool = IdbQuerySqlPool(name, connectionParameters, poolOptions)
+                    IdbQuerySqlPool.__pools[poolKey] = idbPool
+                    logging.debug("IDB connection pool created: " + name)
+            idbPool.fill()
+        return idbPool
+
+    @staticmethod
+    def statsAll() -> dict:
+        with IdbQuerySqlPool.__poolsLock:
+            pools = list(IdbQuerySqlPool.__pools.values())
+        return {idbPool.name: idbPool.stats() for idbPool in pools}
+
+    @staticmethod
+    def closeAll():
+        with IdbQuerySqlPool.__poolsLock:
+            pools = list(IdbQuerySqlPool.__pools.values())
+            IdbQuerySqlPool.__pools.clear()
+        for idbPool in pools:
+            idbPool.close()
+
+    def stats(self) -> dict:
+        with self.__condition:
+            return {
+                'inUse': self.__inUse,
+                'idle': len(self.__idle),
+                'waiting': self.__waiting,
+                'created': self.__created,
+                'recycled': self.__recycled,
+                'minSize': self.options['minSize'],
+                'maxSize': self.options['maxSize'],
+            }
+
+    def fill(self):
+        while True:
+            with self.__condition:
+                if len(self.__idle) + self.__inUse >= self.options['minSize']:
+                    return
+                self.__inUse += 1
+            try:
+                poolConnection = self.__connect()
+            except (Exception, psycopg2.DatabaseError) as error:
+                self.__release()
+                logging.error('Connection pool error')
+                logging.error(str(error))
+                return
+            self.putConnection(poolConnection)
+
+    def getConnection(self) -> IdbQuerySqlPoolConnection:
+        deadline = time.monotonic() + self.options['timeout']
+        while True:
+            poolConnection = None
+            with self.__condition:
+                while not self.__idle and self.__inUse >= self.options['maxSize']:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise pool.PoolError('Connection pool exhausted: ' + self.name)
+                    self.__waiting += 1
+                    try:
+                        self.__condition.wait(remaining)
+                    finally:
+                        self.__waiting -= 1
+                if self.__idle:
+                    poolConnection = self.__idle.pop()
+                self.__inUse += 1
+
+            if poolConnection is None:
+                try:
+                    return self.__connect()
+                except:
+                    self.__release()
+                    raise
+            if self.__validate(poolConnection):
+                return poolConnection
+            self.__discard(poolConnection)
+
+    def putConnection(self, poolConnection: IdbQuerySqlPoolConnection, discard: bool = False):
+        connection = poolConnection.connection
+        if not discard and not connection.closed:
+            try:
+                if connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    connection.rollback()
+            except (Exception, psycopg2.DatabaseError):
+                discard = True
+        now = time.monotonic()
+        if discard or connection.closed or self.__expired(poolConnection, now):
+            self.__discard(poolConnection)
+            return
+
+        poolConnection.usedAt = now
+        staleConnections = []
+        with self.__condition:
+            self.__idle.append(poolConnection)
+            self.__inUse -= 1
+            while self.__idle and len(self.__idle) + self.__inUse > self.options['minSize'] and \
+                    now - self.__idle[0].usedAt > self.options['idleTimeout']:
+                staleConnections.append(self.__idle.pop(0))
+            self.__recycled += len(staleConnections)
+            self.__condition.notify()
+        for staleConnection in staleConnections:
+            IdbQuerySqlPool.__close(staleConnection)
+
+    def close(self):
+        with self.__condition:
+            idleConnections = self.__idle
+            self.__idle = []
+        for poolConnection in idleConnections:
+            IdbQuerySqlPool.__close(poolConnection)
+
+    def __connect(self) -> IdbQuerySqlPoolConnection:
+        poolConnection = IdbQuerySqlPoolConnection(psycopg2.connect(**self.dbConnection))
+        with self.__condition:
+            self.__created += 1
+        return poolConnection
+
+    def __expired(self, poolConnection: IdbQuerySqlPoolConnection, now: float) -> bool:
+        return 0 < self.options['maxLifetime'] < now - poolConnection.createdAt
+
+    def __validate(self, poolConnection: IdbQuerySqlPoolConnection) -> bool:
+        now = time.monotonic()
+        if poolConnection.connection.closed or self.__expired(poolConnection, now):
+            return False
+        if 0 < self.options['idleTimeout'] < now - poolConnection.usedAt:
+            return False
+        if self.options['healthCheck']:
+            try:
+                cursor = poolConnection.connection.cursor()
+                cursor.execute('SELECT 1;')
+                cursor.close()
+                poolConnection.connection.rollback()
+            except (Exception, psycopg2.DatabaseError):
+                return False
+        return True
+
+    def __release(self):
+        with self.__condition:
+            self.__inUse -= 1
+            self.__condition.notify()
+
+    def __discard(self, poolConnection: IdbQuerySqlPoolConnection):
+        IdbQuerySqlPool.__close(poolConnection)
+        with self.__condition:
+            self.__recycled += 1
+        self.__release()
+
+    @staticmethod
+    def __close(poolConnection: IdbQuerySqlPoolConnection):
+        try:
+            if not poolConnection.connection.closed:
+                poolConnection.connection.close()
+        except (Exception, psycopg2.DatabaseError):
+            pass
+
+################################################################################
+#                                End of file                                   #
+################################################################################
@@ -28,18 +28,69 @@
 # Import(s)                                                                    #
 ################################################################################
 
-import collections
+import base64
+import collections.abc
+import json
 import logging
 import re
 
 from psycopg2 import sql
 
+from idbank import IdbCache
+
 
 ################################################################################
 # Module                                                                       #
 ################################################################################
 
 class IdbSqlQueryBuilder:
+    # Minimal number of items for which putItems uses COPY in the 'auto' bulk mode
+    bulkCopyThreshold = 1000
+    # Rendered SQL of hot queries keyed by the query shape
+    sqlCache = IdbCache(1024)
+    # Query data keys holding prebuilt SQL fragments, queries using them are not cached
+    sqlCachePrebuiltKeys = ('dbTablePk', 'dbTableCondition', 'dbTableColumns', 'dbTableColumnsExtra', 'dbTableOrder',
+                            'dbTableLimit', 'dbTableOffset')
+
+    @staticmethod
+    def sqlCacheKey(queryType: str, queryData: dict, shapeKeys: tuple, shape: dict = None):
+        for key in IdbSqlQueryBuilder.sqlCachePrebuiltKeys:
+            if key in queryData:
+                return None
+        shape = dict(shape) if shape else {}
+        for key in ('account', 'dbTableSchema', 'dbTableName') + shapeKeys:
+            if key in queryData:
+                shape[key] = queryData[key]
+        if 'PaginationConfig' in shape and isinstance(shape['PaginationConfig'], dict):
+            # Only the presence of a pagination token changes the SQL, not its value
+            shape['PaginationConfig'] = dict(shape['PaginationConfig'])
+            if 'StartingToken' in shape['PaginationConfig']:
+                shape['PaginationConfig']['StartingToken'] = bool(shape['PaginationConfig']['StartingToken'])
+            # The page offset is a bound parameter, only its presence changes the SQL
+            if 'Page' in shape['PaginationConfig']:
+                shape['PaginationConfig']['Page'] = bool(shape['PaginationConfig']['Page'])
+        try:
+            return queryType + json.dumps(shape, default=str, separators=(',', ':'))
+        except (Exception, TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def generateSqlCachedQuery(cacheKey, data: dict):
+        if cacheKey is None:
+            return None
+        cachedQuery = IdbSqlQueryBuilder.sqlCache.get(cacheKey)
+        if cachedQuery is None:
+            return None
+        query = {key: value for key, value in cachedQuery.items() if key != 'sqlText'}
+        query['sql'] = sql.SQL(cachedQuery['sqlText'])
+        query['data'] = data
+        return query
+
+    @staticmethod
+    def cacheSqlQuery(query: dict, sqlText: str):
+        cachedQuery = {key: value for key, value in query.items() if key not in ('sql', 'data', 'cacheKey')}
+        cachedQuery['sqlText'] = sqlText
+        IdbSqlQueryBuilder.sqlCache.put(query['cacheKey'], cachedQuery)
 
     @staticmethod
     def generateSqlSetRelationBusiness2People(queryData: dict) -> str:
@@ -107,15 +158,18 @@ class IdbSqlQueryBuilder:
             queryData['selectIdentifier'] = sql.SQL('*')
         else:
             queryData['selectIdentifier'] = queryData['pidIdentifier']
+        queryData['dbTableColumnsExtra'] = sql.SQL('')
+        if 'dbTableCountAll' in queryData and queryData['dbTableCountAll']:
+            queryData = IdbSqlQueryBuilder.generateSqlCountAllColumn(queryData)
         querySql = sql.SQL(
             """SELECT
-            {selectIdentifier}
+            {selectIdentifier}{dbTableColumnsExtra}
             FROM {dbTableSchemaIdentifier}.{dbTableNameIdentifier}
             {dbTableCondition}
             ORDER BY {pidIdentifier} ASC
             {dbTableLimit} {dbTableOffset};""").format(
             **queryData)
-        return {'sql': querySql, 'data': queryData}
+        return IdbSqlQueryBuilder.generateSqlFetchQuery(querySql, queryData)
 
     @staticmethod
     def generateSqlGetRelatedBusinesses(queryData: dict) -> str:
@@ -124,15 +178,18 @@ class IdbSqlQueryBuilder:
             queryData['selectIdentifier'] = sql.SQL('*')
         else:
             queryData['selectIdentifier'] = queryData['bidIdentifier']
+        queryData['dbTableColumnsExtra'] = sql.SQL('')
+        if 'dbTableCountAll' in queryData and queryData['dbTableCountAll']:
+            queryData = IdbSqlQueryBuilder.generateSqlCountAllColumn(queryData)
         querySql = sql.SQL(
             """SELECT
-            {selectIdentifier}
+            {selectIdentifier}{dbTableColumnsExtra}
             FROM {dbTableSchemaIdentifier}.{dbTableNameIdentifier}
             {dbTableCondition}
             ORDER BY {bidIdentifier} ASC
             {dbTableLimit} {dbTableOffset};""").format(
             **queryData)
-        return {'sql': querySql, 'data': queryData}
+        return IdbSqlQueryBuilder.generateSqlFetchQuery(querySql, queryData)
 
     @staticmethod
     def convertBusinessAccountTypeToSql(type: str) -> str:
@@ -243,7 +300,7 @@ class IdbSqlQueryBuilder:
         return {'sql': returnSql, 'data': queryData}
 
     @staticmethod
-    def generateSqlBusinessUpdateDataTypesAdd(actions: collections.Iterable, queryData: dict):
+    def generateSqlBusinessUpdateDataTypesAdd(actions: collections.abc.Iterable, queryData: dict):
         returnSqlArray = list()
         for action in actions:
             queryData["columnName"] = sql.Identifier(action['uuid'])
@@ -256,7 +313,7 @@ class IdbSqlQueryBuilder:
         return returnSqlArray
 
     @staticmethod
-    def generateSqlBusinessUpdateDataTypesDrop(actions: collections.Iterable, queryData: dict):
+    def generateSqlBusinessUpdateDataTypesDrop(actions: collections.abc.Iterable, queryData: dict):
         returnSqlArray = list()
         for action in actions:
             queryData["columnName"] = sql.Identifier(action['uuid'])
@@ -267,7 +324,7 @@ class IdbSqlQueryBuilder:
         return returnSqlArray
 
     @staticmethod
-    def generateSqlBusinessUpdateDataTypesRename(actions: collections.Iterable, queryData: dict):
+    def generateSqlBusinessUpdateDataTypesRename(actions: collections.abc.Iterable, queryData: dict):
         returnSqlArray = list()
         for action in actions:
             queryData["fromColumnName"] = sql.Identifier(action['from'])
@@ -294,7 +351,7 @@ class IdbSqlQueryBuilder:
         return action
 
     @staticmethod
-    def generateSqlBusinessUpdateDataTypesUpdate(actions: collections.Iterable, queryData: dict):
+    def generateSqlBusinessUpdateDataTypesUpdate(actions: collections.abc.Iterable, queryData: dict):
         returnSqlArray = list()
         for action in actions:
             cast = IdbSqlQueryBuilder.convertBusinessAccountTypeToSqlCast(action['type'])
@@ -331,14 +388,47 @@ class IdbSqlQueryBuilder:
         queryData['dbTableName'] = queryData['dbTableName'].format(**queryData)
         queryData['dbTableNameIdentifier'] = sql.Identifier(queryData['dbTableName'])
         queryData = IdbSqlQueryBuilder.generateSqlBusinessTableCondition(queryData)
+        if 'approximate' in queryData and queryData['approximate']:
+            return IdbSqlQueryBuilder.generateSqlCountAllItemsEstimate(queryData)
         return IdbSqlQueryBuilder.generateSqlCountAllItems(queryData)
 
+    @staticmethod
+    def generateSqlCountAllItemsEstimate(queryData: dict) -> dict:
+        # Without a filter the count is taken from table statistics, otherwise from the planner estimate
+        exactQuery = IdbSqlQueryBuilder.generateSqlCountAllItems(queryData)
+        if queryData['dbTableCondition'] == sql.SQL(''):
+            queryData['dbTableRegclass'] = '"{}"."{}"'.format(queryData['dbTableSchema'].replace('"', '""'),
+                                                              queryData['dbTableName'].replace('"', '""'))
+            querySql = sql.SQL(
+                """SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass({dbTableRegclassPlaceholder});""").format(
+                dbTableRegclassPlaceholder=sql.Placeholder('dbTableRegclass'))
+            estimate = 'statistics'
+        else:
+            querySql = sql.SQL(
+                """EXPLAIN (FORMAT JSON) SELECT 1 FROM {dbTableSchemaIdentifier}.{dbTableNameIdentifier} {dbTableCondition};""").format(
+                **queryData)
+            estimate = 'plan'
+        return {'sql': querySql, 'data': queryData, 'estimate': estimate, 'exactSql': exactQuery['sql']}
+
     @staticmethod
     def generateSqlBusinessPutItem(queryData: dict) -> str:
         return IdbSqlQueryBuilder.generateSqlGenericPutItem(queryData)
 
     @staticmethod
     def generateSqlGenericPutItem(queryData: dict) -> str:
+        cacheKey = None
+        if 'data' in queryData and isinstance(queryData['data'], dict):
+            dbTableValues = {}
+            if 'idbId' in queryData and isinstance(queryData['idbId'], int):
+                dbTableValues['col_id'] = queryData['idbId']
+            for columnIndex, columnValue in enumerate(queryData['data'].values()):
+                dbTableValues['col_{}'.format(columnIndex + 1)] = columnValue
+            cacheKey = IdbSqlQueryBuilder.sqlCacheKey('putItem', queryData, ('dbTableColumnPk',),
+                                                      {'columns': list(queryData['data'].keys()),
+                                                       'id': 'col_id' in dbTableValues})
+            query = IdbSqlQueryBuilder.generateSqlCachedQuery(cacheKey, dbTableValues)
+            if query:
+                return query
         queryData['businessDbId'] = queryData['account']
         queryData['dbTableName'] = queryData['dbTableName'].format(**queryData)
         queryData['dbTableNameIdentifier'] = sql.Identifier(queryData['dbTableName'])
@@ -370,7 +460,7 @@ class IdbSqlQueryBuilder:
             querySql = sql.SQL(
                 """INSERT INTO {dbTableSchemaIdentifier}.{dbTableNameIdentifier} ({dbTableColumns}) VALUES ({dbTableValuesPlaceholders}) RETURNING {dbTableColumnPk};""").format(
                 **queryData)
-            return {'sql': querySql, 'data': dbTableValues}
+            return {'sql': querySql, 'data': dbTableValues, 'cacheKey': cacheKey, 'prepare': cacheKey is not None}
         else:
             raise Exception('Bad query.')
 
@@ -381,31 +471,60 @@ class IdbSqlQueryBuilder:
         queryData['dbTableNameIdentifier'] = sql.Identifier(queryData['dbTableName'])
         if 'dbTableColumnPk' not in queryData:
             queryData['dbTableColumnPk'] = 'id'
-        queryData['dbTableColumnPk'] = sql.Identifier(queryData['dbTableColumnPk'])
+        dbTableColumnPk = queryData['dbTableColumnPk']
+        queryData['dbTableColumnPk'] = sql.Identifier(dbTableColumnPk)
         if 'data' in queryData and isinstance(queryData['data'], list):
+            # Items with the same columns are inserted with one multi-row statement
+            itemGroups = collections.OrderedDict()
+            for itemIndex, item in enumerate(queryData['data']):
+                columns = tuple(sorted(item.keys()))
+                if columns not in itemGroups:
+                    itemGroups[columns] = {'index': [], 'values': []}
+                itemGroups[columns]['index'].append(itemIndex)
+                itemGroups[columns]['values'].append(tuple(item[column] for column in columns))
+
+            bulkMode = queryData['bulkMode'] if 'bulkMode' in queryData and queryData['bulkMode'] else 'auto'
+            if bulkMode == 'auto':
+                bulkMode = 'copy' if len(queryData['data']) >= IdbSqlQueryBuilder.bulkCopyThreshold else 'values'
+
             sqlQueryList = []
-            dbTableValues = {}
-            itemIndex = 0
-            for item in queryData['data']:
-                itemIndex += 1
-                queryData['dbTableColumns'] = []
-                queryData['dbTableValuesPlaceholders'] = []
-                columnIndex = 0
-                for columnName, columnValue in item.items():
-                    columnIndex += 1
-                    queryData['dbTableColumns'].append(columnName)
-                    columnPlaceholder = 'col_{}_{}'.format(itemIndex, columnIndex)
-                    queryData['dbTableValuesPlaceholders'].append(columnPlaceholder)
-                    dbTableValues[columnPlaceholder] = columnValue
-
-                queryData['dbTableColumns'] = sql.SQL(', ').join(map(sql.Identifier, queryData['dbTableColumns']))
-                queryData['dbTableValuesPlaceholders'] = sql.SQL(', ').join(
-                    map(sql.Placeholder, queryData['dbTableValuesPlaceholders']))
+            for columns, itemGroup in itemGroups.items():
+                queryData['dbTableColumns'] = sql.SQL(', ').join(map(sql.Identifier, columns))
                 querySql = sql.SQL(
-                    """INSERT INTO {dbTableSchemaIdentifier}.{dbTableNameIdentifier} ({dbTableColumns}) VALUES ({dbTableValuesPlaceholders}) RETURNING {dbTableColumnPk};""").format(
+                    """INSERT INTO {dbTableSchemaIdentifier}.{dbTableNameIdentifier} ({dbTableColumns}) VALUES %s RETURNING {dbTableColumnPk};""").format(
                     **queryData)
                 sqlQueryList.append(querySql)
-            return {'sql': sqlQueryList, 'data': dbTableValues}
+                if bulkMode == 'copy':
+                    # Items with the primary key keep their ids, the others get ids reserved from the sequence
+                    if dbTableColumnPk in columns:
+                        itemGroup['pkIndex'] = columns.index(dbTableColumnPk)
+                        copyColumns = columns
+                    else:
+                        copyColumns = (dbTableColumnPk,) + columns
+                    queryData['dbTableColumnsCopy'] = sql.SQL(', ').join(map(sql.Identifier, copyColumns))
+                    itemGroup['copySql'] = sql.SQL(
+                        """COPY {dbTableSchemaIdentifier}.{dbTableNameIdentifier} ({dbTableColumnsCopy}) FROM STDIN;""").format(
+                        **queryData)
+
+            query = {'sql': sqlQueryList, 'data': {}, 'bulk': list(itemGroups.values()), 'bulkMode': bulkMode}
+            if bulkMode == 'copy':
+                query['sequenceSql'] = sql.SQL(
+                    """SELECT nextval(pg_get_serial_sequence({bulkTable}, {bulkColumn})) FROM generate_series(1, {bulkCount});""").format(
+                    bulkTable=sql.Placeholder('bulkTable'),
+                    bulkColumn=sql.Placeholder('bulkColumn'),
+                    bulkCount=sql.Placeholder('bulkCount'))
+                # The sequence is moved past the supplied ids, it is never moved back
+                query['sequenceAdvanceSql'] = sql.SQL(
+                    """SELECT setval(pg_get_serial_sequence({bulkTable}, {bulkColumn}), GREATEST({bulkMaxId}, nextval(pg_get_serial_sequence({bulkTable}, {bulkColumn}))));""").format(
+                    bulkTable=sql.Placeholder('bulkTable'),
+                    bulkColumn=sql.Placeholder('bulkColumn'),
+                    bulkMaxId=sql.Placeholder('bulkMaxId'))
+                query['sequenceData'] = {
+                    'bulkTable': '"{}"."{}"'.format(queryData['dbTableSchema'].replace('"', '""'),
+                                                    queryData['dbTableName'].replace('"', '""')),
+                    'bulkColumn': dbTableColumnPk,
+                }
+            return query
         else:
             raise Exception('Bad query.')
 
@@ -415,13 +534,19 @@ class IdbSqlQueryBuilder:
 
     @staticmethod
     def generateSqlGenericGetItem(queryData: dict) -> str:
+        cacheKey = None
+        if 'idbId' in queryData and isinstance(queryData['idbId'], int):
+            cacheKey = IdbSqlQueryBuilder.sqlCacheKey('getItem', queryData, ('dbTableColumnPk', 'DataTypes'))
+            queryData['dbTablePkValue'] = queryData['idbId']
+            queryData['dbTablePk'] = sql.Placeholder('dbTablePkValue')
+        query = IdbSqlQueryBuilder.generateSqlCachedQuery(cacheKey, queryData)
+        if query:
+            return query
         queryData['businessDbId'] = queryData['account']
         queryData['dbTableName'] = queryData['dbTableName'].format(**queryData)
         queryData['dbTableNameIdentifier'] = sql.Identifier(queryData['dbTableName'])
         if 'dbTableColumnPk' not in queryData:
             queryData['dbTableColumnPk'] = 'id'
-        if 'idbId' in queryData and isinstance(queryData['idbId'], int):
-            queryData['dbTablePk'] = sql.SQL(str(queryData['idbId']))
         if 'dbTableColumns' not in queryData:
             queryData['dbTableColumns'] = sql.SQL('*')
         if 'DataTypes' in queryData and queryData['DataTypes'] and \
@@ -434,7 +559,7 @@ class IdbSqlQueryBuilder:
         querySql = sql.SQL(
             """SELECT {dbTableColumns} FROM {dbTableSchemaIdentifier}.{dbTableNameIdentifier} WHERE {dbTableColumnPk} = {dbTablePk};""").format(
             **queryData)
-        return {'sql': querySql, 'data': queryData}
+        return {'sql': querySql, 'data': queryData, 'cacheKey': cacheKey, 'prepare': cacheKey is not None}
 
     @staticmethod
     def generateSqlBusinessUpdateItem(queryData: dict) -> str:
@@ -442,17 +567,27 @@ class IdbSqlQueryBuilder:
 
     @staticmethod
     def generateSqlGenericUpdateItem(queryData: dict) -> str:
+        cacheKey = None
+        dbTableValues = {}
+        if 'idbId' in queryData and isinstance(queryData['idbId'], int):
+            if 'data' in queryData and isinstance(queryData['data'], dict):
+                cacheKey = IdbSqlQueryBuilder.sqlCacheKey('updateItem', queryData, ('dbTableColumnPk',),
+                                                          {'columns': list(queryData['data'].keys())})
+                for columnIndex, columnValue in enumerate(queryData['data'].values()):
+                    dbTableValues['col_{}'.format(columnIndex + 1)] = columnValue
+            dbTableValues['dbTablePkValue'] = queryData['idbId']
+            queryData['dbTablePk'] = sql.Placeholder('dbTablePkValue')
+        query = IdbSqlQueryBuilder.generateSqlCachedQuery(cacheKey, dbTableValues)
+        if query:
+            return query
         queryData['businessDbId'] = queryData['account']
         queryData['dbTableName'] = queryData['dbTableName'].format(**queryData)
         queryData['dbTableNameIdentifier'] = sql.Identifier(queryData['dbTableName'])
         if 'dbTableColumnPk' not in queryData:
             queryData['dbTableColumnPk'] = 'id'
-        if 'idbId' in queryData and isinstance(queryData['idbId'], int):
-            queryData['dbTablePk'] = sql.SQL(str(queryData['idbId']))
 
         columnIndex = 0
         if 'data' in queryData and isinstance(queryData['data'], dict):
-            dbTableValues = {}
             queryData['dbTableColumnsValues'] = []
 
             for columnName, columnValue in queryData['data'].items():
@@ -468,7 +603,7 @@ class IdbSqlQueryBuilder:
         querySql = sql.SQL(
             """UPDATE {dbTableSchemaIdentifier}.{dbTableNameIdentifier} SET {dbTableColumnsValues} WHERE {dbTableColumnPk} = {dbTablePk};""").format(
             **queryData)
-        return {'sql': querySql, 'data': dbTableValues}
+        return {'sql': querySql, 'data': dbTableValues, 'cacheKey': cacheKey, 'prepare': cacheKey is not None}
 
     @staticmethod
     def generateSqlBusinessDeleteItem(queryData: dict) -> str:
@@ -476,19 +611,25 @@ class IdbSqlQueryBuilder:
 
     @staticmethod
     def generateSqlGenericDeleteItem(queryData: dict) -> str:
+        cacheKey = None
+        if 'idbId' in queryData and isinstance(queryData['idbId'], int):
+            cacheKey = IdbSqlQueryBuilder.sqlCacheKey('deleteItem', queryData, ('dbTableColumnPk',))
+            queryData['dbTablePkValue'] = queryData['idbId']
+            queryData['dbTablePk'] = sql.Placeholder('dbTablePkValue')
+        query = IdbSqlQueryBuilder.generateSqlCachedQuery(cacheKey, queryData)
+        if query:
+            return query
         queryData['businessDbId'] = queryData['account']
         queryData['dbTableName'] = queryData['dbTableName'].format(**queryData)
         queryData['dbTableNameIdentifier'] = sql.Identifier(queryData['dbTableName'])
         if 'dbTableColumnPk' not in queryData:
             queryData['dbTableColumnPk'] = 'id'
         queryData['dbTableColumnPk'] = sql.Identifier(queryData['dbTableColumnPk'])
-        if 'idbId' in queryData and isinstance(queryData['idbId'], int):
-            queryData['dbTablePk'] = sql.SQL(str(queryData['idbId']))
 
         querySql = sql.SQL(
             """DELETE FROM {dbTableSchemaIdentifier}.{dbTableNameIdentifier} WHERE {dbTableColumnPk} = {dbTablePk};""").format(
             **queryData)
-        return {'sql': querySql, 'data': queryData}
+        return {'sql': querySql, 'data': queryData, 'cacheKey': cacheKey, 'prepare': cacheKey is not None}
 
     @staticmethod
     def orderString(type: str) -> str:
@@ -539,6 +680,14 @@ class IdbSqlQueryBuilder:
     def generateSqlBusinessTableCondition(queryData: dict) -> str:
         return IdbSqlQueryBuilder.generateSqlGenericTableCondition(queryData)
 
+    @staticmethod
+    def generateSqlExpressionValues(queryData: dict) -> dict:
+        expressionValue = {}
+        for key in queryData['ExpressionAttributeValues'].keys():
+            keyItem = ('{' + key).replace('{:', 'sqlValueIdb_')
+            expressionValue[keyItem] = queryData['ExpressionAttributeValues'][key]
+        return expressionValue
+
     @staticmethod
     def generateSqlGenericTableCondition(queryData: dict) -> str:
         expressionNames = {}
@@ -563,10 +712,9 @@ class IdbSqlQueryBuilder:
                 for key in queryData['ExpressionAttributeNames'].keys():
                     expressionNames[('{' + key).replace('{#', 'sqlIdentifierIdb_')] = sql.Identifier(
                         queryData['ExpressionAttributeNames'][key])
-                for key in queryData['ExpressionAttributeValues'].keys():
-                    keyItem = ('{' + key).replace('{:', 'sqlValueIdb_')
+                expressionValue = IdbSqlQueryBuilder.generateSqlExpressionValues(queryData)
+                for keyItem in expressionValue.keys():
                     expressionNames[keyItem] = sql.Placeholder(keyItem)
-                    expressionValue[keyItem] = queryData['ExpressionAttributeValues'][key]
 
             queryData['dbTableCondition'] = (queryData['dbTableCondition']).format(**expressionNames)
 
@@ -601,12 +749,14 @@ class IdbSqlQueryBuilder:
                     queryData['dbTableLimit'] = int(queryData['PaginationConfig']['PageSize'])
                 else:
                     queryData['dbTableLimit'] = sql.SQL('')
+                    queryData['dbTableLimitValue'] = None
                     queryData['dbTableOffset'] = sql.SQL('')
                     return queryData
             if 'Page' in queryData['PaginationConfig'] and queryData['PaginationConfig']['Page']:
                 queryData['dbTableOffset'] = int(queryData['PaginationConfig']['Page']) * queryData['dbTableLimit']
         if 'dbTableLimit' not in queryData:
             queryData['dbTableLimit'] = 2
+        queryData['dbTableLimitValue'] = queryData['dbTableLimit'] if isinstance(queryData['dbTableLimit'], int) else None
         if queryData['dbTableLimit'] == 0:
             queryData['dbTableLimit'] = sql.SQL('')
         else:
@@ -615,8 +765,122 @@ class IdbSqlQueryBuilder:
         if 'dbTableOffset' not in queryData:
             queryData['dbTableOffset'] = sql.SQL('')
         else:
-            queryData['dbTableOffset'] = sql.SQL(str(queryData['dbTableOffset']))
-            queryData['dbTableOffset'] = sql.SQL('OFFSET {dbTableOffset}').format(**queryData)
+            # Bound parameter, all the pages of a query share the rendered SQL and the prepared statement
+            queryData['sqlOffsetIdb'] = queryData['dbTableOffset']
+            queryData['dbTableOffset'] = sql.SQL('OFFSET {}').format(sql.Placeholder('sqlOffsetIdb'))
+        return queryData
+
+    @staticmethod
+    def generateSqlCountAllColumn(queryData: dict) -> str:
+        # Count of all matching rows returned as the last column of the page query
+        if 'CountAllLimit' in queryData and queryData['CountAllLimit']:
+            countAllLimit = int(queryData['CountAllLimit'])
+            queryData['dbTableCountAllLimit'] = sql.SQL('LIMIT {}').format(sql.Literal(countAllLimit + 1))
+        else:
+            countAllLimit = None
+            queryData['dbTableCountAllLimit'] = sql.SQL('')
+        queryData['dbTableCountAllIdentifier'] = sql.Identifier('__idb_count')
+        countAllSql = sql.SQL(
+            """SELECT COUNT(*) FROM (SELECT 1 FROM {dbTableSchemaIdentifier}.{dbTableNameIdentifier} {dbTableCondition} {dbTableCountAllLimit}) AS {dbTableCountAllIdentifier}""").format(
+            **queryData)
+        if 'dbTableColumnsExtra' not in queryData:
+            queryData['dbTableColumnsExtra'] = sql.SQL('')
+        queryData['dbTableColumnsExtra'] = sql.SQL('{}, ({}) AS {}').format(queryData['dbTableColumnsExtra'],
+                                                                           countAllSql,
+                                                                           sql.Identifier('__idb_count_all'))
+        queryData['dbTableCountAll'] = {
+            'sql': sql.SQL('{};').format(countAllSql),
+            'limit': countAllLimit,
+        }
+        return queryData
+
+    @staticmethod
+    def encodeKeysetToken(values: list) -> str:
+        tokenData = json.dumps({'v': values}, default=str, separators=(',', ':'))
+        return base64.urlsafe_b64encode(tokenData.encode('UTF-8')).decode('ascii')
+
+    @staticmethod
+    def decodeKeysetToken(token: str) -> list:
+        try:
+            tokenData = json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('UTF-8'))
+            return tokenData['v']
+        except (Exception, ValueError):
+            raise Exception('Bad pagination token.')
+
+    @staticmethod
+    def generateSqlKeysetValues(queryData: dict, columns: int) -> dict:
+        values = IdbSqlQueryBuilder.decodeKeysetToken(queryData['PaginationConfig']['StartingToken'])
+        if not isinstance(values, list) or len(values) != columns:
+            raise Exception('Bad pagination token.')
+        return {'sqlKeysetIdb_{}'.format(index): value for index, value in enumerate(values)}
+
+    @staticmethod
+    def generateSqlKeysetPagination(queryData: dict) -> str:
+        # Seek pagination: continue after the last seen (order columns, id) instead of using OFFSET
+        if not ('PaginationConfig' in queryData and queryData['PaginationConfig'] and
+                (('StartingToken' in queryData['PaginationConfig'] and
+                  queryData['PaginationConfig']['StartingToken']) or
+                 ('Keyset' in queryData['PaginationConfig'] and queryData['PaginationConfig']['Keyset']))):
+            return queryData
+
+        keysetColumns = []
+        if 'OrderByDataTypes' in queryData and queryData['OrderByDataTypes']:
+            for column in queryData['OrderByDataTypes'].keys():
+                keysetColumns.append((column, IdbSqlQueryBuilder.orderString(queryData['OrderByDataTypes'][column])))
+        if 'id' not in [column for column, order in keysetColumns]:
+            keysetColumns.append(('id', keysetColumns[-1][1] if keysetColumns else 'ASC'))
+
+        # NULLs are placed explicitly after the values (ascending) or before them (descending),
+        # the seek condition below relies on it
+        nullsOrder = {'ASC': 'NULLS LAST', 'DESC': 'NULLS FIRST'}
+        queryData['dbTableOrder'] = sql.SQL('ORDER BY {}').format(sql.SQL(', ').join(
+            sql.SQL("{0} {1} {2}").format(sql.Identifier(column), sql.SQL(order), sql.SQL(nullsOrder[order]))
+            for column, order in keysetColumns))
+        queryData['dbTableOffset'] = sql.SQL('')
+        if 'dbTableColumnsExtra' not in queryData:
+            queryData['dbTableColumnsExtra'] = sql.SQL('')
+        queryData['dbTableColumnsExtra'] = sql.SQL('{}, {}').format(queryData['dbTableColumnsExtra'], sql.SQL(', ').join(
+            sql.SQL('{} AS {}').format(sql.Identifier(column), sql.Identifier('__idb_keyset_{}'.format(index)))
+            for index, (column, order) in enumerate(keysetColumns)))
+        queryData['dbTableKeyset'] = {
+            'columns': len(keysetColumns),
+            'limit': queryData['dbTableLimitValue'] if 'dbTableLimitValue' in queryData else None,
+        }
+
+        if 'StartingToken' in queryData['PaginationConfig'] and queryData['PaginationConfig']['StartingToken']:
+            keysetValues = IdbSqlQueryBuilder.generateSqlKeysetValues(queryData, len(keysetColumns))
+            placeholders = [sql.Placeholder(key) for key in keysetValues.keys()]
+            queryData.update(keysetValues)
+            identifiers = [sql.Identifier(column) for column, order in keysetColumns]
+
+            # The order columns may be NULL (only id is not), the conditions do not depend on the token values
+            # so the cached query serves every page: a NULL follows all the values ascending and precedes them
+            # descending
+            def equalCondition(index):
+                if keysetColumns[index][0] == 'id':
+                    return sql.SQL('{} = {}').format(identifiers[index], placeholders[index])
+                return sql.SQL('{} IS NOT DISTINCT FROM {}').format(identifiers[index], placeholders[index])
+
+            def afterCondition(index):
+                order = keysetColumns[index][1]
+                if keysetColumns[index][0] == 'id':
+                    return sql.SQL('{} {} {}').format(identifiers[index], sql.SQL('<' if order == 'DESC' else '>'),
+                                                      placeholders[index])
+                if order == 'DESC':
+                    return sql.SQL('({0} < {1} OR ({1} IS NULL AND {0} IS NOT NULL))').format(identifiers[index],
+                                                                                            placeholders[index])
+                return sql.SQL('({0} > {1} OR ({0} IS NULL AND {1} IS NOT NULL))').format(identifiers[index],
+                                                                                        placeholders[index])
+
+            keysetCondition = sql.SQL(' OR ').join(
+                sql.SQL('({})').format(sql.SQL(' AND ').join(
+                    [equalCondition(equalIndex) for equalIndex in range(index)] + [afterCondition(index)]))
+                for index in range(len(keysetColumns)))
+            if queryData['dbTableCondition'] == sql.SQL(''):
+                queryData['dbTableCondition'] = sql.SQL('WHERE ({})').format(keysetCondition)
+            else:
+                queryData['dbTableCondition'] = sql.SQL('{} AND ({})').format(queryData['dbTableCondition'],
+                                                                              keysetCondition)
         return queryData
 
     @staticmethod
@@ -625,6 +889,22 @@ class IdbSqlQueryBuilder:
 
     @staticmethod
     def generateSqlGenericFindItems(queryData: dict) -> str:
+        cacheKey = IdbSqlQueryBuilder.sqlCacheKey('findItems', queryData,
+                                                  ('DataTypes', 'FilterExpression', 'ExpressionAttributeNames',
+                                                   'dbTableConditionString', 'OrderByDataTypes', 'dbTableCountAll',
+                                                   'CountAllLimit', 'PaginationConfig'))
+        query = IdbSqlQueryBuilder.generateSqlCachedQuery(cacheKey, queryData)
+        if query:
+            if 'FilterExpression' in queryData and queryData['FilterExpression'] and \
+                    'ExpressionAttributeNames' in queryData and queryData['ExpressionAttributeNames']:
+                queryData.update(IdbSqlQueryBuilder.generateSqlExpressionValues(queryData))
+            if 'keyset' in query and queryData['PaginationConfig'].get('StartingToken'):
+                queryData.update(IdbSqlQueryBuilder.generateSqlKeysetValues(queryData, query['keyset']['columns']))
+            elif queryData.get('PaginationConfig') and queryData['PaginationConfig'].get('Page') and \
+                    queryData['PaginationConfig'].get('PageSize'):
+                queryData['sqlOffsetIdb'] = int(queryData['PaginationConfig']['Page']) * \
+                                            int(queryData['PaginationConfig']['PageSize'])
+            return query
         queryData['businessDbId'] = queryData['account']
         queryData['dbTableName'] = queryData['dbTableName'].format(**queryData)
         queryData['dbTableNameIdentifier'] = sql.Identifier(queryData['dbTableName'])
@@ -638,14 +918,31 @@ class IdbSqlQueryBuilder:
             queryData['dbTableColumns'] = sql.SQL(', ').join(
                 sql.Identifier(column) for column in queryData['DataTypes']['database'])
 
+        if 'dbTableColumnsExtra' not in queryData:
+            queryData['dbTableColumnsExtra'] = sql.SQL('')
+
         queryData = IdbSqlQueryBuilder.generateSqlColumnOrder(queryData)
         queryData = IdbSqlQueryBuilder.generateSqlPagination(queryData)
         queryData = IdbSqlQueryBuilder.generateSqlBusinessTableCondition(queryData)
+        if 'dbTableCountAll' in queryData and queryData['dbTableCountAll']:
+            queryData = IdbSqlQueryBuilder.generateSqlCountAllColumn(queryData)
+        queryData = IdbSqlQueryBuilder.generateSqlKeysetPagination(queryData)
 
         querySql = sql.SQL(
-            """SELECT {dbTableColumns} FROM {dbTableSchemaIdentifier}.{dbTableNameIdentifier} {dbTableCondition} {dbTableOrder} {dbTableLimit} {dbTableOffset};""").format(
+            """SELECT {dbTableColumns}{dbTableColumnsExtra} FROM {dbTableSchemaIdentifier}.{dbTableNameIdentifier} {dbTableCondition} {dbTableOrder} {dbTableLimit} {dbTableOffset};""").format(
             **queryData)
-        return {'sql': querySql, 'data': queryData}
+        query = IdbSqlQueryBuilder.generateSqlFetchQuery(querySql, queryData)
+        query['cacheKey'] = cacheKey
+        return query
+
+    @staticmethod
+    def generateSqlFetchQuery(querySql, queryData: dict) -> dict:
+        query = {'sql': querySql, 'data': queryData}
+        if 'dbTableCountAll' in queryData and isinstance(queryData['dbTableCountAll'], dict):
+            query['countAll'] = queryData['dbTableCountAll']
+        if 'dbTableKeyset' in queryData:
+            query['keyset'] = queryData['dbTableKeyset']
+        return query
 
     @staticmethod
     def generateSqlGenericDeleteItems(queryData: dict) -> str:
@@ -30,23 +30,27 @@
 
 from .IdbSqlQueryBuilder import IdbSqlQueryBuilder
 from .IdbQueryResponse import IdbQueryResponse
+from .IdbQueryResponseStream import IdbQueryResponseStream
 from .IdbQueryError import IdbQueryError
 from .IdbQueryBusiness import IdbQueryBusiness
 from .IdbQueryPeople import IdbQueryPeople
 from .IdbQueryRelation import IdbQueryRelation
 from .IdbQuery import IdbQuery
+from .IdbQuerySqlPool import IdbQuerySqlPool
 
 ################################################################################
 # Module                                                                       #
 ################################################################################
 
 all__ = ('IdbQueryResponse',
+         'IdbQueryResponseStream',
          'IdbQueryBusiness',
          'IdbQueryPeople',
          'IdbQueryRelation',
          'IdbQuery',
          'IdbSqlQueryBuilder',
-         'IdbQueryError')
+         'IdbQueryError',
+         'IdbQuerySqlPool')
 
 ################################################################################
 #                                End of file                                   #
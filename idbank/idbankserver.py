@@ -38,7 +38,7 @@ import argparse
 import logging
 import re
 
-from idbank import IdbServer
+from idbank import IdbServer, IdbConfig
 
 ################################################################################
 # Module Variable(s)                                                           #
@@ -85,6 +85,8 @@ def parameters():
 def main(argv=sys.argv):
     signal.signal(signal.SIGINT, handler)
     signal.signal(signal.SIGTERM, handler)
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, reloadHandler)
     args = parameters()
     logging.info('* Arguments:')
     for key, value in args.items():
@@ -107,6 +109,10 @@ def handler(signum, frame):
     sys.exit()
 
 
+def reloadHandler(signum, frame):
+    IdbConfig.reloadConfig()
+
+
 # Execute main function
 if __name__ == '__main__':
     main()
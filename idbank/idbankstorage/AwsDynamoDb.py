@@ -29,56 +29,77 @@
 ################################################################################
 
 import json
-import decimal
 import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import boto3
+from boto3.dynamodb.types import Binary, TypeSerializer, TypeDeserializer
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
-from idbank import IdbCommon, IdbConfig
-from .IdbankStorageBase import IdbankStorageBase
-from .IdbankStorageFormat import IdbankStorageFormat, IdbankStorageType, IdbankStorageInfo, IdbankStorageTags
-from .IdbankStorageEngine import IdbankStorageEngine
+from idbank import IdbCache, IdbCommon, IdbConfig
+from .IdbankStorageItems import IdbankStorageItems, DecimalEncoder
+from .IdbankStorageResult import IdbankStorageResult
+from .IdbankStorageMetrics import IdbankStorageMetrics
+from .IdbankStorageRetry import IdbankStorageRetry, IdbankStorageRateLimiter
 
 
 ################################################################################
 # Module                                                                       #
 ################################################################################
 
-class DecimalEncoder(json.JSONEncoder):
-    def default(self, o):
-        if isinstance(o, decimal.Decimal):
-            if o % 1 > 0:
-                return float(o)
-            else:
-                return int(o)
-        return super(DecimalEncoder, self).default(o)
-
-
-class AwsDynamoDb(IdbankStorageBase):
+class AwsDynamoDb(IdbankStorageItems):
     region_name = None
     aws_access_key_id = None
     aws_secret_access_key = None
     dynamodbClient = None
     dynamodbResource = None
-
-    dbKeyNames = {
-        'account': 'idbaccount',
-        'id': 'idbid',
-        'public': 'idbpublic',
-        'protected': 'idbprotected',
-        'private': 'idbprivate'
-    }
-
-    attributesKeyNames = {
-        'metadata': 'idbmetadata',
-        'delete': 'idbdelete',
-        'item': 'idbitem',
-        'events': 'idbevents',
-        'assets': 'idbitem',
+    botocoreConfig = None
+    cacheKey = None
+
+    # Sessions, clients, resources and tables are created once and shared by the process
+    # (the server runs every request in a new thread)
+    __sessions = {}
+    __clients = {}
+    __resources = {}
+    __tables = {}
+    __clientsLock = threading.RLock()
+    # Batch chunks of all the requests run on one executor
+    __batchExecutor = None
+    __serializer = TypeSerializer()
+    __deserializer = TypeDeserializer()
+
+    # DynamoDB limits of BatchWriteItem and BatchGetItem requests
+    batchWriteSize = 25
+    batchGetSize = 100
+    # Concurrent batch requests
+    batchWorkers = 4
+    # Retries of throttled or failed requests and of unprocessed batch items
+    retryAttempts = 8
+    retryBackoff = 0.05
+    retryBackoffMax = 2.0
+    # Capacity units per second and table, None is not limited until the table gets throttled
+    rateLimit = None
+    rateLimitMin = 1.0
+    # Parallel Scan segments of the whole table export
+    exportSegments = 4
+
+    # Account metadata caches per connection: entries, seconds to live (0 disables the cache)
+    metadataCacheSize = 1024
+    metadataCacheTtl = 60
+    __metadataCaches = {}
+    __metadataMissing = object()
+
+    botocoreConfigKeys = {
+        'max_pool_connections': int,
+        'connect_timeout': float,
+        'read_timeout': float,
     }
 
     def __init__(self, configuration):
-        IdbankStorageBase.__init__(self, configuration)
+        IdbankStorageItems.__init__(self, configuration)
         try:
             self.region_name = self.configuration['region_name']
             self.aws_access_key_id = self.configuration['aws_access_key_id']
@@ -87,20 +108,64 @@ class AwsDynamoDb(IdbankStorageBase):
             errorMessage = 'There is not all the required data to connect to the AWS Dynamo DB.'
             logging.error(errorMessage)
             raise ValueError(errorMessage)
+        botocoreOptions = {}
+        for key, keyType in self.botocoreConfigKeys.items():
+            if key in self.configuration and self.configuration[key] not in (None, ''):
+                botocoreOptions[key] = keyType(self.configuration[key])
+        self.metrics = IdbankStorageMetrics()
+        self.retryPolicy = IdbankStorageRetry(int(self.configuration.get('retry_attempts', self.retryAttempts)),
+                                              float(self.configuration.get('retry_backoff', self.retryBackoff)),
+                                              float(self.configuration.get('retry_backoff_max', self.retryBackoffMax)))
+        # The retry policy replaces the botocore retries, so attempts do not multiply
+        # and every throttled call reaches the rate limiter
+        botocoreRetries = self.retryPolicy.attempts <= 0
+        self.cacheKey = (self.region_name, self.aws_access_key_id, self.aws_secret_access_key,
+                         tuple(sorted(botocoreOptions.items())), botocoreRetries)
+        if not botocoreRetries:
+            botocoreOptions['retries'] = {'total_max_attempts': 1, 'mode': 'standard'}
+        if botocoreOptions:
+            self.botocoreConfig = Config(**botocoreOptions)
+
+    @staticmethod
+    def __getShared(cache, key, factory):
+        value = cache.get(key)
+        if value is None:
+            with AwsDynamoDb.__clientsLock:
+                value = cache.get(key)
+                if value is None:
+                    value = factory()
+                    cache[key] = value
+        return value
+
+    def getSession(self):
+        return AwsDynamoDb.__getShared(AwsDynamoDb.__sessions, self.cacheKey,
+                                       lambda: boto3.session.Session(region_name=self.region_name,
+                                                                     aws_access_key_id=self.aws_access_key_id,
+                                                                     aws_secret_access_key=self.aws_secret_access_key))
 
     def initClient(self):
         if self.dynamodbClient is None:
-            self.dynamodbClient = boto3.client('dynamodb',
-                                               region_name=self.region_name,
-                                               aws_access_key_id=self.aws_access_key_id,
-                                               aws_secret_access_key=self.aws_secret_access_key)
+            self.dynamodbClient = AwsDynamoDb.__getShared(
+                AwsDynamoDb.__clients, self.cacheKey,
+                lambda: self.getSession().client('dynamodb', config=self.botocoreConfig))
+
+    def getClient(self):
+        self.initClient()
+        return self.dynamodbClient
+
+    def getResource(self):
+        return AwsDynamoDb.__getShared(AwsDynamoDb.__resources, self.cacheKey,
+                                       lambda: self.getSession().resource('dynamodb', config=self.botocoreConfig))
 
     def initResource(self):
         if self.dynamodbResource is None:
-            self.dynamodbResource = boto3.resource('dynamodb',
-                                                   region_name=self.region_name,
-                                                   aws_access_key_id=self.aws_access_key_id,
-                                                   aws_secret_access_key=self.aws_secret_access_key)
+            self.dynamodbResource = self.getResource()
+
+    def getTable(self, tableName=None):
+        if tableName is None:
+            tableName = self.configuration['table_name']
+        return AwsDynamoDb.__getShared(AwsDynamoDb.__tables, (self.cacheKey, tableName),
+                                       lambda: self.getResource().Table(tableName))
 
     @staticmethod
     def idb(configuration):
@@ -109,29 +174,101 @@ class AwsDynamoDb(IdbankStorageBase):
     def useAccount(self, accountName, accountCertificate=None):
         super().useAccount(accountName, accountCertificate)
 
+    def getRateLimiter(self):
+        rateLimit = self.configuration.get('rate_limit', self.rateLimit)
+        return IdbankStorageRateLimiter.getLimiter((self.cacheKey, self.configuration['table_name']),
+                                                   float(rateLimit) if rateLimit else None,
+                                                   float(self.configuration.get('rate_limit_min', self.rateLimitMin)))
+
+    def __execute(self, function, **kwargs):
+        # Throttled and transient errors are retried, exhausted throttling is raised as ClientError
+        return self.retryPolicy.call(function, self.getRateLimiter(), **kwargs)
+
+    def recordConsumedCapacity(self, queryType, consumedCapacity, write=False):
+        if consumedCapacity:
+            self.getRateLimiter().consume(IdbankStorageMetrics.capacityUnits(consumedCapacity)[0])
+            self.metrics.add(consumedCapacity, write)
+            IdbankStorageMetrics.record(self.accountName, self.configuration['table_name'], queryType,
+                                        consumedCapacity, write)
+
+    def consumedCapacity(self):
+        # Capacity consumed by this instance, all the calls of the current IDB request
+        return self.metrics.consumedCapacity()
+
+    @staticmethod
+    def __serializeItem(item):
+        return {key: AwsDynamoDb.__serializer.serialize(value) for key, value in item.items()}
+
+    @staticmethod
+    def __deserializeItem(item):
+        return {key: AwsDynamoDb.__deserializer.deserialize(value) for key, value in item.items()}
+
+    def __transactWriteItems(self, queryType, transactItems):
+        # Serializes Key, Item and ExpressionAttributeValues of the transaction items for the low level client
+        requestItems = []
+        for transactItem in transactItems:
+            requestItem = {}
+            for action, request in transactItem.items():
+                request = dict(request, TableName=self.configuration['table_name'])
+                for field in ('Key', 'Item', 'ExpressionAttributeValues'):
+                    if field in request:
+                        request[field] = AwsDynamoDb.__serializeItem(request[field])
+                requestItem[action] = request
+            requestItems.append(requestItem)
+        try:
+            response = self.__execute(self.getClient().transact_write_items,
+                                      TransactItems=requestItems, ReturnConsumedCapacity='TOTAL')
+            self.recordConsumedCapacity(queryType, response.get('ConsumedCapacity'), True)
+        except ClientError as e:
+            if IdbankStorageRetry.isThrottlingError(e):
+                raise
+            if e.response['Error']['Code'] != 'TransactionCanceledException':
+                logging.error('Transaction error: ' + e.response['Error']['Message'])
+            return False
+        return True
+
     def createAccount(self, accountName, accountCertificate=None):
+        # Single transaction: no delete marker and no metadata may exist, then the empty metadata is created
         self.useAccount(accountName, accountCertificate)
-        metadata = self.getItem(self.attributesKeyNames['delete'], accountCertificate)
-        if metadata:
-            return False
-        metadata = self.getItem(self.attributesKeyNames['metadata'], accountCertificate)
-        if metadata:
-            return False
-        metadata = {}
-        self.putItem(self.attributesKeyNames['metadata'], metadata, accountCertificate)
-        metadata = self.getItem(self.attributesKeyNames['metadata'], accountCertificate)
-        return (metadata is not None)
+        idNames = {'#id': self.dbKeyNames['id']}
+        created = self.__transactWriteItems('createAccount', [
+            {'ConditionCheck': {
+                'Key': self.itemKey(self.attributesKeyNames['delete']),
+                'ConditionExpression': 'attribute_not_exists(#id)',
+                'ExpressionAttributeNames': idNames,
+            }},
+            {'Put': {
+                'Item': {**self.itemKey(self.attributesKeyNames['metadata']), **self.formatItem({})},
+                'ConditionExpression': 'attribute_not_exists(#id)',
+                'ExpressionAttributeNames': idNames,
+            }},
+        ])
+        self.invalidateAccountMetadata()
+        return created
 
     def deleteAccount(self, accountName, accountCertificate=None):
+        # Metadata is read once, the delete marker is written and the metadata removed in one transaction
+        # which fails when the metadata was changed in between
         self.useAccount(accountName, accountCertificate)
-        metadata = self.getItem(self.attributesKeyNames['metadata'], accountCertificate)
-        if metadata:
-            self.putItem(self.attributesKeyNames['delete'], metadata, accountCertificate)
-            self.deleteItem(self.attributesKeyNames['metadata'], accountCertificate)
-        else:
+        item = self.__getItem(self.attributesKeyNames['metadata'], accountCertificate)[0]
+        if not self.parseItem(item):
             return False
-        metadata = self.getItem(self.attributesKeyNames['metadata'], accountCertificate)
-        return (metadata is None)
+        deleted = self.__transactWriteItems('deleteAccount', [
+            {'Put': {
+                'Item': {**self.itemKey(self.attributesKeyNames['delete']),
+                         self.dbKeyNames['public']: item[self.dbKeyNames['public']]},
+                'ConditionExpression': 'attribute_not_exists(#id)',
+                'ExpressionAttributeNames': {'#id': self.dbKeyNames['id']},
+            }},
+            {'Delete': {
+                'Key': self.itemKey(self.attributesKeyNames['metadata']),
+                'ConditionExpression': '#public = :public',
+                'ExpressionAttributeNames': {'#public': self.dbKeyNames['public']},
+                'ExpressionAttributeValues': {':public': item[self.dbKeyNames['public']]},
+            }},
+        ])
+        self.invalidateAccountMetadata()
+        return deleted
 
     def backupAccount(self, accountName, backupConfiguration, accountCertificate=None):
         raise NotImplementedError("Not Implemented!")
@@ -139,53 +276,104 @@ class AwsDynamoDb(IdbankStorageBase):
     def exportAccount(self, accountName, exportConfiguration, accountCertificate=None):
         raise NotImplementedError("Not Implemented!")
 
+    def getMetadataCache(self):
+        cacheSize = int(self.configuration.get('metadata_cache_size', self.metadataCacheSize) or 0)
+        cacheTtl = float(self.configuration.get('metadata_cache_ttl', self.metadataCacheTtl) or 0)
+        if cacheSize <= 0 or cacheTtl <= 0:
+            return None
+        cacheKey = (self.cacheKey, self.configuration['table_name'])
+        metadataCache = AwsDynamoDb.__metadataCaches.get(cacheKey)
+        if metadataCache is None:
+            with AwsDynamoDb.__clientsLock:
+                metadataCache = AwsDynamoDb.__metadataCaches.setdefault(cacheKey, IdbCache(cacheSize, cacheTtl))
+        return metadataCache
+
+    @staticmethod
+    def metadataCacheStats():
+        return {'{}/{}'.format(cacheKey[0][0], cacheKey[1]): metadataCache.stats()
+                for cacheKey, metadataCache in list(AwsDynamoDb.__metadataCaches.items())}
+
+    def invalidateAccountMetadata(self):
+        metadataCache = self.getMetadataCache()
+        if metadataCache is not None:
+            metadataCache.remove(self.accountName)
+            metadataCache.remove((self.accountName, self.attributesKeyNames['dictionary']))
+
     def createAccountMetadata(self, accountCertificate=None):
         metadata = {}
-        return self.putItem(self.attributesKeyNames['metadata'], metadata, accountCertificate)
+        response = self.putItem(self.attributesKeyNames['metadata'], metadata, accountCertificate)
+        self.invalidateAccountMetadata()
+        return response
 
     def setAccountMetadata(self, metadata, accountCertificate=None):
-        return self.updateItem(self.attributesKeyNames['metadata'], metadata, accountCertificate)
+        response = self.updateItem(self.attributesKeyNames['metadata'], metadata, accountCertificate)
+        self.invalidateAccountMetadata()
+        return response
 
     def getAccountMetadata(self, accountCertificate=None):
-        return self.getItem(self.attributesKeyNames['metadata'], accountCertificate)
+        # Read through the metadata cache, accounts without metadata are cached as well
+        metadataCache = self.getMetadataCache()
+        if metadataCache is None:
+            return self.getItem(self.attributesKeyNames['metadata'], accountCertificate)
+        metadata = metadataCache.get(self.accountName, AwsDynamoDb.__metadataMissing)
+        if metadata is AwsDynamoDb.__metadataMissing:
+            metadata = self.getItem(self.attributesKeyNames['metadata'], accountCertificate)
+            metadataCache.put(self.accountName, metadata)
+        return metadata
 
     def deleteAccountMetadata(self, accountCertificate=None):
-        return self.deleteItem(self.attributesKeyNames['metadata'], accountCertificate)
+        response = self.deleteItem(self.attributesKeyNames['metadata'], accountCertificate)
+        self.invalidateAccountMetadata()
+        return response
 
     def __putItem(self, idbId, data, options, idbCertificate=None):
-        self.initResource()
-        table = self.dynamodbResource.Table(self.configuration['table_name'])
+        table = self.getTable()
         try:
-            response = table.put_item(Item=
+            response = self.__execute(table.put_item, Item=
             {
                 self.dbKeyNames['account']: self.accountName,
                 self.dbKeyNames['id']: idbId,
                 **data
-            }, **options)
-        except ClientError as e:
-            response = (e.response['Error']['Message'])
-        except:
-            response = None
-        return (response)
+            }, ReturnConsumedCapacity='TOTAL', **options)
+        except Exception as e:
+            return IdbankStorageResult.fromError(e)
+        self.recordConsumedCapacity('putItem', response.get('ConsumedCapacity'), True)
+        return IdbankStorageResult.fromResponse(response)
+
+    def getDictionaryAttribute(self, accountName, idbId):
+        # Only the dictionary attribute of the item is read
+        response = self.__execute(self.getTable().get_item, Key=
+        {
+            self.dbKeyNames['account']: accountName,
+            self.dbKeyNames['id']: idbId,
+        }, ProjectionExpression='#dictionary',
+            ExpressionAttributeNames={'#dictionary': self.attributesKeyNames['dictionary']},
+            ReturnConsumedCapacity='TOTAL')
+        self.recordConsumedCapacity('getItem', response.get('ConsumedCapacity'))
+        item = response.get('Item')
+        return item.get(self.attributesKeyNames['dictionary']) if item else None
+
+    def setAccountDictionary(self, dictionaryId, dictionaryData):
+        # The dictionary gets its own item, the metadata item keeps the id of the current one
+        result = self.__putItem(self.dictionaryItemId(dictionaryId),
+                                {self.attributesKeyNames['dictionary']: Binary(dictionaryData)}, {})
+        if not result.ok:
+            return result
+        dataUpdate = {
+            'ConditionExpression': 'attribute_exists(#id)',
+            'UpdateExpression': 'SET #dictionary=:dictionary',
+            'ExpressionAttributeNames': {
+                '#id': self.dbKeyNames['id'],
+                '#dictionary': self.attributesKeyNames['dictionary'],
+            },
+            'ExpressionAttributeValues': {
+                ':dictionary': dictionaryId,
+            }
+        }
+        return self.__updateItem(self.attributesKeyNames['metadata'], dataUpdate)
 
     def putItem(self, idbId, data, idbCertificate=None):
-        storageEngine = IdbankStorageEngine(
-            {
-                'idbFormat': IdbankStorageFormat.IDB_FORMAT_V1,
-                'idbType': IdbankStorageType.IDB_TYPE_BASE64
-            })
-        if not isinstance(data, str):
-            data = json.dumps(data)
-        data = storageEngine.convert(data)
-        dataPut = {
-            self.dbKeyNames['public']:
-                {
-                    self.attributesKeyNames['item']: data
-                },
-            # For initial release we do not store any protected and private data
-            # self.dbKeyNames['protected']: None,
-            # self.dbKeyNames['private']: None
-        }
+        dataPut = self.formatItem(data)
         options = {
             'ConditionExpression': 'attribute_not_exists(#id)',
             'ExpressionAttributeNames': {
@@ -195,26 +383,22 @@ class AwsDynamoDb(IdbankStorageBase):
         return self.__putItem(idbId, dataPut, options, idbCertificate)
 
     def __updateItem(self, idbId, data, idbCertificate=None):
-        self.initResource()
-        table = self.dynamodbResource.Table(self.configuration['table_name'])
+        table = self.getTable()
         key = {self.dbKeyNames['account']: self.accountName, self.dbKeyNames['id']: idbId}
         try:
-            response = table.update_item(
+            response = self.__execute(
+                table.update_item,
                 Key=key,
+                ReturnConsumedCapacity='TOTAL',
                 **data
             )
-        except ClientError as e:
-            response = (e.response['Error']['Message'])
-        except:
-            response = None
-        return (response)
+        except Exception as e:
+            return IdbankStorageResult.fromError(e)
+        self.recordConsumedCapacity('updateItem', response.get('ConsumedCapacity'), True)
+        return IdbankStorageResult.fromResponse(response)
 
     def updateItem(self, idbId, data, idbCertificate=None):
-        storageEngine = IdbankStorageEngine(
-            {
-                'idbFormat': IdbankStorageFormat.IDB_FORMAT_V1,
-                'idbType': IdbankStorageType.IDB_TYPE_BASE64
-            })
+        storageEngine = self.getStorageEngine()
         if not isinstance(data, str):
             data = json.dumps(data)
         data = storageEngine.convert(data)
@@ -234,36 +418,35 @@ class AwsDynamoDb(IdbankStorageBase):
         return self.__updateItem(idbId, dataUpdate, idbCertificate)
 
     def __getItem(self, idbId, idbCertificate=None):
-        self.initResource()
-        table = self.dynamodbResource.Table(self.configuration['table_name'])
-        response = table.get_item(Key=
+        table = self.getTable()
+        response = self.__execute(table.get_item, Key=
         {
             self.dbKeyNames['account']: self.accountName,
             self.dbKeyNames['id']: idbId,
-        })
+        }, ReturnConsumedCapacity='TOTAL')
+        self.recordConsumedCapacity('getItem', response.get('ConsumedCapacity'))
         if response is not None and \
                 'Item' in response:
             item = response['Item']
         else:
             item = None
-        return item
+        return item, response
 
     def getItem(self, idbId, idbCertificate=None):
-        item = self.__getItem(idbId, idbCertificate)
-        if item is not None and \
-                self.dbKeyNames['public'] in item and \
-                self.attributesKeyNames['item'] in item[self.dbKeyNames['public']]:
-            item = item[self.dbKeyNames['public']][self.attributesKeyNames['item']]
-            if isinstance(item, str):
-                storageEngine = IdbankStorageEngine()
-                item = storageEngine.parse(item)
-        else:
-            item = None
-        return item
+        return self.parseItem(self.__getItem(idbId, idbCertificate)[0])
+
+    def getItemResult(self, idbId, idbCertificate=None):
+        try:
+            item, response = self.__getItem(idbId, idbCertificate)
+        except Exception as e:
+            return IdbankStorageResult.fromError(e)
+        item = self.parseItem(item)
+        if item is None:
+            return IdbankStorageResult.fromResponse(response, status=IdbankStorageResult.STATUS_NOT_FOUND)
+        return IdbankStorageResult.fromResponse(response, item)
 
     def deleteItem(self, idbId, idbCertificate=None):
-        self.initResource()
-        table = self.dynamodbResource.Table(self.configuration['table_name'])
+        table = self.getTable()
         try:
             options = {
                 'ConditionExpression': 'attribute_exists(#id)',
@@ -271,38 +454,206 @@ class AwsDynamoDb(IdbankStorageBase):
                     '#id': self.dbKeyNames['id']
                 }
             }
-            response = table.delete_item(Key=
+            response = self.__execute(table.delete_item, Key=
             {
                 self.dbKeyNames['account']: self.accountName,
                 self.dbKeyNames['id']: idbId,
-            }, **options)
-        except ClientError as e:
-            response = (e.response['Error']['Message'])
-        except:
-            response = None
-        return (response)
-
-        return response
-
-    def countItems(self, query, idbCertificate=None):
-        response = self.__findItems(query, True, idbCertificate)
-        if response is not None and \
-                'Count' in response:
-            count = response['Count']
+            }, ReturnConsumedCapacity='TOTAL', **options)
+        except Exception as e:
+            result = IdbankStorageResult.fromError(e)
+            if result.conditionFailed:
+                result.status = IdbankStorageResult.STATUS_NOT_FOUND
+            return result
+        self.recordConsumedCapacity('deleteItem', response.get('ConsumedCapacity'), True)
+        return IdbankStorageResult.fromResponse(response)
+
+    def __batchChunks(self, requests, chunkSize):
+        return [requests[index:index + chunkSize] for index in range(0, len(requests), chunkSize)]
+
+    def __getBatchExecutor(self):
+        if AwsDynamoDb.__batchExecutor is None:
+            with AwsDynamoDb.__clientsLock:
+                if AwsDynamoDb.__batchExecutor is None:
+                    AwsDynamoDb.__batchExecutor = ThreadPoolExecutor(max_workers=self.batchWorkers,
+                                                                     thread_name_prefix='AwsDynamoDb')
+        return AwsDynamoDb.__batchExecutor
+
+    def __batchExecute(self, function, chunks):
+        if len(chunks) <= 1 or self.batchWorkers <= 1:
+            return [function(chunk) for chunk in chunks]
+        # The engine and the table are resolved before the chunks run on the shared executor
+        self.getStorageEngine()
+        self.getTable()
+        return list(self.__getBatchExecutor().map(function, chunks))
+
+    def __batchWriteChunk(self, queryType, requests):
+        # Returns keys of the requests which were not processed after all retries
+        tableName = self.configuration['table_name']
+        requestItems = {tableName: [{action: {field: AwsDynamoDb.__serializeItem(item)
+                                              for field, item in request.items()}
+                                     for action, request in writeRequest.items()}
+                                    for writeRequest in requests]}
+        attempt = 0
+        while requestItems:
+            try:
+                response = self.__execute(self.getClient().batch_write_item,
+                                          RequestItems=requestItems, ReturnConsumedCapacity='TOTAL')
+            except ClientError as e:
+                logging.error('Batch write error: ' + e.response['Error']['Message'])
+                break
+            self.recordConsumedCapacity(queryType, response.get('ConsumedCapacity'), True)
+            requestItems = response.get('UnprocessedItems')
+            if not requestItems or attempt >= self.retryPolicy.attempts:
+                break
+            # Unprocessed items are returned when the table is over its capacity
+            self.getRateLimiter().throttled()
+            attempt += 1
+            self.retryPolicy.sleep(attempt)
+        unprocessed = []
+        if requestItems and tableName in requestItems:
+            for request in requestItems[tableName]:
+                if 'PutRequest' in request:
+                    key = request['PutRequest']['Item'][self.dbKeyNames['id']]
+                else:
+                    key = request['DeleteRequest']['Key'][self.dbKeyNames['id']]
+                unprocessed.append(AwsDynamoDb.__deserializer.deserialize(key))
+        return unprocessed
+
+    def __batchGetChunk(self, idbIds):
+        tableName = self.configuration['table_name']
+        requestItems = {tableName: {'Keys': [AwsDynamoDb.__serializeItem(self.itemKey(idbId)) for idbId in idbIds]}}
+        items = {}
+        attempt = 0
+        while requestItems:
+            try:
+                response = self.__execute(self.getClient().batch_get_item,
+                                          RequestItems=requestItems, ReturnConsumedCapacity='TOTAL')
+            except ClientError as e:
+                logging.error('Batch get error: ' + e.response['Error']['Message'])
+                break
+            self.recordConsumedCapacity('getItems', response.get('ConsumedCapacity'))
+            for item in response.get('Responses', {}).get(tableName, []):
+                item = AwsDynamoDb.__deserializeItem(item)
+                items[item[self.dbKeyNames['id']]] = item
+            requestItems = response.get('UnprocessedKeys')
+            if not requestItems or attempt >= self.retryPolicy.attempts:
+                break
+            # Unprocessed items are returned when the table is over its capacity
+            self.getRateLimiter().throttled()
+            attempt += 1
+            self.retryPolicy.sleep(attempt)
+        unprocessed = []
+        if requestItems and tableName in requestItems:
+            unprocessed = [AwsDynamoDb.__deserializer.deserialize(key[self.dbKeyNames['id']])
+                           for key in requestItems[tableName]['Keys']]
+        return items, unprocessed
+
+    def putItems(self, items, conditional=False, idbCertificate=None):
+        # items: {idbId: data}, with conditional=True existing items are not overwritten (single conditional puts)
+        result = {'Processed': 0, 'Unprocessed': [], 'Existing': []}
+        idbIds = []
+        for idbId in items.keys():
+            if self.isReservedId(idbId):
+                result['Unprocessed'].append(idbId)
+            else:
+                idbIds.append(idbId)
+
+        if conditional:
+            def putChunk(chunk):
+                chunkResult = {'Processed': 0, 'Unprocessed': [], 'Existing': []}
+                for idbId in chunk:
+                    response = self.putItem(idbId, items[idbId], idbCertificate)
+                    if response.ok:
+                        chunkResult['Processed'] += 1
+                    elif response.conditionFailed:
+                        chunkResult['Existing'].append(idbId)
+                    else:
+                        chunkResult['Unprocessed'].append(idbId)
+                return chunkResult
+        else:
+            formattedItems = dict(zip(idbIds, self.formatItems([items[idbId] for idbId in idbIds])))
+
+            def putChunk(chunk):
+                unprocessed = self.__batchWriteChunk('putItems', [{'PutRequest': {'Item': {
+                    self.dbKeyNames['account']: self.accountName,
+                    self.dbKeyNames['id']: idbId,
+                    **formattedItems[idbId]
+                }}} for idbId in chunk])
+                return {'Processed': len(chunk) - len(unprocessed), 'Unprocessed': unprocessed, 'Existing': []}
+
+        for chunkResult in self.__batchExecute(putChunk, self.__batchChunks(idbIds, self.batchWriteSize)):
+            result['Processed'] += chunkResult['Processed']
+            result['Unprocessed'] += chunkResult['Unprocessed']
+            result['Existing'] += chunkResult['Existing']
+        return result
+
+    def getItems(self, idbIds, idbCertificate=None):
+        # Returns {idbId: data} of found items, missing ones are not included
+        result = {'Items': {}, 'Unprocessed': []}
+        idbIds = [idbId for idbId in dict.fromkeys(idbIds) if not self.isReservedId(idbId)]
+        for items, unprocessed in self.__batchExecute(self.__batchGetChunk,
+                                                      self.__batchChunks(idbIds, self.batchGetSize)):
+            result['Items'].update(zip(items.keys(), self.parseItems(items.values())))
+            result['Unprocessed'] += unprocessed
+        return result
+
+    def deleteItems(self, idbIds, conditional=False, idbCertificate=None):
+        # With conditional=True only existing items are deleted and missing ones are reported (single deletes)
+        result = {'Processed': 0, 'Unprocessed': [], 'NotFound': []}
+        chunkIds = []
+        for idbId in dict.fromkeys(idbIds):
+            if self.isReservedId(idbId):
+                result['Unprocessed'].append(idbId)
+            else:
+                chunkIds.append(idbId)
+
+        if conditional:
+            def deleteChunk(chunk):
+                chunkResult = {'Processed': 0, 'Unprocessed': [], 'NotFound': []}
+                for idbId in chunk:
+                    response = self.deleteItem(idbId, idbCertificate)
+                    if response.ok:
+                        chunkResult['Processed'] += 1
+                    elif response.notFound:
+                        chunkResult['NotFound'].append(idbId)
+                    else:
+                        chunkResult['Unprocessed'].append(idbId)
+                return chunkResult
         else:
-            count = None
+            def deleteChunk(chunk):
+                unprocessed = self.__batchWriteChunk('deleteItems', [{'DeleteRequest': {'Key': {
+                    self.dbKeyNames['account']: self.accountName,
+                    self.dbKeyNames['id']: idbId,
+                }}} for idbId in chunk])
+                return {'Processed': len(chunk) - len(unprocessed), 'Unprocessed': unprocessed, 'NotFound': []}
+
+        for chunkResult in self.__batchExecute(deleteChunk, self.__batchChunks(chunkIds, self.batchWriteSize)):
+            result['Processed'] += chunkResult['Processed']
+            result['Unprocessed'] += chunkResult['Unprocessed']
+            result['NotFound'] += chunkResult['NotFound']
+        return result
+
+    def countFindItems(self, query, idbCertificate=None):
+        # Count of the items findItems returns, the matching reserved items are subtracted
+        # (a FilterExpression cannot use the sort key)
+        count = self.countItems(query, idbCertificate)
+        if count:
+            for condition, idbId in (('#idbReservedId = :idbReservedId', self.attributesKeyNames['metadata']),
+                                     ('#idbReservedId = :idbReservedId', self.attributesKeyNames['delete']),
+                                     ('begins_with(#idbReservedId, :idbReservedId)',
+                                      self.dictionaryItemId(''))):
+                reservedQuery = dict(query) if query else {}
+                reservedQuery['KeyConditionExpression'] = '(#account = :account) AND ({})'.format(condition)
+                reservedQuery['ExpressionAttributeNames'] = dict(reservedQuery.get('ExpressionAttributeNames') or {},
+                                                                 **{'#idbReservedId': self.dbKeyNames['id']})
+                reservedQuery['ExpressionAttributeValues'] = dict(reservedQuery.get('ExpressionAttributeValues') or {},
+                                                                  **{':idbReservedId': idbId})
+                count -= self.countItems(reservedQuery, idbCertificate) or 0
         return count
 
-    def countAllItems(self, idbCertificate=None):
-        return self.countItems(None, idbCertificate)
-
     def findItems(self, query, idbCertificate=None):
         response = self.__findItems(query, False, idbCertificate)
         if response is not None:
-            def filterItems(item):
-                return item[self.dbKeyNames['id']] in [self.attributesKeyNames['metadata'],
-                                                       self.attributesKeyNames['delete']]
-
             def formatItem(item):
                 if item is not None and \
                         self.dbKeyNames['public'] in item and \
@@ -326,13 +677,14 @@ class AwsDynamoDb(IdbankStorageBase):
             if 'Items' in response:
                 if query and 'ProjectionExpression' in query and query['ProjectionExpression']:
                     if query['ProjectionExpression'] == self.dbKeyNames['id']:
-                        items['Items'] = [formatIdbidItem(item) for item in response['Items'] if not filterItems(item)]
+                        items['Items'] = [formatIdbidItem(item) for item in response['Items']
+                                          if not self.isReservedItem(item)]
                         count = len(items['Items'])
                     else:
-                        items['Items'] = response['Items']
-                        count = response['Count']
+                        items['Items'] = [item for item in response['Items'] if not self.isReservedItem(item)]
+                        count = len(items['Items'])
                 else:
-                    items['Items'] = [formatItem(item) for item in response['Items'] if not filterItems(item)]
+                    items['Items'] = [formatItem(item) for item in response['Items'] if not self.isReservedItem(item)]
                     count = len(items['Items'])
             if 'Count' in response:
                 items['Count'] = count
@@ -343,9 +695,70 @@ class AwsDynamoDb(IdbankStorageBase):
             items = None
         return items
 
+    def iteratePages(self, query, count=False, idbCertificate=None):
+        # Lazily follows LastEvaluatedKey, yields the query response of every page
+        query = dict(query) if query else {}
+        while True:
+            response = self.__findItems(query, count, idbCertificate)
+            yield response
+            if response is None or 'LastEvaluatedKey' not in response:
+                break
+            query['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def exportItems(self, totalSegments=None, scanOptions=None, queueSize=16):
+        # Whole table export (all the accounts) with parallel Scan segments, yields pages of formatted items
+        totalSegments = max(1, int(totalSegments or self.exportSegments))
+        pages = queue.Queue(maxsize=queueSize)
+        stop = threading.Event()
+        finished = object()
+
+        def putPage(page):
+            while not stop.is_set():
+                try:
+                    pages.put(page, timeout=0.5)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def scanSegment(segment):
+            try:
+                table = self.getTable()
+                scan = dict(scanOptions) if scanOptions else {}
+                scan.update({'Segment': segment, 'TotalSegments': totalSegments})
+                scan.setdefault('ReturnConsumedCapacity', 'TOTAL')
+                while not stop.is_set():
+                    response = self.__execute(table.scan, **scan)
+                    self.recordConsumedCapacity('exportItems', response.get('ConsumedCapacity'))
+                    if not putPage(self.formatExportItems(response.get('Items', []))):
+                        break
+                    if 'LastEvaluatedKey' not in response:
+                        break
+                    scan['ExclusiveStartKey'] = response['LastEvaluatedKey']
+            except Exception as error:
+                putPage(error)
+            finally:
+                putPage(finished)
+
+        workers = [threading.Thread(target=scanSegment, args=(segment,), daemon=True)
+                   for segment in range(totalSegments)]
+        for worker in workers:
+            worker.start()
+        try:
+            running = totalSegments
+            while running:
+                page = pages.get()
+                if page is finished:
+                    running -= 1
+                elif isinstance(page, Exception):
+                    raise page
+                elif page:
+                    yield page
+        finally:
+            stop.set()
+
     def __findItems(self, query, count=False, idbCertificate=None):
-        self.initResource()
-        table = self.dynamodbResource.Table(self.configuration['table_name'])
+        table = self.getTable()
         if query:
             query = query.copy()
         else:
@@ -381,12 +794,10 @@ class AwsDynamoDb(IdbankStorageBase):
                 del query['ProjectionExpression']
 
         IdbCommon.dictionaryMerge(dataFind, query)
-        response = table.query(**dataFind)
+        response = self.__execute(table.query, **dataFind)
+        self.recordConsumedCapacity('countItems' if count else 'findItems', response.get('ConsumedCapacity'))
         return response
 
-    def generateExclusiveStartKey(self, page):
-        return {self.dbKeyNames['account']: self.accountName, self.dbKeyNames['id']: page}
-
 ################################################################################
 #                                End of file                                   #
 ################################################################################
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# * ********************************************************************* *
+# *                                                                       *
+# *   Identity Bank data driver                                           *
+# *   This file is part of idbank. This project may be found at:          *
+# *   https://github.com/IdentityBank/Python_idbank.                      *
+# *                                                                       *
+# *   Copyright (C) 2020 by Identity Bank. All Rights Reserved.           *
+# *   https://www.identitybank.eu - You belong to you                     *
+# *                                                                       *
+# *   This program is free software: you can redistribute it and/or       *
+# *   modify it under the terms of the GNU Affero General Public          *
+# *   License as published by the Free Software Foundation, either        *
+# *   version 3 of the License, or (at your option) any later version.    *
+# *                                                                       *
+# *   This program is distributed in the hope that it will be useful,     *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of      *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the        *
+# *   GNU Affero General Public License for more details.                 *
+# *                                                                       *
+# *   You should have received a copy of the GNU Affero General Public    *
+# *   License along with this program. If not, see                        *
+# *   https://www.gnu.org/licenses/.                                      *
+# *                                                                       *
+# * ********************************************************************* *
+
+################################################################################
+# Import(s)                                                                    #
+################################################################################
+
+from .AwsDynamoDb import AwsDynamoDb
+from .MemoryDb import MemoryDb
+
+
+################################################################################
+# Module                                                                       #
+################################################################################
+
+class IdbankStorage:
+    # Storage backends by the connection type ("type" of the IDB connection section)
+    STORAGE_TYPE_AWS_DYNAMODB = 'AwsDynamoDb'
+    STORAGE_TYPE_MEMORY = 'MemoryDb'
+
+    storageTypes = {
+        STORAGE_TYPE_AWS_DYNAMODB: AwsDynamoDb,
+        STORAGE_TYPE_MEMORY: MemoryDb,
+    }
+
+    @staticmethod
+    def storageType(configuration):
+        if isinstance(configuration, dict) and configuration.get('type'):
+            return configuration['type']
+        return IdbankStorage.STORAGE_TYPE_AWS_DYNAMODB
+
+    @staticmethod
+    def idb(configuration):
+        storageType = IdbankStorage.storageType(configuration)
+        if storageType not in IdbankStorage.storageTypes:
+            raise ValueError("The IDB storage type '{}' is not supported.".format(storageType))
+        return IdbankStorage.storageTypes[storageType].idb(configuration)
+
+################################################################################
+#                                End of file                                   #
+################################################################################
@@ -76,6 +76,7 @@ class IdbankStorageBase:
     # public: {not encrypted data}
     # protected: {encrypted uses IDB account certificate - the same cert for all account items}
     # private: {encrypted uses IDB user certificate}
+    # put, update and delete return IdbankStorageResult
 
     @abstractmethod
     def putItem(self, idbId, data, idbCertificate = None):
@@ -89,6 +90,10 @@ class IdbankStorageBase:
     def getItem(self, idbId, idbCertificate = None):
         pass
 
+    @abstractmethod
+    def getItemResult(self, idbId, idbCertificate = None):
+        pass
+
     @abstractmethod
     def deleteItem(self, idbId, idbCertificate = None):
         pass
@@ -28,19 +28,50 @@
 # Import(s)                                                                    #
 ################################################################################
 
+import binascii
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
 import bintexttools
 
-from .IdbankStorageFormat import IdbankStorageTags, IdbankStorageFormat, IdbankStorageType, IdbankStorageInfo
+from .IdbankStorageFormat import IdbankStorageTags, IdbankStorageFormat, IdbankStorageType, IdbankStorageInfo, \
+    IdbankStorageCompression, IdbankStorageHeader
 
 
 ################################################################################
 # Module                                                                       #
 ################################################################################
 
+def parseManyWorker(items: list, dictionaries: dict = None) -> list:
+    IdbankStorageCompression.importDictionaries(dictionaries)
+    return IdbankStorageEngine().parseMany(items)
+
+
+def convertManyWorker(options: dict, items: list, dictionaries: dict = None) -> list:
+    IdbankStorageCompression.importDictionaries(dictionaries)
+    return IdbankStorageEngine(options).convertMany(items)
+
+
 class IdbankStorageEngine:
     __detectFormat = True
     __format = IdbankStorageFormat.default
     __type = IdbankStorageType.default
+    __compression = None
+    __compressionThreshold = IdbankStorageCompression.threshold
+    __compressionWarnings = set()
+    __dictionaryId = None
+
+    # Shared process pool of the batch APIs, batches smaller than the threshold are done in process
+    processPool = None
+    processPoolLock = threading.Lock()
+    processThreshold = 256
+    processChunkSize = 64
+
+    # Text converters by type, created once (the converter format is fixed after creation)
+    __bin2text = {}
+    __text2bin = {}
 
     def __init__(self, options: dict = None):
         if options and 'idbFormat' in options \
@@ -51,64 +82,265 @@ class IdbankStorageEngine:
                 and isinstance(options['idbType'], str):
             self.__type = options['idbType']
 
+        if options and 'idbCompression' in options \
+                and isinstance(options['idbCompression'], str):
+            if IdbankStorageCompression.available(options['idbCompression']):
+                self.__compression = options['idbCompression']
+            elif options['idbCompression'] not in IdbankStorageEngine.__compressionWarnings:
+                IdbankStorageEngine.__compressionWarnings.add(options['idbCompression'])
+                logging.warning("The IDB compression '{}' is not available.".format(options['idbCompression']))
+
+        # Registered zstd dictionary (IdbankStorageCompression.registerDictionary) used for all the sizes
+        if options and options.get('idbDictionary') is not None:
+            if IdbankStorageCompression.getDictionary(options['idbDictionary']) is not None:
+                self.__dictionaryId = int(options['idbDictionary'])
+            else:
+                logging.warning("The IDB compression dictionary '{}' is not loaded.".format(options['idbDictionary']))
+
+        if options and 'idbCompressionThreshold' in options \
+                and options['idbCompressionThreshold'] is not None:
+            self.__compressionThreshold = int(options['idbCompressionThreshold'])
+
         self.__options = options
 
+    @staticmethod
+    def __getBin2Text(dataType: str):
+        bin2text = IdbankStorageEngine.__bin2text.get(dataType)
+        if bin2text is None:
+            bin2text = bintexttools.Bin2TextConverter()
+            bin2text.format = IdbankStorageType.toBinTextTools(dataType)
+            IdbankStorageEngine.__bin2text[dataType] = bin2text
+        return bin2text
+
+    @staticmethod
+    def __getText2Bin(dataType: str):
+        text2bin = IdbankStorageEngine.__text2bin.get(dataType)
+        if text2bin is None:
+            text2bin = bintexttools.Text2BinConverter()
+            text2bin.format = IdbankStorageType.toBinTextTools(dataType)
+            IdbankStorageEngine.__text2bin[dataType] = text2bin
+        return text2bin
+
+    @staticmethod
+    def getProcessPool(processes: int = None):
+        if IdbankStorageEngine.processPool is None:
+            with IdbankStorageEngine.processPoolLock:
+                if IdbankStorageEngine.processPool is None:
+                    IdbankStorageEngine.processPool = ProcessPoolExecutor(max_workers=processes or os.cpu_count())
+        return IdbankStorageEngine.processPool
+
+    @staticmethod
+    def __chunks(items: list, chunkSize: int):
+        return [items[index:index + chunkSize] for index in range(0, len(items), chunkSize)]
+
+    def __usePool(self, items: list, processes) -> bool:
+        return bool(processes) and len(items) >= self.processThreshold
+
+    def convertMany(self, items, processes: int = None) -> list:
+        # One engine and converter for the whole batch, processes: size of the process pool (None - in process)
+        items = list(items)
+        if self.__usePool(items, processes):
+            results = []
+            pool = IdbankStorageEngine.getProcessPool(processes)
+            dictionaries = IdbankStorageCompression.exportDictionaries(
+                [] if self.__dictionaryId is None else [self.__dictionaryId])
+            futures = [pool.submit(convertManyWorker, self.__options, chunk, dictionaries)
+                       for chunk in IdbankStorageEngine.__chunks(items, self.processChunkSize)]
+            for future in futures:
+                results += future.result()
+            return results
+        return [self.convert(item) for item in items]
+
+    def parseMany(self, items, processes: int = None) -> list:
+        items = [bytes(item) if isinstance(item, memoryview) else item for item in items]
+        if self.__usePool(items, processes):
+            results = []
+            pool = IdbankStorageEngine.getProcessPool(processes)
+            dictionaries = IdbankStorageCompression.exportDictionaries(self.dictionaryIds(items))
+            futures = [pool.submit(parseManyWorker, chunk, dictionaries)
+                       for chunk in IdbankStorageEngine.__chunks(items, self.processChunkSize)]
+            for future in futures:
+                results += future.result()
+            return results
+        parse = self.parse
+        return [parse(item) for item in items]
+
+    @staticmethod
+    def dictionaryIds(items) -> set:
+        # Ids of the zstd dictionaries used by the V2 items
+        dictionaryIds = set()
+        for item in items:
+            if isinstance(item, (bytes, bytearray, memoryview)):
+                header = IdbankStorageHeader.detect(item)
+                if header and header['dictionaryId'] is not None:
+                    dictionaryIds.add(header['dictionaryId'])
+        return dictionaryIds
+
     def convert(self, data: str):
         if self.__format == IdbankStorageFormat.IDB_FORMAT_CLEAR:
             return self.__convertClear(data)
         elif self.__format == IdbankStorageFormat.IDB_FORMAT_V1:
-            return self.__convertIdbV1(data)
+            return self.__convertIdbV1(data.encode('utf-8') if data else None)
+        elif self.__format == IdbankStorageFormat.IDB_FORMAT_V2:
+            return self.__convertIdbV2(data.encode('utf-8') if data else None)
         return self.__convertClear(data)
 
+    def convertBytes(self, data):
+        # data: UTF-8 payload as bytes, bytearray or memoryview, returns bytes
+        if self.__format == IdbankStorageFormat.IDB_FORMAT_V1:
+            dataText = self.__convertIdbV1(data)
+            return dataText.encode('ascii') if dataText else None
+        elif self.__format == IdbankStorageFormat.IDB_FORMAT_V2:
+            return self.__convertIdbV2(data)
+        return bytes(data) if data else None
+
     def __convertClear(self, data: str):
         return data
 
-    def __convertIdbV1(self, data: str):
+    def __compress(self, data):
+        if self.__compression and len(data) >= self.__compressionThreshold:
+            compressedData = IdbankStorageCompression.compress(data, self.__compression)
+            # Kept only when it saves space
+            if len(compressedData) < len(data):
+                return compressedData, self.__compression
+        return data, None
+
+    def __compressDictionary(self, data):
+        compressedData = IdbankStorageCompression.compress(data, IdbankStorageCompression.IDB_COMPRESSION_ZSTD,
+                                                           self.__dictionaryId)
+        if len(compressedData) < len(data):
+            return compressedData, IdbankStorageCompression.IDB_COMPRESSION_ZSTD, self.__dictionaryId
+        return data, None, None
+
+    def __convertIdbV2(self, data):
+        dataBinary = None
+        if data:
+            if self.__dictionaryId is not None:
+                payload, compression, dictionaryId = self.__compressDictionary(data)
+            else:
+                (payload, compression), dictionaryId = self.__compress(data), None
+            dataBinary = b''.join((IdbankStorageHeader.pack(IdbankStorageHeader.IDB_PAYLOAD_UTF8, compression,
+                                                            dictionaryId=dictionaryId),
+                                   payload))
+        return dataBinary
+
+    def __binaryToText(self, data):
+        if self.__type == IdbankStorageType.IDB_TYPE_BASE64:
+            return binascii.b2a_base64(data, newline=False).decode('ascii')
+        return IdbankStorageEngine.__getBin2Text(self.__type).convert(bytearray(data))
+
+    def __convertIdbV1(self, data):
         dataText = None
         if data:
-            bytearrayData = bytearray(data, 'utf-8')
-            bin2text = bintexttools.Bin2TextConverter()
-            bin2text.format = IdbankStorageType.toBinTextTools(self.__type)
-            dataBin2Text = bin2text.convert(bytearrayData)
+            data, compression = self.__compress(data)
+            dataBin2Text = self.__binaryToText(data)
             if dataBin2Text:
-                dataTextPrefix = IdbankStorageInfo.formatter(IdbankStorageTags.IDB_FORMAT_TAG,
-                                                             self.__format,
-                                                             first=True)
-                dataTextPrefix += IdbankStorageInfo.formatter(IdbankStorageTags.IDB_TYPE_TAG,
-                                                              self.__type)
-                dataText = dataTextPrefix + IdbankStorageInfo.formatter(IdbankStorageTags.IDB_DATA_TAG,
-                                                                        dataBin2Text)
+                dataText = ''.join((IdbankStorageInfo.formatter(IdbankStorageTags.IDB_FORMAT_TAG,
+                                                                self.__format,
+                                                                first=True),
+                                    IdbankStorageInfo.formatter(IdbankStorageTags.IDB_TYPE_TAG,
+                                                                self.__type),
+                                    IdbankStorageInfo.formatter(IdbankStorageTags.IDB_COMPRESSION_TAG,
+                                                                compression),
+                                    IdbankStorageInfo.formatter(IdbankStorageTags.IDB_DATA_TAG,
+                                                                dataBin2Text)))
         return dataText
 
-    def parse(self, data: str):
+    def parse(self, data):
         dataBytes = None
-        if data:
-            format = IdbankStorageFormat.detect(data)
-            if format:
-                if format['value'] == IdbankStorageFormat.IDB_FORMAT_CLEAR:
+        if isinstance(data, str):
+            if data:
+                format, payload = self.__parseText(data)
+                if format is None or format == IdbankStorageFormat.IDB_FORMAT_CLEAR:
+                    # Assuming clear data
                     dataBytes = data
-                elif format['value'] == IdbankStorageFormat.IDB_FORMAT_V1:
-                    dataBytes = self.__parseIdbV1(format['data'])
-            else:
-                # Assuming clear data
-                dataBytes = data
-
+                elif payload is not None:
+                    dataBytes = str(payload, 'utf-8')
+        elif data:
+            payload = self.parseBytes(data)
+            if payload is not None:
+                dataBytes = str(payload, 'utf-8')
         return dataBytes
 
-    def __parseIdbV1(self, data: str):
-        dataBytes = None
-        if data:
-            format = IdbankStorageType.detect(data)
-            text2bin = bintexttools.Text2BinConverter()
-            text2bin.format = IdbankStorageType.toBinTextTools(format['value'])
+    def parseBytes(self, data):
+        # data: stored item as bytes, bytearray, memoryview or str, returns the UTF-8 payload (bytes or memoryview)
+        if not data:
+            return None
+        if isinstance(data, str):
+            format, payload = self.__parseText(data)
+            if format is None or format == IdbankStorageFormat.IDB_FORMAT_CLEAR:
+                return data.encode('utf-8')
+            return payload
+        view = memoryview(data)
+        header = IdbankStorageHeader.detect(view)
+        if header:
+            return self.__parseIdbV2(view, header)
+        format, payload = self.__parseText(data if isinstance(data, (bytes, bytearray)) else view.tobytes())
+        if format is None or format == IdbankStorageFormat.IDB_FORMAT_CLEAR:
+            return view
+        return payload
 
-            formatData = IdbankStorageInfo.detectTagValue(format['data'], IdbankStorageTags.IDB_DATA_TAG)
-            if formatData:
-                data = text2bin.convert(formatData['value'])
-                if data:
-                    dataBytes = data.decode("utf-8")
+    def __parseIdbV2(self, view: memoryview, header: dict):
+        payload = None
+        if header['type'] == IdbankStorageHeader.IDB_PAYLOAD_UTF8:
+            # Uncompressed payload is returned without a copy
+            payload = view[header['size']:]
+            if header['compression']:
+                payload = IdbankStorageCompression.decompress(payload, header['compression'], header['dictionaryId'])
+        return payload
+
+    def __parseText(self, data):
+        # Format tag value and the V1 payload of tagged text (str or ASCII bytes), (None, None) when untagged
+        formatOffsets = IdbankStorageInfo.tagValueOffsets(data, IdbankStorageTags.IDB_FORMAT_TAG)
+        if not formatOffsets:
+            return None, None
+        format = data[formatOffsets[0]:formatOffsets[1]]
+        if not isinstance(format, str):
+            format = format.decode('ascii', 'replace')
+        if format == IdbankStorageFormat.IDB_FORMAT_V1:
+            return format, self.__parseIdbV1(data, formatOffsets[1] + 1)
+        return format, None
+
+    def __parseIdbV1(self, data, start: int):
+        dataBytes = None
+        typeOffsets = IdbankStorageInfo.tagValueOffsets(data, IdbankStorageTags.IDB_TYPE_TAG, start)
+        if typeOffsets:
+            dataType = data[typeOffsets[0]:typeOffsets[1]]
+            if not isinstance(dataType, str):
+                dataType = dataType.decode('ascii')
+            start = typeOffsets[1] + 1
+            compression = None
+            compressionOffsets = IdbankStorageInfo.tagValueOffsets(data, IdbankStorageTags.IDB_COMPRESSION_TAG,
+                                                                   start)
+            if compressionOffsets:
+                compression = data[compressionOffsets[0]:compressionOffsets[1]]
+                if not isinstance(compression, str):
+                    compression = compression.decode('ascii')
+                start = compressionOffsets[1] + 1
+            dataOffsets = IdbankStorageInfo.tagValueOffsets(data, IdbankStorageTags.IDB_DATA_TAG, start)
+            if dataOffsets:
+                dataBytes = self.__textToBinary(data, dataOffsets, dataType)
+                if dataBytes and compression:
+                    dataBytes = IdbankStorageCompression.decompress(dataBytes, compression)
         return dataBytes
 
+    @staticmethod
+    def __textToBinary(data, offsets, dataType: str):
+        if not isinstance(data, str):
+            text = memoryview(data)[offsets[0]:offsets[1]]
+        else:
+            text = data[offsets[0]:offsets[1]]
+        try:
+            if dataType == IdbankStorageType.IDB_TYPE_BASE64:
+                return binascii.a2b_base64(text)
+            elif dataType == IdbankStorageType.IDB_TYPE_HEX:
+                return binascii.a2b_hex(text)
+        except (binascii.Error, ValueError):
+            pass
+        if not isinstance(text, str):
+            text = str(text, 'ascii')
+        return bytes(IdbankStorageEngine.__getText2Bin(dataType).convert(text))
+
 ################################################################################
 #                                End of file                                   #
 ################################################################################
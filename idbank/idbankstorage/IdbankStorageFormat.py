@@ -28,8 +28,24 @@
 # Import(s)                                                                    #
 ################################################################################
 
+import bz2
+import gzip
+import struct
+
 import bintexttools
 
+from idbank import IdbCache
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
 
 ################################################################################
 # Module                                                                       #
@@ -74,6 +90,22 @@ class IdbankStorageInfo:
         return formatString
 
 
+    @staticmethod
+    def tagValueOffsets(data, tag: str, start: int = 0):
+        # Offsets of the tag value in data (str or bytes) without slicing, None when the tag is not at start
+        separator = IdbankStorageInfo.IDB_SEPARATOR
+        if not isinstance(data, str):
+            tag = tag.encode('ascii')
+            separator = separator.encode('ascii')
+        if not data.startswith(tag, start) or not data.startswith(separator, start + len(tag)):
+            return None
+        valueStart = start + len(tag) + len(separator)
+        valueEnd = data.find(separator, valueStart)
+        if valueEnd < 0:
+            valueEnd = len(data)
+        return valueStart, valueEnd
+
+
 class IdbankStorageTags:
     # Available tags
     IDB_FORMAT_TAG = 'IDB_F'
@@ -87,6 +119,7 @@ class IdbankStorageFormat:
     # Available formats
     IDB_FORMAT_CLEAR = 'CLEAR'
     IDB_FORMAT_V1 = 'V1'
+    IDB_FORMAT_V2 = 'V2'
 
     # Default format for storage engine
     default = IDB_FORMAT_V1
@@ -152,10 +185,175 @@ class IdbankStorageCompression:
     # Available compressions
     IDB_COMPRESSION_GZIP = 'GZIP'
     IDB_COMPRESSION_BZ2 = 'BZ2'
+    IDB_COMPRESSION_ZSTD = 'ZSTD'
+    IDB_COMPRESSION_LZ4 = 'LZ4'
 
     # Default type for storage engine
     default = IDB_COMPRESSION_GZIP
 
+    # Compression byte of the V2 header
+    codes = {
+        None: 0,
+        IDB_COMPRESSION_GZIP: 1,
+        IDB_COMPRESSION_BZ2: 2,
+        IDB_COMPRESSION_ZSTD: 3,
+        IDB_COMPRESSION_LZ4: 4,
+    }
+    names = {code: name for name, code in codes.items()}
+
+    # Trained zstd dictionaries by dictionary id
+    dictionaries = IdbCache(256)
+
+    @staticmethod
+    def trainDictionary(samples: list, dictionarySize: int = 16384) -> bytes:
+        if zstandard is None:
+            raise ValueError("The IDB compression '{}' is not available.".format(
+                IdbankStorageCompression.IDB_COMPRESSION_ZSTD))
+        return zstandard.train_dictionary(dictionarySize, samples).as_bytes()
+
+    @staticmethod
+    def registerDictionary(dictionaryData: bytes) -> int:
+        if zstandard is None:
+            raise ValueError("The IDB compression '{}' is not available.".format(
+                IdbankStorageCompression.IDB_COMPRESSION_ZSTD))
+        dictionary = zstandard.ZstdCompressionDict(bytes(dictionaryData))
+        IdbankStorageCompression.dictionaries.put(dictionary.dict_id(), dictionary)
+        return dictionary.dict_id()
+
+    @staticmethod
+    def getDictionary(dictionaryId: int):
+        return IdbankStorageCompression.dictionaries.get(dictionaryId)
+
+    @staticmethod
+    def exportDictionaries(dictionaryIds) -> dict:
+        # Registered dictionaries data by id, used to pass the dictionaries to the worker processes
+        dictionaries = {}
+        for dictionaryId in dictionaryIds:
+            dictionary = IdbankStorageCompression.getDictionary(dictionaryId)
+            if dictionary is not None:
+                dictionaries[dictionaryId] = dictionary.as_bytes()
+        return dictionaries
+
+    @staticmethod
+    def importDictionaries(dictionaries: dict):
+        for dictionaryId, dictionaryData in (dictionaries or {}).items():
+            if IdbankStorageCompression.getDictionary(dictionaryId) is None:
+                IdbankStorageCompression.registerDictionary(dictionaryData)
+
+    # Data smaller than the threshold (bytes) is not compressed
+    threshold = 1024
+
+    @staticmethod
+    def available(compression: str) -> bool:
+        if compression == IdbankStorageCompression.IDB_COMPRESSION_ZSTD:
+            return zstandard is not None
+        if compression == IdbankStorageCompression.IDB_COMPRESSION_LZ4:
+            return lz4 is not None
+        return compression in (IdbankStorageCompression.IDB_COMPRESSION_GZIP,
+                               IdbankStorageCompression.IDB_COMPRESSION_BZ2)
+
+    @staticmethod
+    def compress(data: bytes, compression: str, dictionaryId: int = None) -> bytes:
+        if dictionaryId is not None:
+            return zstandard.ZstdCompressor(dict_data=IdbankStorageCompression.__dictionary(dictionaryId)) \
+                .compress(data)
+        elif compression == IdbankStorageCompression.IDB_COMPRESSION_GZIP:
+            return gzip.compress(data, mtime=0)
+        elif compression == IdbankStorageCompression.IDB_COMPRESSION_BZ2:
+            return bz2.compress(data)
+        elif compression == IdbankStorageCompression.IDB_COMPRESSION_ZSTD and zstandard is not None:
+            return zstandard.ZstdCompressor().compress(data)
+        elif compression == IdbankStorageCompression.IDB_COMPRESSION_LZ4 and lz4 is not None:
+            return lz4.frame.compress(data)
+        raise ValueError("The IDB compression '{}' is not available.".format(compression))
+
+    @staticmethod
+    def __dictionary(dictionaryId: int):
+        dictionary = IdbankStorageCompression.getDictionary(dictionaryId)
+        if dictionary is None:
+            raise ValueError("The IDB compression dictionary '{}' is not loaded.".format(dictionaryId))
+        return dictionary
+
+    @staticmethod
+    def decompress(data: bytes, compression: str, dictionaryId: int = None) -> bytes:
+        if dictionaryId is not None:
+            return zstandard.ZstdDecompressor(dict_data=IdbankStorageCompression.__dictionary(dictionaryId)) \
+                .decompress(data)
+        elif compression == IdbankStorageCompression.IDB_COMPRESSION_GZIP:
+            return gzip.decompress(data)
+        elif compression == IdbankStorageCompression.IDB_COMPRESSION_BZ2:
+            return bz2.decompress(data)
+        elif compression == IdbankStorageCompression.IDB_COMPRESSION_ZSTD and zstandard is not None:
+            return zstandard.ZstdDecompressor().decompress(data)
+        elif compression == IdbankStorageCompression.IDB_COMPRESSION_LZ4 and lz4 is not None:
+            return lz4.frame.decompress(data)
+        raise ValueError("The IDB compression '{}' is not available.".format(compression))
+
+    @staticmethod
+    def detect(data: str):
+        formatString = None
+        tagValue = IdbankStorageInfo.detectTagValue(data, IdbankStorageTags.IDB_COMPRESSION_TAG)
+        if tagValue and isinstance(tagValue, dict) and \
+                'tag' in tagValue and \
+                'value' in tagValue and \
+                'data' in tagValue:
+            formatString = tagValue
+        return formatString
+
+
+class IdbankStorageHeader:
+    # V2 binary header: magic, version, type, compression and flags bytes followed by the payload
+    IDB_MAGIC = b'IDB'
+    IDB_VERSION_V2 = 2
+
+    # Payload types
+    IDB_PAYLOAD_UTF8 = 1
+
+    # Flags
+    IDB_FLAG_NONE = 0
+    # Zstd dictionary compression, the dictionary id follows the header
+    IDB_FLAG_DICTIONARY = 1
+
+    structure = struct.Struct('>3sBBBB')
+    size = structure.size
+    dictionaryStructure = struct.Struct('>I')
+
+    @staticmethod
+    def pack(payloadType: int, compression: str = None, flags: int = IDB_FLAG_NONE,
+             dictionaryId: int = None) -> bytes:
+        if dictionaryId is not None:
+            flags |= IdbankStorageHeader.IDB_FLAG_DICTIONARY
+        header = IdbankStorageHeader.structure.pack(IdbankStorageHeader.IDB_MAGIC,
+                                                    IdbankStorageHeader.IDB_VERSION_V2,
+                                                    payloadType,
+                                                    IdbankStorageCompression.codes[compression],
+                                                    flags)
+        if dictionaryId is not None:
+            header += IdbankStorageHeader.dictionaryStructure.pack(dictionaryId)
+        return header
+
+    @staticmethod
+    def detect(data: bytes):
+        header = None
+        if len(data) >= IdbankStorageHeader.size:
+            magic, version, payloadType, compression, flags = IdbankStorageHeader.structure.unpack_from(data)
+            if magic == IdbankStorageHeader.IDB_MAGIC and version == IdbankStorageHeader.IDB_VERSION_V2:
+                header = {
+                    'version': version,
+                    'type': payloadType,
+                    'compression': IdbankStorageCompression.names.get(compression, compression),
+                    'flags': flags,
+                    'dictionaryId': None,
+                    'size': IdbankStorageHeader.size,
+                }
+                if flags & IdbankStorageHeader.IDB_FLAG_DICTIONARY:
+                    if len(data) < IdbankStorageHeader.size + IdbankStorageHeader.dictionaryStructure.size:
+                        return None
+                    header['dictionaryId'] = IdbankStorageHeader.dictionaryStructure.unpack_from(
+                        data, IdbankStorageHeader.size)[0]
+                    header['size'] += IdbankStorageHeader.dictionaryStructure.size
+        return header
+
 
 class IdbankStorageEncryption:
     # Available encryptions
@@ -0,0 +1,385 @@
+# -*- coding: utf-8 -*-
+# * ********************************************************************* *
+# *                                                                       *
+# *   Identity Bank data driver                                           *
+# *   This file is part of idbank. This project may be found at:          *
+# *   https://github.com/IdentityBank/Python_idbank.                      *
+# *                                                                       *
+# *   Copyright (C) 2020 by Identity Bank. All Rights Reserved.           *
+# *   https://www.identitybank.eu - You belong to you                     *
+# *                                                                       *
+# *   This program is free software: you can redistribute it and/or       *
+# *   modify it under the terms of the GNU Affero General Public          *
+# *   License as published by the Free Software Foundation, either        *
+# *   version 3 of the License, or (at your option) any later version.    *
+# *                                                                       *
+# *   This program is distributed in the hope that it will be useful,     *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of      *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the        *
+# *   GNU Affero General Public License for more details.                 *
+# *                                                                       *
+# *   You should have received a copy of the GNU Affero General Public    *
+# *   License along with this program. If not, see                        *
+# *   https://www.gnu.org/licenses/.                                      *
+# *                                                                       *
+# * ********************************************************************* *
+
+################################################################################
+# Import(s)                                                                    #
+################################################################################
+
+import base64
+import decimal
+import json
+import logging
+from abc import abstractmethod
+
+from boto3.dynamodb.types import Binary
+
+from idbank import IdbCommon
+from .IdbankStorageBase import IdbankStorageBase
+from .IdbankStorageFormat import IdbankStorageFormat, IdbankStorageType, IdbankStorageCompression
+from .IdbankStorageEngine import IdbankStorageEngine
+from .IdbankStorageResult import IdbankStorageResult
+
+
+################################################################################
+# Module                                                                       #
+################################################################################
+
+class DecimalEncoder(json.JSONEncoder):
+    def default(self, o):
+        if isinstance(o, decimal.Decimal):
+            if o % 1 > 0:
+                return float(o)
+            else:
+                return int(o)
+        if isinstance(o, Binary):
+            o = o.value
+        if isinstance(o, (bytes, bytearray)):
+            return base64.b64encode(o).decode('ascii')
+        return super(DecimalEncoder, self).default(o)
+
+
+class IdbankStorageItems(IdbankStorageBase):
+    # Key layout, item format, dictionaries and pagination shared by the DynamoDB storages (AwsDynamoDb, MemoryDb),
+    # the storages provide the account partition pages (iteratePages) and the dictionary items
+    storageEngine = None
+    storageEngineAccount = None
+    # Parsing does not depend on the connection options, one engine serves all the instances
+    parseEngine = IdbankStorageEngine()
+
+    # Format of the stored items: V1 (tagged text) or V2 (binary header, Binary attribute)
+    storageFormat = IdbankStorageFormat.IDB_FORMAT_V1
+    # Compression of the stored items and the smallest item size (bytes) to compress, off by default:
+    # readers older than the IDB_C tag cannot parse compressed V1 items during a rollout
+    compression = None
+    compressionThreshold = IdbankStorageCompression.threshold
+    # V2 items compressed with the trained zstd dictionary of the account (trainAccountDictionary)
+    compressionDictionary = False
+    # Sampled items and size (bytes) of the trained dictionary
+    dictionarySamples = 1000
+    dictionarySize = 16384
+    # Process pool size for converting and parsing large batches (0 - in process)
+    parseProcesses = 0
+    # Items of a findItemsPage page without a page size, the rest is read with the returned NextToken
+    findPageSize = 1000
+
+    __metadataMissing = object()
+
+    dbKeyNames = {
+        'account': 'idbaccount',
+        'id': 'idbid',
+        'public': 'idbpublic',
+        'protected': 'idbprotected',
+        'private': 'idbprivate'
+    }
+
+    attributesKeyNames = {
+        'metadata': 'idbmetadata',
+        'delete': 'idbdelete',
+        'item': 'idbitem',
+        'events': 'idbevents',
+        'assets': 'idbitem',
+        'dictionary': 'idbdictionary',
+    }
+
+    def getMetadataCache(self):
+        return None
+
+    def invalidateAccountMetadata(self):
+        pass
+
+    @abstractmethod
+    def getDictionaryAttribute(self, accountName, idbId):
+        pass
+
+    @abstractmethod
+    def setAccountDictionary(self, dictionaryId, dictionaryData):
+        pass
+
+    @abstractmethod
+    def iteratePages(self, query, count=False, idbCertificate=None):
+        pass
+
+    def itemKey(self, idbId):
+        return {self.dbKeyNames['account']: self.accountName, self.dbKeyNames['id']: idbId}
+
+    def storageEngineOptions(self):
+        # compression: GZIP, BZ2, ZSTD or LZ4 (opt-in), empty disables compression of the stored items
+        compression = self.configuration.get('compression', self.compression)
+        options = {
+            'idbFormat': self.configuration.get('storage_format', self.storageFormat),
+            'idbType': IdbankStorageType.IDB_TYPE_BASE64,
+            'idbCompression': compression.upper() if compression else None,
+            'idbCompressionThreshold': self.configuration.get('compression_threshold', self.compressionThreshold),
+        }
+        # compression_dictionary: the account dictionary is used by V2 only, accounts without one use compression
+        if IdbCommon.str2Bool(str(self.configuration.get('compression_dictionary', self.compressionDictionary))) \
+                and options['idbFormat'] == IdbankStorageFormat.IDB_FORMAT_V2 and self.accountName:
+            options['idbDictionary'] = self.accountDictionary()
+        return options
+
+    def getStorageEngine(self):
+        # The options depend on the account (dictionary compression)
+        if self.storageEngine is None or self.storageEngineAccount != self.accountName:
+            self.storageEngine = IdbankStorageEngine(self.storageEngineOptions())
+            self.storageEngineAccount = self.accountName
+        return self.storageEngine
+
+    def dictionaryItemId(self, dictionaryId):
+        return '{}#{}'.format(self.attributesKeyNames['dictionary'], dictionaryId)
+
+    def loadAccountDictionary(self, dictionaryId, accountName=None):
+        # Registers the dictionary stored in its own reserved item of the account
+        if IdbankStorageCompression.getDictionary(dictionaryId) is None:
+            dictionaryData = self.getDictionaryAttribute(accountName or self.accountName,
+                                                         self.dictionaryItemId(dictionaryId))
+            if dictionaryData is None:
+                return False
+            IdbankStorageCompression.registerDictionary(
+                dictionaryData.value if isinstance(dictionaryData, Binary) else dictionaryData)
+        return True
+
+    def accountDictionary(self):
+        # Current dictionary id of the account (metadata item) read through the metadata cache
+        metadataCache = self.getMetadataCache()
+        cacheKey = (self.accountName, self.attributesKeyNames['dictionary'])
+        dictionaryId = IdbankStorageItems.__metadataMissing
+        if metadataCache is not None:
+            dictionaryId = metadataCache.get(cacheKey, IdbankStorageItems.__metadataMissing)
+        if dictionaryId is IdbankStorageItems.__metadataMissing:
+            dictionaryId = self.getDictionaryAttribute(self.accountName, self.attributesKeyNames['metadata'])
+            dictionaryId = int(dictionaryId) if dictionaryId is not None else None
+            if metadataCache is not None:
+                metadataCache.put(cacheKey, dictionaryId)
+        if dictionaryId is not None and not self.loadAccountDictionary(dictionaryId):
+            return None
+        return dictionaryId
+
+    def trainAccountDictionary(self, sampleSize=None, dictionarySize=None):
+        # Trains the zstd dictionary from the sampled account items and stores it as the current one of the account,
+        # new V2 items of the account are compressed with it (compression_dictionary)
+        sampleSize = int(sampleSize or self.configuration.get('dictionary_samples', self.dictionarySamples))
+        dictionarySize = int(dictionarySize or self.configuration.get('dictionary_size', self.dictionarySize))
+        samples = []
+        for item in self.iterateItems({'Limit': min(sampleSize, 1000)}):
+            if self.isReservedItem(item):
+                continue
+            data = self.parseItem(item)
+            if data:
+                samples.append(data.encode('utf-8') if isinstance(data, str) else bytes(data))
+            if len(samples) >= sampleSize:
+                break
+        try:
+            dictionaryData = IdbankStorageCompression.trainDictionary(samples, dictionarySize)
+        except Exception as e:
+            logging.error('Dictionary training error: ' + str(e))
+            return IdbankStorageResult(IdbankStorageResult.STATUS_ERROR, errorMessage=str(e))
+        dictionaryId = IdbankStorageCompression.registerDictionary(dictionaryData)
+        result = self.setAccountDictionary(dictionaryId, dictionaryData)
+        self.invalidateAccountMetadata()
+        self.storageEngine = None
+        if result.ok:
+            result.item = dictionaryId
+        return result
+
+    def loadItemDictionaries(self, items, values):
+        # Dictionaries of the items not registered in this process are read from the accounts of the items
+        for item, value in zip(items, values):
+            if isinstance(value, (bytes, bytearray)):
+                for dictionaryId in self.parseEngine.dictionaryIds([value]):
+                    if IdbankStorageCompression.getDictionary(dictionaryId) is None:
+                        self.loadAccountDictionary(dictionaryId, item.get(self.dbKeyNames['account'], self.accountName))
+
+    def formatItem(self, data):
+        storageEngine = self.getStorageEngine()
+        if not isinstance(data, str):
+            data = json.dumps(data)
+        data = storageEngine.convert(data)
+        return {
+            self.dbKeyNames['public']:
+                {
+                    self.attributesKeyNames['item']: data
+                },
+            # For initial release we do not store any protected and private data
+            # self.dbKeyNames['protected']: None,
+            # self.dbKeyNames['private']: None
+        }
+
+    def formatItems(self, dataItems):
+        # Converts all the data in one pass, large batches may go to the process pool
+        processes = int(self.configuration.get('parse_processes', self.parseProcesses) or 0)
+        dataItems = [data if isinstance(data, str) else json.dumps(data) for data in dataItems]
+        return [{self.dbKeyNames['public']: {self.attributesKeyNames['item']: data}}
+                for data in self.getStorageEngine().convertMany(dataItems, processes)]
+
+    def itemData(self, item):
+        # Stored public data of the item
+        if item is not None and \
+                self.dbKeyNames['public'] in item and \
+                self.attributesKeyNames['item'] in item[self.dbKeyNames['public']]:
+            item = item[self.dbKeyNames['public']][self.attributesKeyNames['item']]
+            if isinstance(item, Binary):
+                item = item.value
+        else:
+            item = None
+        return item
+
+    def parseItem(self, item):
+        value = self.itemData(item)
+        if isinstance(value, (bytes, bytearray)):
+            self.loadItemDictionaries([item], [value])
+        if isinstance(value, (str, bytes, bytearray)):
+            value = self.parseEngine.parse(value)
+        return value
+
+    def parseItems(self, items):
+        # All the items of a page in one pass, large pages may go to the process pool
+        items = list(items)
+        values = [self.itemData(item) for item in items]
+        self.loadItemDictionaries(items, values)
+        indexes = [index for index, value in enumerate(values) if isinstance(value, (str, bytes, bytearray))]
+        processes = int(self.configuration.get('parse_processes', self.parseProcesses) or 0)
+        parsedValues = self.parseEngine.parseMany([values[index] for index in indexes], processes)
+        for index, value in zip(indexes, parsedValues):
+            values[index] = value
+        return values
+
+    def isReservedId(self, idbId):
+        return idbId in (self.attributesKeyNames['metadata'], self.attributesKeyNames['delete']) or \
+               (isinstance(idbId, str) and idbId.startswith(self.attributesKeyNames['dictionary'] + '#'))
+
+    def isReservedItem(self, item):
+        # Metadata, delete marker and dictionary items are not account data, every read path skips them
+        return item is not None and self.isReservedId(item.get(self.dbKeyNames['id']))
+
+    def countItems(self, query, idbCertificate=None):
+        # Exact count, sums the counts of all the pages
+        count = None
+        for response in self.iteratePages(query, True, idbCertificate):
+            if response is not None and \
+                    'Count' in response:
+                count = (count or 0) + response['Count']
+        return count
+
+    def countAllItems(self, idbCertificate=None):
+        return self.countItems(None, idbCertificate)
+
+    def iterateItems(self, query, idbCertificate=None):
+        for response in self.iteratePages(query, False, idbCertificate):
+            if response is not None and 'Items' in response:
+                for item in response['Items']:
+                    yield item
+
+    def formatExportItem(self, item):
+        return {
+            'account': item[self.dbKeyNames['account']],
+            'idbId': item[self.dbKeyNames['id']],
+            'data': self.parseItem(item),
+        }
+
+    def formatExportItems(self, items):
+        return [{
+            'account': item[self.dbKeyNames['account']],
+            'idbId': item[self.dbKeyNames['id']],
+            'data': data,
+        } for item, data in zip(items, self.parseItems(items))]
+
+    def exportAccountItems(self, idbCertificate=None):
+        # Export of the current account only, yields pages of formatted items
+        for response in self.iteratePages({}, False, idbCertificate):
+            if response is None or 'Items' not in response:
+                break
+            items = [item for item in response['Items'] if not self.isReservedItem(item)]
+            if items:
+                yield self.formatExportItems(items)
+
+    def generateExclusiveStartKey(self, page):
+        return {self.dbKeyNames['account']: self.accountName, self.dbKeyNames['id']: page}
+
+    @staticmethod
+    def encodeNextToken(idbId):
+        tokenData = json.dumps({'k': idbId}, cls=DecimalEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(tokenData.encode('UTF-8')).decode('ascii')
+
+    @staticmethod
+    def decodeNextToken(token):
+        try:
+            return json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('UTF-8'))['k']
+        except (Exception, ValueError):
+            raise ValueError('Bad pagination token.')
+
+    def formatFindItem(self, query, item):
+        if query and 'ProjectionExpression' in query and query['ProjectionExpression']:
+            if query['ProjectionExpression'] == self.dbKeyNames['id']:
+                return item[self.dbKeyNames['id']]
+            return json.loads(json.dumps(item, cls=DecimalEncoder))
+        return {item[self.dbKeyNames['id']]: self.parseItem(item)}
+
+    def formatFindItems(self, query, items):
+        if query and 'ProjectionExpression' in query and query['ProjectionExpression']:
+            return [self.formatFindItem(query, item) for item in items]
+        return [{item[self.dbKeyNames['id']]: data} for item, data in zip(items, self.parseItems(items))]
+
+    def iterateFindItems(self, query, pageSize=None, startingToken=None, summary=None, idbCertificate=None):
+        # Yields the formatted items of every DynamoDB page until the page size is reached,
+        # summary gets the NextToken to continue after the last returned item
+        query = dict(query) if query else {}
+        if startingToken:
+            query['ExclusiveStartKey'] = self.generateExclusiveStartKey(self.decodeNextToken(startingToken))
+        if pageSize:
+            query['Limit'] = pageSize
+        count = 0
+        for response in self.iteratePages(query, False, idbCertificate):
+            if response is None or 'Items' not in response:
+                break
+            rows = []
+            items = response['Items']
+            for itemIndex, item in enumerate(items):
+                if self.isReservedItem(item):
+                    continue
+                rows.append(item)
+                count += 1
+                if pageSize and count >= pageSize:
+                    if summary is not None and \
+                            (itemIndex + 1 < len(items) or 'LastEvaluatedKey' in response):
+                        summary['NextToken'] = self.encodeNextToken(item[self.dbKeyNames['id']])
+                    break
+            if rows:
+                yield self.formatFindItems(query, rows)
+            if pageSize and count >= pageSize:
+                break
+
+    def findItemsPage(self, query, pageSize=None, startingToken=None, idbCertificate=None):
+        pageSize = pageSize or int(self.configuration.get('find_page_size', self.findPageSize))
+        result = {}
+        items = []
+        for rows in self.iterateFindItems(query, pageSize, startingToken, result, idbCertificate):
+            items += rows
+        result['Items'] = items
+        return result
+
+################################################################################
+#                                End of file                                   #
+################################################################################
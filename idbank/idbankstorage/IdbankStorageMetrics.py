@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+# * ********************************************************************* *
+# *                                                                       *
+# *   Identity Bank data driver                                           *
+# *   This file is part of idbank. This project may be found at:          *
+# *   https://github.com/IdentityBank/Python_idbank.                      *
+# *                                                                       *
+# *   Copyright (C) 2020 by Identity Bank. All Rights Reserved.           *
+# *   https://www.identitybank.eu - You belong to you                     *
+# *                                                                       *
+# *   This program is free software: you can redistribute it and/or       *
+# *   modify it under the terms of the GNU Affero General Public          *
+# *   License as published by the Free Software Foundation, either        *
+# *   version 3 of the License, or (at your option) any later version.    *
+# *                                                                       *
+# *   This program is distributed in the hope that it will be useful,     *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of      *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the        *
+# *   GNU Affero General Public License for more details.                 *
+# *                                                                       *
+# *   You should have received a copy of the GNU Affero General Public    *
+# *   License along with this program. If not, see                        *
+# *   https://www.gnu.org/licenses/.                                      *
+# *                                                                       *
+# * ********************************************************************* *
+
+################################################################################
+# Import(s)                                                                    #
+################################################################################
+
+import threading
+
+
+################################################################################
+# Module                                                                       #
+################################################################################
+
+class IdbankStorageMetrics:
+    # Consumed capacity registry of the process, totals per account, table and query type
+    __registry = {}
+    __registryLock = threading.Lock()
+
+    def __init__(self):
+        # Totals of a single storage instance (one IDB request)
+        self.lock = threading.Lock()
+        self.totals = IdbankStorageMetrics.emptyTotals()
+
+    @staticmethod
+    def emptyTotals():
+        return {'Calls': 0, 'CapacityUnits': 0.0, 'ReadCapacityUnits': 0.0, 'WriteCapacityUnits': 0.0}
+
+    @staticmethod
+    def capacityUnits(consumedCapacity, write=False):
+        # consumedCapacity: ConsumedCapacity of a single call or the list returned by batch and transact calls
+        if isinstance(consumedCapacity, dict):
+            consumedCapacity = [consumedCapacity]
+        capacityUnits = readCapacityUnits = writeCapacityUnits = 0.0
+        for capacity in consumedCapacity or []:
+            units = float(capacity.get('CapacityUnits', 0))
+            capacityUnits += units
+            if 'ReadCapacityUnits' in capacity or 'WriteCapacityUnits' in capacity:
+                readCapacityUnits += float(capacity.get('ReadCapacityUnits', 0))
+                writeCapacityUnits += float(capacity.get('WriteCapacityUnits', 0))
+            elif write:
+                writeCapacityUnits += units
+            else:
+                readCapacityUnits += units
+        return capacityUnits, readCapacityUnits, writeCapacityUnits
+
+    @staticmethod
+    def addTotals(totals, consumedCapacity, write):
+        capacityUnits, readCapacityUnits, writeCapacityUnits = \
+            IdbankStorageMetrics.capacityUnits(consumedCapacity, write)
+        totals['Calls'] += 1
+        totals['CapacityUnits'] += capacityUnits
+        totals['ReadCapacityUnits'] += readCapacityUnits
+        totals['WriteCapacityUnits'] += writeCapacityUnits
+
+    def add(self, consumedCapacity, write=False):
+        with self.lock:
+            IdbankStorageMetrics.addTotals(self.totals, consumedCapacity, write)
+
+    def consumedCapacity(self):
+        with self.lock:
+            return dict(self.totals)
+
+    @staticmethod
+    def record(accountName, tableName, queryType, consumedCapacity, write=False):
+        key = (accountName or '*', tableName, queryType)
+        with IdbankStorageMetrics.__registryLock:
+            totals = IdbankStorageMetrics.__registry.get(key)
+            if totals is None:
+                totals = IdbankStorageMetrics.__registry[key] = IdbankStorageMetrics.emptyTotals()
+            IdbankStorageMetrics.addTotals(totals, consumedCapacity, write)
+
+    @staticmethod
+    def snapshot(accountName=None):
+        # {account: {table: {queryType: totals}}}
+        with IdbankStorageMetrics.__registryLock:
+            registry = [(key, dict(totals)) for key, totals in IdbankStorageMetrics.__registry.items()]
+        metrics = {}
+        for (account, tableName, queryType), totals in registry:
+            if accountName is None or account == accountName:
+                metrics.setdefault(account, {}).setdefault(tableName, {})[queryType] = totals
+        return metrics
+
+    @staticmethod
+    def reset():
+        with IdbankStorageMetrics.__registryLock:
+            IdbankStorageMetrics.__registry.clear()
+
+################################################################################
+#                                End of file                                   #
+################################################################################
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+# * ********************************************************************* *
+# *                                                                       *
+# *   Identity Bank data driver                                           *
+# *   This file is part of idbank. This project may be found at:          *
+# *   https://github.com/IdentityBank/Python_idbank.                      *
+# *                                                                       *
+# *   Copyright (C) 2020 by Identity Bank. All Rights Reserved.           *
+# *   https://www.identitybank.eu - You belong to you                     *
+# *                                                                       *
+# *   This program is free software: you can redistribute it and/or       *
+# *   modify it under the terms of the GNU Affero General Public          *
+# *   License as published by the Free Software Foundation, either        *
+# *   version 3 of the License, or (at your option) any later version.    *
+# *                                                                       *
+# *   This program is distributed in the hope that it will be useful,     *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of      *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the        *
+# *   GNU Affero General Public License for more details.                 *
+# *                                                                       *
+# *   You should have received a copy of the GNU Affero General Public    *
+# *   License along with this program. If not, see                        *
+# *   https://www.gnu.org/licenses/.                                      *
+# *                                                                       *
+# * ********************************************************************* *
+
+################################################################################
+# Import(s)                                                                    #
+################################################################################
+
+from botocore.exceptions import ClientError
+
+from .IdbankStorageRetry import IdbankStorageRetry
+
+
+################################################################################
+# Module                                                                       #
+################################################################################
+
+class IdbankStorageResult:
+    # Available statuses
+    STATUS_OK = 'OK'
+    STATUS_NOT_FOUND = 'NotFound'
+    STATUS_CONDITION_FAILED = 'ConditionFailed'
+    STATUS_THROTTLED = 'Throttled'
+    STATUS_ERROR = 'Error'
+
+    CONDITION_FAILED_CODES = ('ConditionalCheckFailedException', 'TransactionCanceledException')
+
+    __slots__ = ('status', 'item', 'consumedCapacity', 'errorCode', 'errorMessage')
+
+    def __init__(self, status: str, item=None, consumedCapacity=None, errorCode: str = None,
+                 errorMessage: str = None):
+        self.status = status
+        self.item = item
+        self.consumedCapacity = consumedCapacity
+        self.errorCode = errorCode
+        self.errorMessage = errorMessage
+
+    @property
+    def ok(self) -> bool:
+        return self.status == IdbankStorageResult.STATUS_OK
+
+    @property
+    def notFound(self) -> bool:
+        return self.status == IdbankStorageResult.STATUS_NOT_FOUND
+
+    @property
+    def conditionFailed(self) -> bool:
+        return self.status == IdbankStorageResult.STATUS_CONDITION_FAILED
+
+    @property
+    def throttled(self) -> bool:
+        return self.status == IdbankStorageResult.STATUS_THROTTLED
+
+    @staticmethod
+    def fromResponse(response: dict, item=None, status: str = STATUS_OK):
+        consumedCapacity = response.get('ConsumedCapacity') if isinstance(response, dict) else None
+        return IdbankStorageResult(status, item, consumedCapacity)
+
+    @staticmethod
+    def fromError(error: Exception):
+        if isinstance(error, ClientError):
+            errorCode = error.response.get('Error', {}).get('Code')
+            errorMessage = error.response.get('Error', {}).get('Message')
+            if errorCode in IdbankStorageResult.CONDITION_FAILED_CODES:
+                status = IdbankStorageResult.STATUS_CONDITION_FAILED
+            elif errorCode in IdbankStorageRetry.throttlingCodes:
+                status = IdbankStorageResult.STATUS_THROTTLED
+            else:
+                status = IdbankStorageResult.STATUS_ERROR
+            return IdbankStorageResult(status, errorCode=errorCode, errorMessage=errorMessage)
+        return IdbankStorageResult(IdbankStorageResult.STATUS_ERROR, errorCode=type(error).__name__,
+                                   errorMessage=str(error))
+
+    def __repr__(self):
+        return 'IdbankStorageResult(status={}, errorCode={})'.format(self.status, self.errorCode)
+
+################################################################################
+#                                End of file                                   #
+################################################################################
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+# * ********************************************************************* *
+# *                                                                       *
+# *   Identity Bank data driver                                           *
+# *   This file is part of idbank. This project may be found at:          *
+# *   https://github.com/IdentityBank/Python_idbank.                      *
+# *                                                                       *
+# *   Copyright (C) 2020 by Identity Bank. All Rights Reserved.           *
+# *   https://www.identitybank.eu - You belong to you                     *
+# *                                                                       *
+# *   This program is free software: you can redistribute it and/or       *
+# *   modify it under the terms of the GNU Affero General Public          *
+# *   License as published by the Free Software Foundation, either        *
+# *   version 3 of the License, or (at your option) any later version.    *
+# *                                                                       *
+# *   This program is distributed in the hope that it will be useful,     *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of      *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the        *
+# *   GNU Affero General Public License for more details.                 *
+# *                                                                       *
+# *   You should have received a copy of the GNU Affero General Public    *
+# *   License along with this program. If not, see                        *
+# *   https://www.gnu.org/licenses/.                                      *
+# *                                                                       *
+# * ********************************************************************* *
+
+################################################################################
+# Import(s)                                                                    #
+################################################################################
+
+import random
+import threading
+import time
+
+from botocore.exceptions import ClientError, ConnectionError, ConnectionClosedError, ReadTimeoutError
+
+
+################################################################################
+# Module                                                                       #
+################################################################################
+
+class IdbankStorageRetry:
+    # Error codes of the requests which were rejected because of the table or account throughput
+    throttlingCodes = ('ProvisionedThroughputExceededException', 'ThrottlingException', 'RequestLimitExceeded')
+    retryableCodes = throttlingCodes + ('InternalServerError', 'ServiceUnavailable')
+    # Transient connection errors, retried here as the botocore retries are disabled
+    connectionErrors = (ConnectionError, ConnectionClosedError, ReadTimeoutError)
+
+    def __init__(self, attempts=8, backoff=0.05, backoffMax=2.0):
+        self.attempts = attempts
+        self.backoff = backoff
+        self.backoffMax = backoffMax
+
+    @staticmethod
+    def errorCode(error):
+        if isinstance(error, ClientError):
+            return error.response.get('Error', {}).get('Code')
+        return None
+
+    @staticmethod
+    def isThrottlingError(error):
+        return IdbankStorageRetry.errorCode(error) in IdbankStorageRetry.throttlingCodes
+
+    def delay(self, attempt):
+        # Exponential backoff with full jitter
+        return random.uniform(0, min(self.backoffMax, self.backoff * (2 ** attempt)))
+
+    def sleep(self, attempt):
+        time.sleep(self.delay(attempt))
+
+    def call(self, function, limiter=None, **kwargs):
+        attempt = 0
+        while True:
+            if limiter is not None:
+                limiter.acquire()
+            try:
+                response = function(**kwargs)
+            except ClientError as e:
+                errorCode = IdbankStorageRetry.errorCode(e)
+                if limiter is not None and errorCode in IdbankStorageRetry.throttlingCodes:
+                    limiter.throttled()
+                if errorCode not in IdbankStorageRetry.retryableCodes or attempt >= self.attempts:
+                    raise
+                attempt += 1
+                self.sleep(attempt)
+                continue
+            except IdbankStorageRetry.connectionErrors:
+                if attempt >= self.attempts:
+                    raise
+                attempt += 1
+                self.sleep(attempt)
+                continue
+            if limiter is not None:
+                limiter.succeeded()
+            return response
+
+
+class IdbankStorageRateLimiter:
+    # Token bucket of capacity units per second shared by all the requests to a table,
+    # the rate is cut on throttling and recovers step by step while requests succeed
+    __limiters = {}
+    __limitersLock = threading.Lock()
+
+    decrease = 0.5
+    increase = 1.1
+    adjustInterval = 1.0
+
+    def __init__(self, rate=None, minRate=1.0):
+        # rate: capacity units per second, None does not limit until the first throttling
+        self.lock = threading.Lock()
+        self.maxRate = rate
+        self.rate = rate
+        self.minRate = minRate
+        self.tokens = rate or 0.0
+        self.updated = time.monotonic()
+        self.adjusted = self.updated
+        self.windowStart = self.updated
+        self.windowUnits = 0.0
+        self.observedRate = 0.0
+
+    @staticmethod
+    def getLimiter(key, rate=None, minRate=1.0):
+        limiter = IdbankStorageRateLimiter.__limiters.get(key)
+        if limiter is None:
+            with IdbankStorageRateLimiter.__limitersLock:
+                limiter = IdbankStorageRateLimiter.__limiters.setdefault(key, IdbankStorageRateLimiter(rate, minRate))
+        return limiter
+
+    def __refill(self, now):
+        # Bursts up to one second of the rate
+        if self.rate is not None:
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        # Waits while the bucket is in debt
+        while True:
+            with self.lock:
+                self.__refill(time.monotonic())
+                if self.rate is None or self.tokens > 0:
+                    return
+                wait = max(0.001, -self.tokens / self.rate)
+            time.sleep(wait)
+
+    def consume(self, units):
+        # The cost is known after the request (consumed capacity), so the bucket may go into debt
+        with self.lock:
+            now = time.monotonic()
+            self.__refill(now)
+            if self.rate is not None:
+                self.tokens -= units
+            self.windowUnits += units
+            elapsed = now - self.windowStart
+            if elapsed >= self.adjustInterval:
+                self.observedRate = self.windowUnits / elapsed
+                self.windowStart = now
+                self.windowUnits = 0.0
+
+    def throttled(self):
+        with self.lock:
+            now = time.monotonic()
+            self.__refill(now)
+            rate = self.rate
+            if rate is None:
+                elapsed = now - self.windowStart
+                rate = max(self.observedRate, self.windowUnits / elapsed if elapsed > 0 else 0.0)
+            self.rate = max(self.minRate, rate * self.decrease)
+            self.tokens = min(self.tokens, 0.0)
+            self.adjusted = now
+
+    def succeeded(self):
+        with self.lock:
+            if self.rate is None:
+                return
+            now = time.monotonic()
+            if now - self.adjusted < self.adjustInterval:
+                return
+            self.adjusted = now
+            self.rate *= self.increase
+            if self.maxRate is not None:
+                self.rate = min(self.rate, self.maxRate)
+            elif self.observedRate and self.rate > 2 * self.observedRate:
+                # Demand is well below the limit, back to not limited
+                self.rate = None
+
+    def stats(self):
+        with self.lock:
+            return {'rate': self.rate, 'maxRate': self.maxRate, 'minRate': self.minRate,
+                    'tokens': self.tokens, 'observedRate': self.observedRate}
+
+################################################################################
+#                                End of file                                   #
+################################################################################
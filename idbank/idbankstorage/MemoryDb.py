@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+# * ********************************************************************* *
+# *                                                                       *
+# *   Identity Bank data driver                                           *
+# *   This file is part of idbank. This project may be found at:          *
+# *   https://github.com/IdentityBank/Python_idbank.                      *
+# *                                                                       *
+# *   Copyright (C) 2020 by Identity Bank. All Rights Reserved.           *
+# *   https://www.identitybank.eu - You belong to you                     *
+# *                                                                       *
+# *   This program is free software: you can redistribute it and/or       *
+# *   modify it under the terms of the GNU Affero General Public          *
+# *   License as published by the Free Software Foundation, either        *
+# *   version 3 of the License, or (at your option) any later version.    *
+# *                                                                       *
+# *   This program is distributed in the hope that it will be useful,     *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of      *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the        *
+# *   GNU Affero General Public License for more details.                 *
+# *                                                                       *
+# *   You should have received a copy of the GNU Affero General Public    *
+# *   License along with this program. If not, see                        *
+# *   https://www.gnu.org/licenses/.                                      *
+# *                                                                       *
+# * ********************************************************************* *
+
+################################################################################
+# Import(s)                                                                    #
+################################################################################
+
+import atexit
+import base64
+import copy
+import decimal
+import json
+import logging
+import os
+import threading
+
+from .IdbankStorageItems import IdbankStorageItems, DecimalEncoder
+from .IdbankStorageResult import IdbankStorageResult
+from .IdbankStorageMetrics import IdbankStorageMetrics
+
+
+################################################################################
+# Module                                                                       #
+################################################################################
+
+class SnapshotEncoder(DecimalEncoder):
+    # Binary attributes (V2 items) are kept as {"__binary__": base64}
+    def default(self, o):
+        if isinstance(o, (bytes, bytearray)):
+            return {'__binary__': base64.b64encode(o).decode('ascii')}
+        return super(SnapshotEncoder, self).default(o)
+
+
+class MemoryDb(IdbankStorageItems):
+    # Tables are kept by the process: {table name: {'lock', 'items': {account: {idbId: item}}, 'snapshot'}}
+    __tables = {}
+    __tablesLock = threading.Lock()
+
+    def __init__(self, configuration):
+        IdbankStorageItems.__init__(self, configuration)
+        self.tableName = self.configuration.get('table_name', 'idbank')
+        self.table = MemoryDb.getMemoryTable(self.tableName, self.configuration.get('snapshot_file'))
+        self.metrics = IdbankStorageMetrics()
+
+    @staticmethod
+    def idb(configuration):
+        return MemoryDb(configuration)
+
+    @staticmethod
+    def getMemoryTable(tableName, snapshotFile=None):
+        table = MemoryDb.__tables.get(tableName)
+        if table is None:
+            with MemoryDb.__tablesLock:
+                table = MemoryDb.__tables.get(tableName)
+                if table is None:
+                    table = {'lock': threading.RLock(), 'items': {}, 'snapshot': snapshotFile}
+                    if snapshotFile:
+                        if os.path.exists(snapshotFile):
+                            table['items'] = MemoryDb.loadSnapshot(snapshotFile)
+                        atexit.register(MemoryDb.saveSnapshot, table)
+                    MemoryDb.__tables[tableName] = table
+        return table
+
+    @staticmethod
+    def loadSnapshot(snapshotFile):
+        with open(snapshotFile, 'r', encoding='UTF-8') as snapshot:
+            return json.load(snapshot, parse_float=decimal.Decimal, object_hook=MemoryDb.snapshotObject)
+
+    @staticmethod
+    def snapshotObject(value):
+        if len(value) == 1 and isinstance(value.get('__binary__'), str):
+            return base64.b64decode(value['__binary__'])
+        return value
+
+    @staticmethod
+    def saveSnapshot(table, snapshotFile=None):
+        snapshotFile = snapshotFile or table['snapshot']
+        if not snapshotFile:
+            return False
+        with table['lock']:
+            data = json.dumps(table['items'], cls=SnapshotEncoder)
+        # Written next to the snapshot and renamed, a crash never leaves a partial snapshot
+        temporaryFile = snapshotFile + '.tmp'
+        with open(temporaryFile, 'w', encoding='UTF-8') as snapshot:
+            snapshot.write(data)
+        os.replace(temporaryFile, snapshotFile)
+        logging.info('MemoryDb snapshot saved: ' + snapshotFile)
+        return True
+
+    def snapshot(self, snapshotFile=None):
+        return MemoryDb.saveSnapshot(self.table, snapshotFile)
+
+    @staticmethod
+    def dropTables():
+        with MemoryDb.__tablesLock:
+            MemoryDb.__tables.clear()
+
+    def accountItems(self):
+        # Caller holds the table lock
+        return self.table['items'].setdefault(self.accountName, {})
+
+    def consumedCapacity(self):
+        return self.metrics.consumedCapacity()
+
+    def useAccount(self, accountName, accountCertificate=None):
+        super().useAccount(accountName, accountCertificate)
+
+    def createAccount(self, accountName, accountCertificate=None):
+        self.useAccount(accountName, accountCertificate)
+        with self.table['lock']:
+            items = self.accountItems()
+            if self.attributesKeyNames['delete'] in items or self.attributesKeyNames['metadata'] in items:
+                return False
+            items[self.attributesKeyNames['metadata']] = {**self.itemKey(self.attributesKeyNames['metadata']),
+                                                          **self.formatItem({})}
+        return True
+
+    def deleteAccount(self, accountName, accountCertificate=None):
+        self.useAccount(accountName, accountCertificate)
+        with self.table['lock']:
+            items = self.accountItems()
+            metadata = items.get(self.attributesKeyNames['metadata'])
+            if not self.parseItem(metadata) or self.attributesKeyNames['delete'] in items:
+                return False
+            items[self.attributesKeyNames['delete']] = {**self.itemKey(self.attributesKeyNames['delete']),
+                                                        self.dbKeyNames['public']: metadata[self.dbKeyNames['public']]}
+            del items[self.attributesKeyNames['metadata']]
+        return True
+
+    def backupAccount(self, accountName, backupConfiguration, accountCertificate=None):
+        raise NotImplementedError("Not Implemented!")
+
+    def exportAccount(self, accountName, exportConfiguration, accountCertificate=None):
+        raise NotImplementedError("Not Implemented!")
+
+    def createAccountMetadata(self, accountCertificate=None):
+        return self.putItem(self.attributesKeyNames['metadata'], {}, accountCertificate)
+
+    def setAccountMetadata(self, metadata, accountCertificate=None):
+        return self.updateItem(self.attributesKeyNames['metadata'], metadata, accountCertificate)
+
+    def getAccountMetadata(self, accountCertificate=None):
+        return self.getItem(self.attributesKeyNames['metadata'], accountCertificate)
+
+    def deleteAccountMetadata(self, accountCertificate=None):
+        return self.deleteItem(self.attributesKeyNames['metadata'], accountCertificate)
+
+    def getDictionaryAttribute(self, accountName, idbId):
+        with self.table['lock']:
+            item = self.table['items'].get(accountName, {}).get(idbId)
+            return item.get(self.attributesKeyNames['dictionary']) if item else None
+
+    def setAccountDictionary(self, dictionaryId, dictionaryData):
+        with self.table['lock']:
+            items = self.accountItems()
+            # attribute_exists(#id)
+            if self.attributesKeyNames['metadata'] not in items:
+                return IdbankStorageResult(IdbankStorageResult.STATUS_CONDITION_FAILED,
+                                           errorCode='ConditionalCheckFailedException')
+            items[self.dictionaryItemId(dictionaryId)] = {
+                **self.itemKey(self.dictionaryItemId(dictionaryId)),
+                self.attributesKeyNames['dictionary']: bytes(dictionaryData),
+            }
+            items[self.attributesKeyNames['metadata']] = dict(items[self.attributesKeyNames['metadata']], **{
+                self.attributesKeyNames['dictionary']: dictionaryId,
+            })
+        return IdbankStorageResult(IdbankStorageResult.STATUS_OK)
+
+    def putItem(self, idbId, data, idbCertificate=None):
+        item = {**self.itemKey(idbId), **self.formatItem(data)}
+        with self.table['lock']:
+            items = self.accountItems()
+            # attribute_not_exists(#id)
+            if idbId in items:
+                return IdbankStorageResult(IdbankStorageResult.STATUS_CONDITION_FAILED,
+                                           errorCode='ConditionalCheckFailedException')
+            items[idbId] = item
+        return IdbankStorageResult(IdbankStorageResult.STATUS_OK)
+
+    def updateItem(self, idbId, data, idbCertificate=None):
+        public = self.formatItem(data)[self.dbKeyNames['public']]
+        with self.table['lock']:
+            items = self.accountItems()
+            # attribute_exists(#id)
+            if idbId not in items:
+                return IdbankStorageResult(IdbankStorageResult.STATUS_CONDITION_FAILED,
+                                           errorCode='ConditionalCheckFailedException')
+            items[idbId] = dict(items[idbId], **{self.dbKeyNames['public']: public})
+        return IdbankStorageResult(IdbankStorageResult.STATUS_OK)
+
+    def __getItem(self, idbId):
+        with self.table['lock']:
+            return copy.deepcopy(self.table['items'].get(self.accountName, {}).get(idbId))
+
+    def getItem(self, idbId, idbCertificate=None):
+        return self.parseItem(self.__getItem(idbId))
+
+    def getItemResult(self, idbId, idbCertificate=None):
+        item = self.parseItem(self.__getItem(idbId))
+        if item is None:
+            return IdbankStorageResult(IdbankStorageResult.STATUS_NOT_FOUND)
+        return IdbankStorageResult(IdbankStorageResult.STATUS_OK, item)
+
+    def deleteItem(self, idbId, idbCertificate=None):
+        with self.table['lock']:
+            items = self.accountItems()
+            # attribute_exists(#id)
+            if items.pop(idbId, None) is None:
+                return IdbankStorageResult(IdbankStorageResult.STATUS_NOT_FOUND,
+                                           errorCode='ConditionalCheckFailedException')
+        return IdbankStorageResult(IdbankStorageResult.STATUS_OK)
+
+    def putItems(self, items, conditional=False, idbCertificate=None):
+        result = {'Processed': 0, 'Unprocessed': [], 'Existing': []}
+        idbIds = []
+        for idbId in items.keys():
+            if self.isReservedId(idbId):
+                result['Unprocessed'].append(idbId)
+            else:
+                idbIds.append(idbId)
+        if conditional:
+            for idbId in idbIds:
+                if self.putItem(idbId, items[idbId], idbCertificate).conditionFailed:
+                    result['Existing'].append(idbId)
+                else:
+                    result['Processed'] += 1
+        else:
+            formattedItems = self.formatItems([items[idbId] for idbId in idbIds])
+            with self.table['lock']:
+                accountItems = self.accountItems()
+                for idbId, formattedItem in zip(idbIds, formattedItems):
+                    accountItems[idbId] = {**self.itemKey(idbId), **formattedItem}
+            result['Processed'] += len(idbIds)
+        return result
+
+    def getItems(self, idbIds, idbCertificate=None):
+        result = {'Items': {}, 'Unprocessed': []}
+        with self.table['lock']:
+            accountItems = self.table['items'].get(self.accountName, {})
+            items = {idbId: copy.deepcopy(accountItems[idbId]) for idbId in dict.fromkeys(idbIds)
+                     if not self.isReservedId(idbId) and idbId in accountItems}
+        for idbId, item in zip(items.keys(), self.parseItems(items.values())):
+            if item is not None:
+                result['Items'][idbId] = item
+        return result
+
+    def deleteItems(self, idbIds, conditional=False, idbCertificate=None):
+        result = {'Processed': 0, 'Unprocessed': [], 'NotFound': []}
+        for idbId in dict.fromkeys(idbIds):
+            if self.isReservedId(idbId):
+                result['Unprocessed'].append(idbId)
+            elif self.deleteItem(idbId, idbCertificate).notFound and conditional:
+                result['NotFound'].append(idbId)
+            else:
+                result['Processed'] += 1
+        return result
+
+    def countFindItems(self, query, idbCertificate=None):
+        count = self.countItems(query, idbCertificate)
+        with self.table['lock']:
+            reserved = sum(1 for idbId in self.table['items'].get(self.accountName, {}) if self.isReservedId(idbId))
+        return count - reserved
+
+    @staticmethod
+    def sortKey(idbId):
+        # Numbers are ordered before strings, so an account may mix both id types
+        if isinstance(idbId, (int, float, decimal.Decimal)) and not isinstance(idbId, bool):
+            return 0, idbId
+        return 1, str(idbId)
+
+    def queryPage(self, query, count=False):
+        # Query of the account partition in the sort key order with the DynamoDB page response layout
+        query = query or {}
+        if query.get('FilterExpression'):
+            raise ValueError('MemoryDb does not support FilterExpression, the query cannot be filtered.')
+        startKey = None
+        if query.get('ExclusiveStartKey'):
+            startKey = MemoryDb.sortKey(query['ExclusiveStartKey'][self.dbKeyNames['id']])
+        limit = int(query['Limit']) if query.get('Limit') else None
+        with self.table['lock']:
+            items = self.table['items'].get(self.accountName, {})
+            idbIds = sorted((idbId for idbId in items if startKey is None or MemoryDb.sortKey(idbId) > startKey),
+                            key=MemoryDb.sortKey)
+            lastEvaluatedKey = None
+            if limit and len(idbIds) > limit:
+                idbIds = idbIds[:limit]
+                lastEvaluatedKey = self.generateExclusiveStartKey(idbIds[-1])
+            response = {'Count': len(idbIds)}
+            if not count:
+                response['Items'] = [copy.deepcopy(items[idbId]) for idbId in idbIds]
+        if lastEvaluatedKey:
+            response['LastEvaluatedKey'] = lastEvaluatedKey
+        return response
+
+    def iteratePages(self, query, count=False, idbCertificate=None):
+        query = dict(query) if query else {}
+        while True:
+            response = self.queryPage(query, count)
+            yield response
+            if 'LastEvaluatedKey' not in response:
+                break
+            query['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def exportItems(self, totalSegments=None, scanOptions=None, queueSize=16):
+        with self.table['lock']:
+            accounts = list(self.table['items'].keys())
+        for accountName in accounts:
+            with self.table['lock']:
+                items = copy.deepcopy(list(self.table['items'].get(accountName, {}).values()))
+            if items:
+                yield self.formatExportItems(items)
+
+################################################################################
+#                                End of file                                   #
+################################################################################
@@ -28,10 +28,16 @@
 # Import(s)                                                                    #
 ################################################################################
 
-from .IdbankStorageFormat import IdbankStorageFormat, IdbankStorageType, IdbankStorageTags
+from .IdbankStorageFormat import IdbankStorageFormat, IdbankStorageType, IdbankStorageTags, IdbankStorageCompression
 from .IdbankStorageEngine import IdbankStorageEngine
 from .IdbankStorageBase import IdbankStorageBase
+from .IdbankStorageItems import IdbankStorageItems
+from .IdbankStorageResult import IdbankStorageResult
+from .IdbankStorageMetrics import IdbankStorageMetrics
+from .IdbankStorageRetry import IdbankStorageRetry, IdbankStorageRateLimiter
 from .AwsDynamoDb import AwsDynamoDb
+from .MemoryDb import MemoryDb
+from .IdbankStorage import IdbankStorage
 
 ################################################################################
 # Module                                                                       #
@@ -40,9 +46,17 @@ from .AwsDynamoDb import AwsDynamoDb
 all__ = ('IdbankStorageFormat',
          'IdbankStorageType',
          'IdbankStorageTags',
+         'IdbankStorageCompression',
          'IdbankStorageEngine',
          'IdbankStorageBase',
-         'AwsDynamoDb')
+         'IdbankStorageItems',
+         'IdbankStorageResult',
+         'IdbankStorageMetrics',
+         'IdbankStorageRetry',
+         'IdbankStorageRateLimiter',
+         'AwsDynamoDb',
+         'MemoryDb',
+         'IdbankStorage')
 
 ################################################################################
 #                                End of file                                   #
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+# * ********************************************************************* *
+# *                                                                       *
+# *   Identity Bank data driver                                           *
+# *   This file is part of idbank. This project may be found at:          *
+# *   https://github.com/IdentityBank/Python_idbank.                      *
+# *                                                                       *
+# *   Copyright (C) 2020 by Identity Bank. All Rights Reserved.           *
+# *   https://www.identitybank.eu - You belong to you                     *
+# *                                                                       *
+# *   This program is free software: you can redistribute it and/or       *
+# *   modify it under the terms of the GNU Affero General Public          *
+# *   License as published by the Free Software Foundation, either        *
+# *   version 3 of the License, or (at your option) any later version.    *
+# *                                                                       *
+# *   This program is distributed in the hope that it will be useful,     *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of      *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the        *
+# *   GNU Affero General Public License for more details.                 *
+# *                                                                       *
+# *   You should have received a copy of the GNU Affero General Public    *
+# *   License along with this program. If not, see                        *
+# *   https://www.gnu.org/licenses/.                                      *
+# *                                                                       *
+# * ********************************************************************* *
+
+################################################################################
+# Import(s)                                                                    #
+################################################################################
+
+import random
+import re
+import sqlite3
+
+import pytest
+from psycopg2 import sql
+
+from idbank import IdbSqlQueryBuilder
+
+
+################################################################################
+# Module                                                                       #
+################################################################################
+
+# The seek conditions are checked on SQLite, which has NULLS FIRST/LAST and IS NOT DISTINCT FROM like PostgreSQL
+
+def render(composable):
+    if isinstance(composable, sql.Composed):
+        return ''.join(render(part) for part in composable.seq)
+    if isinstance(composable, sql.SQL):
+        return composable.string
+    if isinstance(composable, sql.Identifier):
+        return '.'.join('"{}"'.format(string) for string in composable.strings)
+    if isinstance(composable, sql.Placeholder):
+        return ':{}'.format(composable.name)
+    raise TypeError(composable)
+
+
+def keysetQuery(orderBy, token=None, pageSize=7):
+    queryData = {
+        'PaginationConfig': {'Keyset': True, 'StartingToken': token},
+        'OrderByDataTypes': orderBy,
+        'dbTableCondition': sql.SQL(''),
+        'dbTableLimitValue': pageSize,
+    }
+    queryData = IdbSqlQueryBuilder.generateSqlKeysetPagination(queryData)
+    querySql = 'SELECT id, a, b FROM t {} {} LIMIT {}'.format(render(queryData['dbTableCondition']),
+                                                              render(queryData['dbTableOrder']), pageSize)
+    parameters = {key: value for key, value in queryData.items() if key.startswith('sqlKeysetIdb_')}
+    return querySql, parameters, queryData['dbTableKeyset']
+
+
+@pytest.fixture
+def database():
+    connection = sqlite3.connect(':memory:')
+    connection.execute('CREATE TABLE t (id INTEGER PRIMARY KEY, a INTEGER, b TEXT)')
+    generator = random.Random(5)
+    connection.executemany('INSERT INTO t VALUES (?, ?, ?)',
+                           [(id, generator.choice([None, 1, 2, 2, 3]), generator.choice([None, 'x', 'y']))
+                            for id in range(1, 80)])
+    yield connection
+    connection.close()
+
+
+@pytest.mark.parametrize('orderBy', [
+    {},
+    {'a': 'ASC'},
+    {'a': 'DESC'},
+    {'a': 'ASC', 'b': 'ASC'},
+    {'a': 'ASC', 'b': 'DESC'},
+    {'b': 'DESC', 'a': 'DESC'},
+    {'a': 'DESC', 'id': 'DESC'},
+])
+def testPagesCoverNullAndDuplicateKeys(database, orderBy):
+    columns = list(orderBy.keys()) + ([] if 'id' in orderBy else ['id'])
+    positions = {'id': 0, 'a': 1, 'b': 2}
+    querySql, parameters, keyset = keysetQuery(orderBy, pageSize=1000)
+    expected = database.execute(querySql, parameters).fetchall()
+    assert keyset['columns'] == len(columns)
+
+    rows = []
+    token = None
+    while True:
+        querySql, parameters, keyset = keysetQuery(orderBy, token)
+        page = database.execute(querySql, parameters).fetchall()
+        rows += page
+        if len(page) < keyset['limit']:
+            break
+        token = IdbSqlQueryBuilder.encodeKeysetToken([page[-1][positions[column]] for column in columns])
+    assert rows == expected
+    assert len(rows) == len(set(rows)) == 79
+
+
+def testNullsAreOrderedExplicitly():
+    querySql = keysetQuery({'a': 'ASC', 'b': 'DESC'})[0]
+    assert '"a" ASC NULLS LAST, "b" DESC NULLS FIRST, "id" DESC NULLS FIRST' in querySql
+
+
+def testConditionDoesNotDependOnTokenValues():
+    # The cached query is reused for every page, so NULL and non-NULL tokens must render the same condition
+    withNull = keysetQuery({'a': 'ASC'}, IdbSqlQueryBuilder.encodeKeysetToken([None, 4]))
+    withValue = keysetQuery({'a': 'ASC'}, IdbSqlQueryBuilder.encodeKeysetToken([2, 4]))
+    assert withNull[0] == withValue[0]
+    assert withNull[1] == {'sqlKeysetIdb_0': None, 'sqlKeysetIdb_1': 4}
+
+
+def testBadToken():
+    with pytest.raises(Exception, match='Bad pagination token'):
+        keysetQuery({'a': 'ASC'}, 'not a token')
+    with pytest.raises(Exception, match='Bad pagination token'):
+        keysetQuery({'a': 'ASC'}, IdbSqlQueryBuilder.encodeKeysetToken([1]))
+
+################################################################################
+#                                End of file                                   #
+################################################################################
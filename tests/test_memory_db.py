@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+# * ********************************************************************* *
+# *                                                                       *
+# *   Identity Bank data driver                                           *
+# *   This file is part of idbank. This project may be found at:          *
+# *   https://github.com/IdentityBank/Python_idbank.                      *
+# *                                                                       *
+# *   Copyright (C) 2020 by Identity Bank. All Rights Reserved.           *
+# *   https://www.identitybank.eu - You belong to you                     *
+# *                                                                       *
+# *   This program is free software: you can redistribute it and/or       *
+# *   modify it under the terms of the GNU Affero General Public          *
+# *   License as published by the Free Software Foundation, either        *
+# *   version 3 of the License, or (at your option) any later version.    *
+# *                                                                       *
+# *   This program is distributed in the hope that it will be useful,     *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of      *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the        *
+# *   GNU Affero General Public License for more details.                 *
+# *                                                                       *
+# *   You should have received a copy of the GNU Affero General Public    *
+# *   License along with this program. If not, see                        *
+# *   https://www.gnu.org/licenses/.                                      *
+# *                                                                       *
+# * ********************************************************************* *
+
+################################################################################
+# Import(s)                                                                    #
+################################################################################
+
+import json
+
+import pytest
+
+from idbank import MemoryDb
+
+
+################################################################################
+# Module                                                                       #
+################################################################################
+
+@pytest.fixture
+def db():
+    MemoryDb.dropTables()
+    db = MemoryDb({'table_name': 'tests'})
+    assert db.createAccount('account')
+    yield db
+    MemoryDb.dropTables()
+
+
+def readAllPages(db, query=None, pageSize=None):
+    items = []
+    pages = 0
+    startingToken = None
+    while True:
+        page = db.findItemsPage(query, pageSize, startingToken)
+        items += page['Items']
+        pages += 1
+        if 'NextToken' not in page:
+            return items, pages
+        startingToken = page['NextToken']
+
+
+class TestMemoryDbPaging:
+
+    def testPagesReturnEveryItemOnce(self, db):
+        db.putItems({'item{:02d}'.format(index): {'index': index} for index in range(25)})
+        items, pages = readAllPages(db, pageSize=4)
+        assert [list(item.keys())[0] for item in items] == ['item{:02d}'.format(index) for index in range(25)]
+        assert json.loads(items[3]['item03']) == {'index': 3}
+        assert pages == 7
+
+    def testReservedItemsAreNotReturned(self, db):
+        db.putItems({'a': {}, 'b': {}})
+        assert db.setAccountDictionary(1, b'dictionary').ok
+        items, pages = readAllPages(db, pageSize=1)
+        assert [list(item.keys())[0] for item in items] == ['a', 'b']
+        assert [item['account'] for page in db.exportAccountItems() for item in page] == ['account', 'account']
+
+    def testDefaultPageSize(self, db):
+        db.configuration['find_page_size'] = 3
+        db.putItems({str(index): {} for index in range(8)})
+        page = db.findItemsPage(None)
+        assert len(page['Items']) == 3
+        assert 'NextToken' in page
+        assert len(readAllPages(db)[0]) == 8
+
+    def testMixedIdTypes(self, db):
+        db.putItems({3: {}, 'b': {}, 10: {}, 'a': {}})
+        items, pages = readAllPages(db, pageSize=2)
+        assert [list(item.keys())[0] for item in items] == [3, 10, 'a', 'b']
+
+    def testProjectionOfIds(self, db):
+        db.putItems({'a': {}, 'b': {}})
+        assert db.findItemsPage({'ProjectionExpression': 'idbid'}, 10)['Items'] == ['a', 'b']
+
+    def testStreamedPagesAreLazy(self, db):
+        db.putItems({str(index): {} for index in range(6)})
+        summary = {}
+        pages = db.iterateFindItems(None, 4, None, summary)
+        assert len(next(pages)) == 4
+        assert list(pages) == []
+        assert 'NextToken' in summary
+
+    def testFilterExpressionIsNotSupported(self, db):
+        with pytest.raises(ValueError):
+            db.findItemsPage({'FilterExpression': '#idb# = :value'}, 10)
+
+    def testBadToken(self, db):
+        with pytest.raises(ValueError):
+            db.findItemsPage(None, 10, 'not a token')
+
+
+class TestMemoryDbCount:
+
+    def testCounts(self, db):
+        db.putItems({str(index): {} for index in range(5)})
+        assert db.setAccountDictionary(1, b'dictionary').ok
+        # metadata and dictionary items are stored in the account partition as well
+        assert db.countAllItems() == 7
+        assert db.countFindItems(None) == 5
+
+    def testCountsAfterDelete(self, db):
+        db.putItems({str(index): {} for index in range(5)})
+        result = db.deleteItems(['0', '1', 'missing', 'idbmetadata'], conditional=True)
+        assert result == {'Processed': 2, 'Unprocessed': ['idbmetadata'], 'NotFound': ['missing']}
+        assert db.countFindItems(None) == 3
+
+    def testAccountsAreSeparate(self, db):
+        db.putItems({'a': {}})
+        other = MemoryDb({'table_name': 'tests'})
+        assert other.createAccount('other')
+        assert other.countFindItems(None) == 0
+        assert other.findItemsPage(None, 10)['Items'] == []
+        assert db.countFindItems(None) == 1
+
+################################################################################
+#                                End of file                                   #
+################################################################################
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+# * ********************************************************************* *
+# *                                                                       *
+# *   Identity Bank data driver                                           *
+# *   This file is part of idbank. This project may be found at:          *
+# *   https://github.com/IdentityBank/Python_idbank.                      *
+# *                                                                       *
+# *   Copyright (C) 2020 by Identity Bank. All Rights Reserved.           *
+# *   https://www.identitybank.eu - You belong to you                     *
+# *                                                                       *
+# *   This program is free software: you can redistribute it and/or       *
+# *   modify it under the terms of the GNU Affero General Public          *
+# *   License as published by the Free Software Foundation, either        *
+# *   version 3 of the License, or (at your option) any later version.    *
+# *                                                                       *
+# *   This program is distributed in the hope that it will be useful,     *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of      *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the        *
+# *   GNU Affero General Public License for more details.                 *
+# *                                                                       *
+# *   You should have received a copy of the GNU Affero General Public    *
+# *   License along with this program. If not, see                        *
+# *   https://www.gnu.org/licenses/.                                      *
+# *                                                                       *
+# * ********************************************************************* *
+
+################################################################################
+# Import(s)                                                                    #
+################################################################################
+
+import json
+
+import pytest
+
+from idbank import IdbankStorageEngine, IdbankStorageFormat, IdbankStorageCompression
+
+
+################################################################################
+# Module                                                                       #
+################################################################################
+
+smallData = json.dumps({'name': 'Jane', 'city': 'Zürich'}, ensure_ascii=False)
+largeData = json.dumps({'name': 'Jane', 'notes': ['identity record'] * 200})
+
+
+def storageEngine(idbFormat, compression=None, threshold=None, dictionaryId=None):
+    return IdbankStorageEngine({
+        'idbFormat': idbFormat,
+        'idbCompression': compression,
+        'idbCompressionThreshold': threshold,
+        'idbDictionary': dictionaryId,
+    })
+
+
+class TestStorageFormatV1:
+
+    def testRoundTrip(self):
+        engine = storageEngine(IdbankStorageFormat.IDB_FORMAT_V1)
+        stored = engine.convert(smallData)
+        assert isinstance(stored, str)
+        assert stored.startswith('IDB_F.V1.')
+        assert engine.parse(stored) == smallData
+
+    def testCompressedRoundTrip(self):
+        engine = storageEngine(IdbankStorageFormat.IDB_FORMAT_V1, IdbankStorageCompression.IDB_COMPRESSION_GZIP, 0)
+        stored = engine.convert(largeData)
+        assert 'IDB_C.GZIP.' in stored
+        assert len(stored) < len(largeData)
+        assert storageEngine(IdbankStorageFormat.IDB_FORMAT_V1).parse(stored) == largeData
+
+    def testBelowThresholdIsNotCompressed(self):
+        engine = storageEngine(IdbankStorageFormat.IDB_FORMAT_V1, IdbankStorageCompression.IDB_COMPRESSION_GZIP)
+        assert 'IDB_C.GZIP.' not in engine.convert(smallData)
+
+    def testClearDataIsReturnedAsIs(self):
+        assert storageEngine(IdbankStorageFormat.IDB_FORMAT_V1).parse(smallData) == smallData
+
+
+class TestStorageFormatV2:
+
+    def testRoundTrip(self):
+        engine = storageEngine(IdbankStorageFormat.IDB_FORMAT_V2)
+        stored = engine.convert(smallData)
+        assert isinstance(stored, bytes)
+        assert stored.startswith(b'IDB')
+        assert engine.parse(stored) == smallData
+        assert engine.parse(memoryview(stored)) == smallData
+        assert bytes(engine.parseBytes(bytearray(stored))) == smallData.encode('utf-8')
+
+    @pytest.mark.parametrize('compression', [IdbankStorageCompression.IDB_COMPRESSION_GZIP,
+                                             IdbankStorageCompression.IDB_COMPRESSION_BZ2,
+                                             IdbankStorageCompression.IDB_COMPRESSION_ZSTD,
+                                             IdbankStorageCompression.IDB_COMPRESSION_LZ4])
+    def testCompressedRoundTrip(self, compression):
+        if not IdbankStorageCompression.available(compression):
+            pytest.skip('{} is not available'.format(compression))
+        stored = storageEngine(IdbankStorageFormat.IDB_FORMAT_V2, compression, 0).convert(largeData)
+        assert len(stored) < len(largeData)
+        assert storageEngine(IdbankStorageFormat.IDB_FORMAT_V2).parse(stored) == largeData
+
+    def testDictionaryRoundTrip(self):
+        if not IdbankStorageCompression.available(IdbankStorageCompression.IDB_COMPRESSION_ZSTD):
+            pytest.skip('ZSTD is not available')
+        samples = [json.dumps({'name': 'user{}'.format(index), 'city': 'city{}'.format(index % 7),
+                               'email': 'user{}@example.com'.format(index)}).encode('utf-8')
+                   for index in range(500)]
+        dictionaryId = IdbankStorageCompression.registerDictionary(
+            IdbankStorageCompression.trainDictionary(samples, 4096))
+        engine = storageEngine(IdbankStorageFormat.IDB_FORMAT_V2, dictionaryId=dictionaryId)
+        stored = engine.convert(samples[0].decode('utf-8'))
+        assert IdbankStorageEngine.dictionaryIds([stored]) == {dictionaryId}
+        assert storageEngine(IdbankStorageFormat.IDB_FORMAT_V2).parse(stored) == samples[0].decode('utf-8')
+
+
+class TestStorageFormatConversion:
+
+    def testV1ReadsV2AndV2ReadsV1(self):
+        v1 = storageEngine(IdbankStorageFormat.IDB_FORMAT_V1)
+        v2 = storageEngine(IdbankStorageFormat.IDB_FORMAT_V2)
+        assert v1.parse(v2.convert(smallData)) == smallData
+        assert v2.parse(v1.convert(smallData)) == smallData
+
+    @pytest.mark.parametrize('idbFormat', [IdbankStorageFormat.IDB_FORMAT_V1, IdbankStorageFormat.IDB_FORMAT_V2])
+    def testBatchRoundTrip(self, idbFormat):
+        engine = storageEngine(idbFormat, IdbankStorageCompression.IDB_COMPRESSION_GZIP, 0)
+        items = [smallData, largeData, '{}']
+        stored = engine.convertMany(items)
+        assert stored == [engine.convert(item) for item in items]
+        assert engine.parseMany(stored) == items
+
+    def testEmptyData(self):
+        for idbFormat in (IdbankStorageFormat.IDB_FORMAT_V1, IdbankStorageFormat.IDB_FORMAT_V2):
+            engine = storageEngine(idbFormat)
+            assert engine.convert('') is None
+            assert engine.parse(None) is None
+
+################################################################################
+#                                End of file                                   #
+################################################################################
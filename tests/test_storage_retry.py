@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+# * ********************************************************************* *
+# *                                                                       *
+# *   Identity Bank data driver                                           *
+# *   This file is part of idbank. This project may be found at:          *
+# *   https://github.com/IdentityBank/Python_idbank.                      *
+# *                                                                       *
+# *   Copyright (C) 2020 by Identity Bank. All Rights Reserved.           *
+# *   https://www.identitybank.eu - You belong to you                     *
+# *                                                                       *
+# *   This program is free software: you can redistribute it and/or       *
+# *   modify it under the terms of the GNU Affero General Public          *
+# *   License as published by the Free Software Foundation, either        *
+# *   version 3 of the License, or (at your option) any later version.    *
+# *                                                                       *
+# *   This program is distributed in the hope that it will be useful,     *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of      *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the        *
+# *   GNU Affero General Public License for more details.                 *
+# *                                                                       *
+# *   You should have received a copy of the GNU Affero General Public    *
+# *   License along with this program. If not, see                        *
+# *   https://www.gnu.org/licenses/.                                      *
+# *                                                                       *
+# * ********************************************************************* *
+
+################################################################################
+# Import(s)                                                                    #
+################################################################################
+
+import time
+
+import pytest
+from botocore.exceptions import ClientError, ConnectionClosedError
+
+from idbank import IdbankStorageRetry, IdbankStorageRateLimiter
+
+
+################################################################################
+# Module                                                                       #
+################################################################################
+
+def clientError(code):
+    return ClientError({'Error': {'Code': code, 'Message': code}}, 'Query')
+
+
+class Calls:
+    # Raises the given errors in order, then returns the response
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.count = 0
+
+    def __call__(self, **kwargs):
+        self.count += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return dict(kwargs, ok=True)
+
+
+class Limiter:
+
+    def __init__(self):
+        self.acquired = 0
+        self.throttledCount = 0
+        self.succeededCount = 0
+
+    def acquire(self):
+        self.acquired += 1
+
+    def throttled(self):
+        self.throttledCount += 1
+
+    def succeeded(self):
+        self.succeededCount += 1
+
+
+@pytest.fixture
+def retry():
+    retry = IdbankStorageRetry(attempts=3, backoff=0.01, backoffMax=0.05)
+    retry.sleep = lambda attempt: None
+    return retry
+
+
+class TestIdbankStorageRetry:
+
+    def testReturnsResponse(self, retry):
+        calls = Calls()
+        assert retry.call(calls, TableName='t') == {'TableName': 't', 'ok': True}
+        assert calls.count == 1
+
+    def testRetriesThrottlingAndReportsIt(self, retry):
+        calls = Calls(clientError('ProvisionedThroughputExceededException'), clientError('ThrottlingException'))
+        limiter = Limiter()
+        assert retry.call(calls, limiter)['ok']
+        assert calls.count == 3
+        assert limiter.acquired == 3
+        assert limiter.throttledCount == 2
+        assert limiter.succeededCount == 1
+
+    def testRaisesWhenAttemptsAreExhausted(self, retry):
+        calls = Calls(*[clientError('ThrottlingException')] * 5)
+        with pytest.raises(ClientError) as error:
+            retry.call(calls)
+        assert IdbankStorageRetry.isThrottlingError(error.value)
+        assert calls.count == retry.attempts + 1
+
+    def testServerErrorsAreRetriedWithoutThrottling(self, retry):
+        calls = Calls(clientError('InternalServerError'))
+        limiter = Limiter()
+        assert retry.call(calls, limiter)['ok']
+        assert limiter.throttledCount == 0
+
+    def testOtherErrorsAreNotRetried(self, retry):
+        calls = Calls(clientError('ConditionalCheckFailedException'))
+        with pytest.raises(ClientError):
+            retry.call(calls)
+        assert calls.count == 1
+
+    def testConnectionErrorsAreRetried(self, retry):
+        calls = Calls(ConnectionClosedError(endpoint_url='https://dynamodb'))
+        assert retry.call(calls)['ok']
+        assert calls.count == 2
+
+    def testNoAttempts(self):
+        calls = Calls(clientError('ThrottlingException'))
+        with pytest.raises(ClientError):
+            IdbankStorageRetry(attempts=0).call(calls)
+        assert calls.count == 1
+
+    def testDelayIsBounded(self):
+        retry = IdbankStorageRetry(attempts=8, backoff=0.05, backoffMax=0.2)
+        for attempt in range(1, 12):
+            assert 0 <= retry.delay(attempt) <= 0.2
+
+
+class TestIdbankStorageRateLimiter:
+
+    def testNotLimitedUntilThrottled(self):
+        limiter = IdbankStorageRateLimiter()
+        limiter.consume(1000)
+        started = time.monotonic()
+        limiter.acquire()
+        assert time.monotonic() - started < 0.1
+        assert limiter.stats()['rate'] is None
+
+    def testThrottlingCutsTheRate(self):
+        limiter = IdbankStorageRateLimiter(100.0, minRate=10.0)
+        limiter.throttled()
+        assert limiter.rate == 50.0
+        assert limiter.tokens <= 0
+        for _ in range(5):
+            limiter.throttled()
+        assert limiter.rate == 10.0
+
+    def testThrottlingWithoutLimitUsesTheObservedRate(self):
+        limiter = IdbankStorageRateLimiter(minRate=1.0)
+        limiter.observedRate = 40.0
+        limiter.throttled()
+        assert limiter.rate == 20.0
+
+    def testRecoversUpToTheConfiguredRate(self):
+        limiter = IdbankStorageRateLimiter(100.0)
+        limiter.adjustInterval = 0
+        limiter.throttled()
+        for _ in range(20):
+            limiter.succeeded()
+        assert limiter.rate == 100.0
+
+    def testRecoversToNotLimited(self):
+        limiter = IdbankStorageRateLimiter()
+        limiter.adjustInterval = 0
+        limiter.observedRate = 5.0
+        limiter.throttled()
+        for _ in range(20):
+            limiter.succeeded()
+        assert limiter.rate is None
+
+    def testAcquireWaitsWhileInDebt(self):
+        limiter = IdbankStorageRateLimiter(100.0)
+        limiter.consume(105.0)
+        started = time.monotonic()
+        limiter.acquire()
+        assert time.monotonic() - started >= 0.03
+        assert limiter.tokens > 0
+
+    def testLimitersAreSharedByKey(self):
+        limiter = IdbankStorageRateLimiter.getLimiter(('tests', 'table'), 10.0)
+        assert IdbankStorageRateLimiter.getLimiter(('tests', 'table')) is limiter
+        assert IdbankStorageRateLimiter.getLimiter(('tests', 'other')) is not limiter
+
+################################################################################
+#                                End of file                                   #
+################################################################################